@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Content-defined chunking speed of the gear hash, byte per byte in python and vectorized
+with numpy, written by blocks of --write-size bytes like the tar stream.
+
+    $ python benchmarks/bench_chunks.py --size 32
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import time
+
+from k8spackage.chunks import Chunker, numpy
+
+
+def bench(data, write_size, vectorized):
+    chunker = Chunker(vectorized=vectorized)
+    start = time.time()
+    sizes = []
+    for offset in range(0, len(data), write_size):
+        sizes.extend([len(chunk) for chunk in chunker.update(data[offset:offset + write_size])])
+    sizes.extend([len(chunk) for chunk in chunker.flush()])
+    return sizes, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=16, help="MiB of random data")
+    parser.add_argument("--write-size", type=int, default=10240)
+    args = parser.parse_args()
+    data = os.urandom(args.size * 1024 * 1024)
+
+    sizes, seconds = bench(data, args.write_size, False)
+    print("python: %d chunks, %.2fs, %.1f MB/s" % (len(sizes), seconds,
+                                                   len(data) / seconds / 1e6))
+    if numpy is None:
+        print("numpy:  not installed (pip install k8spackage[chunks])")
+        return
+    vectorized_sizes, seconds = bench(data, args.write_size, True)
+    assert vectorized_sizes == sizes, "the boundaries must not depend on the implementation"
+    print("numpy:  %d chunks, %.2fs, %.1f MB/s" % (len(sizes), seconds,
+                                                   len(data) / seconds / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Compare the compression codecs on the bundled k8spackage/crd/ samples:
+compressed size, ratio and pack/unpack speed.
+
+    $ python benchmarks/bench_codecs.py --rounds 50
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import os
+import time
+
+from k8spackage.compression import CODECS
+from k8spackage.exception import Unsupported
+from k8spackage.pack import K8spackagePackage, pack_kub
+
+CRD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "k8spackage",
+                       "crd")
+
+
+def raw_size(path):
+    return sum([os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(path) for f in files])
+
+
+def bench(codec, level, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        output = io.BytesIO()
+        pack_kub("crd", srcpath=".", fileobj=output, codec=codec, level=level)
+    pack_time = (time.time() - start) / rounds
+    blob = output.getvalue()
+
+    start = time.time()
+    for _ in range(rounds):
+        package = K8spackagePackage(blob, b64_encoded=False, codec=codec)
+    unpack_time = (time.time() - start) / rounds
+    assert package.files
+    return len(blob), pack_time, unpack_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--source-dir", default=CRD_DIR)
+    args = parser.parse_args()
+    size = raw_size(args.source_dir)
+    os.chdir(args.source_dir)
+    print("%d bytes of sources in %s" % (size, args.source_dir))
+    print("%-8s %6s %10s %7s %10s %10s" % ("codec", "level", "size", "ratio", "pack ms",
+                                         "unpack ms"))
+    for name, levels in [("gzip", [1, 6, 9]), ("zstd", [1, 3, 19]), ("xz", [0, 6, 9])]:
+        for level in levels:
+            try:
+                compressed, pack_time, unpack_time = bench(CODECS[name], level, args.rounds)
+            except Unsupported as exc:
+                print("%-8s %s" % (name, exc))
+                break
+            print("%-8s %6s %10d %7.2f %10.2f %10.2f" % (name, level, compressed,
+                                                         size / compressed, pack_time * 1000,
+                                                         unpack_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Compare pack.all_files against the previous per-file ignore matching.
+
+    $ python benchmarks/bench_ignore.py --files 20000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from k8spackage.pack import all_files, ignore
+
+HELMIGNORE = """
+# Common VCS dirs
+.git/
+.gitignore
+.bzr/
+.hg/
+.svn/
+# Common backup files
+*.swp
+*.bak
+*.tmp
+*~
+# Various IDEs
+.project
+.idea/
+*.tmproj
+node_modules/
+"""
+
+
+def make_tree(path, nfiles):
+    with open(os.path.join(path, ".helmignore"), "w") as f:
+        f.write(HELMIGNORE)
+    dirs = ["templates", "charts/dep/templates", "node_modules/pkg/lib", ".git/objects/ab"]
+    for d in dirs:
+        os.makedirs(os.path.join(path, d))
+    for i in range(nfiles):
+        d = dirs[i % len(dirs)]
+        ext = ".bak" if i % 7 == 0 else ".yaml"
+        with open(os.path.join(path, d, "file-%d%s" % (i, ext)), "w") as f:
+            f.write("x")
+
+
+def legacy_all_files(srcpath="."):
+    files = []
+    with open(os.path.join(srcpath, ".helmignore")) as f:
+        ignore_patterns_str = "\n".join(['.git/', f.read()])
+    for root, _, filenames in os.walk(srcpath):
+        for filename in filenames:
+            path = os.path.join(root, filename).replace("./", "")
+            if not ignore(ignore_patterns_str, path):
+                files.append(path)
+    return files
+
+
+def bench(name, func, path, nfiles):
+    start = time.time()
+    files = func(path)
+    elapsed = time.time() - start
+    print("%-10s %8d kept  %8.3fs  %10.0f files/s" % (name, len(files), elapsed,
+                                                      nfiles / elapsed))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000)
+    args = parser.parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        make_tree(tmpdir, args.files)
+        legacy = bench("legacy", legacy_all_files, tmpdir, args.files)
+        compiled = bench("compiled", all_files, tmpdir, args.files)
+        assert sorted(legacy) == sorted(compiled)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Packing time of synthetic source trees of increasing size with 1 to N compression threads.
+
+    $ python benchmarks/bench_parallel.py --sizes 8,64 --threads 1,4,16
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from k8spackage.exception import Unsupported
+from k8spackage.pack import DigestWriter, K8spackagePackage, pack_kub
+
+FILE_SIZE = 256 * 1024
+
+
+def make_tree(path, size_mb):
+    """ Text-like, compressible files: hashes of a counter """
+    os.makedirs(os.path.join(path, "templates"))
+    nfiles = size_mb * 1024 * 1024 // FILE_SIZE
+    for i in range(nfiles):
+        lines = []
+        for j in range(FILE_SIZE // 65):
+            lines.append(hashlib.sha256(("%d-%d" % (i, j % 997)).encode()).hexdigest())
+        with open(os.path.join(path, "templates", "file-%d.yaml" % i), "w") as f:
+            f.write("\n".join(lines))
+
+
+def bench(codec, threads):
+    start = time.time()
+    writer = DigestWriter()
+    pack_kub("bench", srcpath=".", fileobj=writer, codec=codec, threads=threads)
+    elapsed = time.time() - start
+    package = K8spackagePackage(writer.b64blob, lazy=True)
+    assert isinstance(package.tar, tarfile.TarFile) and package.tree()
+    return elapsed, writer.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="8,32", help="tree sizes in MiB")
+    parser.add_argument("--threads", default="1,2,4,%d" % (os.cpu_count() or 4))
+    parser.add_argument("--codecs", default="gzip,zstd")
+    args = parser.parse_args()
+    cwd = os.getcwd()
+    for size in [int(x) for x in args.sizes.split(",")]:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            make_tree(tmpdir, size)
+            os.chdir(tmpdir)
+            for codec in args.codecs.split(","):
+                base = None
+                for threads in [int(x) for x in args.threads.split(",")]:
+                    try:
+                        elapsed, compressed = bench(codec, threads)
+                    except Unsupported as exc:
+                        print("%-5s %s" % (codec, exc))
+                        break
+                    base = base or elapsed
+                    print("%4d MiB %-5s %3d threads %8.3fs  %6.1f MiB/s  x%.2f  %d bytes" % (
+                        size, codec, threads, elapsed, size / elapsed, base / elapsed,
+                        compressed))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
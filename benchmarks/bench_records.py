@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Memory and time of holding the Packages of a large helm index during an import: a rendered
+PackageCr per release (the previous import path) against a PackageRecord per release, and
+the PackageIndex entries as dicts against records. Content downloads are left out.
+
+    $ python benchmarks/bench_records.py --charts 1000 --versions 20
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import gc
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+from k8spackage.models import DescriptorCr, PackageCr
+from k8spackage.records import PackageRecord
+
+from bench_serialization import helm_index
+
+
+def content(release):
+    return {
+        'digest': release['digest'],
+        'size': 4096,
+        'format': "tar+gzip",
+        'source': {'urls': release['urls']}
+    }
+
+
+def rendered_packages(releases):
+    packages = []
+    for name, release in releases:
+        descriptor = DescriptorCr.from_chart(release).render()
+        package = PackageCr(name, release['version'], 'helm', descriptor=descriptor)
+        package.add_field('content', content(release))
+        packages.append(package.render())
+    return packages
+
+
+def package_records(releases):
+    created = str(datetime.datetime.utcnow())
+    records = []
+    for name, release in releases:
+        item = content(release)
+        records.append(PackageRecord(name, release['version'], 'helm', item['digest'],
+                                     item['size'], item['format'], item['source'], created,
+                                     chart=release))
+    return records
+
+
+def index_entries(packages):
+    return dict([(item['metadata']['name'], {
+        'packageName': item['spec']['packageName'],
+        'packageVersion': item['spec']['packageVersion'],
+        'mediaType': item['spec']['mediaType'],
+        'digest': item['spec']['content']['digest'],
+        'resourceVersion': "1",
+    }) for item in packages])
+
+
+def index_records(entries):
+    return dict([(name, PackageRecord.from_entry(name, entry)) for name, entry in entries.items()])
+
+
+def measure(func, *args):
+    """ (result, seconds, bytes still allocated by the result) """
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    start = time.time()
+    result = func(*args)
+    seconds = time.time() - start
+    size = None
+    if tracemalloc is not None:
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, seconds, size
+
+
+def report(label, seconds, size):
+    print("%-34s %8.3fs %10s" % (label, seconds,
+                                 "%.1fMiB" % (size / 1048576) if size is not None else "n/a"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--charts", type=int, default=1000)
+    parser.add_argument("--versions", type=int, default=20)
+    args = parser.parse_args()
+
+    index = helm_index(args.charts, args.versions)
+    releases = [(name, release)
+                for name, chart_releases in index['entries'].items()
+                for release in chart_releases]
+    DescriptorCr.crd_spec.defaults  # load the schemas outside of the measures
+    print("%d releases" % len(releases))
+
+    packages, seconds, size = measure(rendered_packages, releases)
+    report("PackageCr.render per release", seconds, size)
+    records, seconds, size = measure(package_records, releases)
+    report("PackageRecord per release", seconds, size)
+    _, seconds, _ = measure(lambda: [PackageCr.render_record(record) for record in records])
+    report("render_record of all the records", seconds, None)
+
+    entries = index_entries(packages)
+    del packages
+    _, seconds, size = measure(lambda: dict([(name, dict(entry))
+                                             for name, entry in entries.items()]))
+    report("PackageIndex entries as dicts", seconds, size)
+    _, seconds, size = measure(index_records, entries)
+    report("PackageIndex entries as records", seconds, size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Load and dump a large helm index.yaml with the pure python PyYAML classes and with the
+k8spackage.serialization layer (LibYAML, orjson when installed).
+By default the index is generated: --charts x --versions releases, like a public repository.
+
+    $ python benchmarks/bench_serialization.py --charts 300 --versions 30
+    $ python benchmarks/bench_serialization.py --index ~/stable/index.yaml
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import time
+
+import yaml
+
+from k8spackage import serialization
+
+
+def helm_index(charts, versions):
+    entries = {}
+    for chart in range(charts):
+        name = "chart-%d" % chart
+        entries[name] = [{
+            'apiVersion': "v1",
+            'appVersion': "%d.%d.0" % (version // 10, version % 10),
+            'created': "2018-0%d-1%dT10:3%d:00.123456789Z" % (version % 9 + 1, version % 10,
+                                                             version % 6),
+            'description': "A Helm chart for %s, deploys the application and its dependencies"
+                           % name,
+            'digest': "%064x" % (chart * 1000 + version),
+            'home': "https://github.com/example/%s" % name,
+            'icon': "https://example.com/icons/%s.png" % name,
+            'keywords': ["database", "storage", name],
+            'maintainers': [{'email': "maintainer@example.com", 'name': "maintainer"}],
+            'name': name,
+            'sources': ["https://github.com/example/%s" % name],
+            'urls': ["https://charts.example.com/%s-0.%d.0.tgz" % (name, version)],
+            'version': "0.%d.0" % version
+        } for version in range(versions)]
+    return {'apiVersion': "v1", 'entries': entries, 'generated': "2018-06-01T10:00:00Z"}
+
+
+def timed(func, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        result = func()
+    return result, (time.time() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--charts", type=int, default=200)
+    parser.add_argument("--versions", type=int, default=20)
+    parser.add_argument("--index", default=None, help="helm index.yaml to use instead")
+    args = parser.parse_args()
+
+    if args.index:
+        with open(args.index, 'r') as indexfile:
+            text = indexfile.read()
+    else:
+        text = serialization.dump_yaml(helm_index(args.charts, args.versions))
+    index, _ = timed(lambda: serialization.load_yaml(text), 1)
+    json_text = json.dumps(index)
+    print("index: %d bytes of yaml, %d releases, libyaml: %s, orjson: %s" %
+          (len(text), sum([len(releases) for releases in index['entries'].values()]),
+           serialization.libyaml(), serialization.orjson is not None))
+
+    print("%-12s %12s %12s %8s" % ("operation", "pyyaml/json", "k8spackage", "speedup"))
+    for operation, baseline, fast in [
+        ("yaml load", lambda: yaml.load(text, Loader=yaml.SafeLoader),
+         lambda: serialization.load_yaml(text)),
+        ("yaml dump", lambda: yaml.dump(index, Dumper=yaml.SafeDumper, default_flow_style=False),
+         lambda: serialization.dump_yaml(index)),
+        ("json load", lambda: json.loads(json_text), lambda: serialization.load_json(json_text)),
+        ("json dump", lambda: json.dumps(index, indent=2, separators=(',', ': ')),
+         lambda: serialization.dump_json(index, indent=2)),
+    ]:
+        _, baseline_time = timed(baseline, args.rounds)
+        _, fast_time = timed(fast, args.rounds)
+        print("%-12s %10.1fms %10.1fms %7.1fx" % (operation, baseline_time * 1000,
+                                                  fast_time * 1000, baseline_time / fast_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Wall time of short k8s-package invocations, each one in a new interpreter, and the
+k8spackage/third-party modules they import.
+
+    $ python benchmarks/bench_startup.py --rounds 20
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, "bin", "k8s-package")
+HEAVY_MODULES = ["k8spackage.models", "requests", "yaml", "pathspec", "tarfile"]
+
+COMMANDS = [
+    ["version", "--output", "json"],
+    ["--help"],
+    ["generate", "--help"],
+]
+
+# prints the heavy modules imported once the command has run
+PROBE = """
+import sys
+sys.argv = ['k8s-package'] + %r
+from k8spackage.commands.cli_pkg import cli
+try:
+    cli()
+except SystemExit:
+    pass
+sys.stderr.write(",".join([m for m in %r if m in sys.modules]))
+"""
+
+
+def env():
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join([ROOT, environ.get('PYTHONPATH', '')])
+    return environ
+
+
+def bench(args, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        subprocess.check_call([sys.executable, CLI] + args, env=env(), stdout=subprocess.PIPE)
+    return (time.time() - start) / rounds
+
+
+def imported(args):
+    proc = subprocess.Popen([sys.executable, "-c", PROBE % (args, HEAVY_MODULES)], env=env(),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    return err.decode('utf-8').strip().splitlines()[-1:] or [""]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.time()
+    for _ in range(args.rounds):
+        subprocess.check_call([sys.executable, "-c", "pass"])
+    baseline = (time.time() - start) / args.rounds
+    print("%-28s %8.1fms" % ("python -c pass", baseline * 1000))
+    for command in COMMANDS:
+        seconds = bench(command, args.rounds)
+        print("%-28s %8.1fms  imports: %s" % (" ".join(command), seconds * 1000,
+                                             imported(command)[0] or "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Validate a List of Package resources, like a --from-helm-index output, against the CRD
+openAPIV3Schema with the compiled validators.
+
+    $ python benchmarks/bench_validation.py --packages 20000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import time
+
+from k8spackage.exception import InvalidResource
+from k8spackage.models import PackageCr, validate_resources
+
+
+def package(index):
+    name = "chart-%d" % (index // 20)
+    version = "0.%d.0" % (index % 20)
+    return {
+        'apiVersion': "manifest.k8s.io/v1alpha1",
+        'kind': "Package",
+        'metadata': {
+            'name': "%s.%s" % (name, version),
+            'annotations': {},
+            'labels': {'mediaType': "helm", 'packageName': name}
+        },
+        'spec': {
+            'packageName': name,
+            'packageVersion': version,
+            'mediaType': "helm",
+            'appVersion': "1.%d" % (index % 20),
+            'description': "A Helm chart for %s" % name,
+            'keywords': ["database", name],
+            'maintainers': [{'name': "maintainer", 'email': "maintainer@example.com"}],
+            'sources': ["https://github.com/example/%s" % name],
+            'links': [],
+            'icon': "",
+            'appName': "",
+            'packageOrg': "",
+            'content': {
+                'digest': "%064x" % index,
+                'size': 4096 + index,
+                'format': "tar+gzip",
+                'source': {'urls': ["https://charts.example.com/%s-%s.tgz" % (name, version)]}
+            }
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--packages", type=int, default=20000)
+    args = parser.parse_args()
+
+    items = {'kind': "List", 'items': [package(i) for i in range(args.packages)]}
+    start = time.time()
+    PackageCr.crd_spec.validator  # compile once, outside of the loop
+    print("compile: %.1fms" % ((time.time() - start) * 1000))
+
+    start = time.time()
+    for _ in range(args.rounds):
+        validate_resources(items)
+    seconds = (time.time() - start) / args.rounds
+    print("valid:   %d packages in %.3fs, %.0f packages/s" % (args.packages, seconds,
+                                                            args.packages / seconds))
+
+    for i in range(0, args.packages, 100):
+        items['items'][i]['spec']['content']['size'] = str(i)
+    start = time.time()
+    try:
+        validate_resources(items)
+    except InvalidResource as exc:
+        print("invalid: %d errors collected in %.3fs" % (len(exc.payload['errors']),
+                                                         time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
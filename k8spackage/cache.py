@@ -0,0 +1,190 @@
+from __future__ import absolute_import, division, print_function
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from k8spackage.utils import mkdir_p
+
+logger = logging.getLogger('k8s_events')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".k8spackage", "cache", "blobs")
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024  # 1GiB
+# an eviction goes down to this share of max_size: a full cache isn't scanned on every put
+EVICT_RATIO = 0.9
+
+
+class BlobCache(object):
+    """
+    On-disk content-addressed store of package tarballs, keyed by their sha256.
+    Writes are atomic, reads are verified against the key, and the least recently
+    used blobs are evicted once the cache grows over 'max_size' bytes. The size is
+    scanned once, then kept as a running total; an eviction scans the directory again,
+    catching up with the blobs written by other processes.
+    """
+    # False: nothing is evicted and the size isn't tracked
+    evictable = True
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path or os.getenv("K8SPACKAGE_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_size is None:
+            max_size = int(os.getenv("K8SPACKAGE_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self.max_size = max_size
+        self.size = None  # bytes, unknown until the first commit
+        self._lock = threading.Lock()
+
+    def _blobpath(self, digest):
+        return os.path.join(self.path, "sha256", digest[0:2], digest)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return
+        with self._lock:
+            if self.size is not None and not os.path.basename(path).startswith(".tmp-"):
+                self.size -= size
+
+    def get(self, digest):
+        """ Returns the blob or None when it's missing or corrupted """
+        if not digest:
+            return None
+        path = self._blobpath(digest)
+        try:
+            with open(path, 'rb') as blobfile:
+                blob = blobfile.read()
+        except IOError as exc:
+            if exc.errno == errno.ENOENT:
+                return None
+            raise
+        if hashlib.sha256(blob).hexdigest() != digest:
+            logger.error("cache: corrupted blob %s, removing it" % digest)
+            self._remove(path)
+            return None
+        os.utime(path, None)  # mtime tracks the last access for the LRU
+        return blob
+
+    def open(self, digest):
+        """ Opened blob file or None, the caller has to verify the digest while reading it """
+        path = self._blobpath(digest)
+        try:
+            blobfile = open(path, 'rb')
+        except IOError as exc:
+            if exc.errno == errno.ENOENT:
+                return None
+            raise
+        os.utime(path, None)
+        return blobfile
+
+    def tmpfile(self):
+        """ (fileobj, path) to write a new blob before committing it """
+        mkdir_p(self.path)
+        fd, tmppath = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        return os.fdopen(fd, 'wb'), tmppath
+
+    def commit(self, tmppath, digest):
+        path = self._blobpath(digest)
+        mkdir_p(os.path.dirname(path))
+        size = os.path.getsize(tmppath)
+        with self._lock:
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.rename(tmppath, path)
+            if not self.evictable:
+                return digest
+            if self.size is None:
+                self.size = sum([entry[1] for entry in self.entries()])
+            else:
+                self.size += size - replaced
+            if self.size > self.max_size:
+                self._evict()
+        return digest
+
+    def discard(self, tmppath):
+        self._remove(tmppath)
+
+    def invalidate(self, digest):
+        """ Drop the blob of 'digest', found corrupted while streaming it """
+        logger.error("cache: corrupted blob %s, removing it" % digest)
+        self._remove(self._blobpath(digest))
+
+    def put(self, blob, digest=None):
+        if digest is None:
+            digest = hashlib.sha256(blob).hexdigest()
+        tmpfile, tmppath = self.tmpfile()
+        try:
+            with tmpfile:
+                tmpfile.write(blob)
+        except Exception:
+            self.discard(tmppath)
+            raise
+        return self.commit(tmppath, digest)
+
+    def put_file(self, fileobj, digest):
+        """ Copy the rest of 'fileobj', already verified against 'digest' """
+        tmpfile, tmppath = self.tmpfile()
+        try:
+            with tmpfile:
+                shutil.copyfileobj(fileobj, tmpfile, 64 * 1024)
+        except Exception:
+            self.discard(tmppath)
+            raise
+        return self.commit(tmppath, digest)
+
+    def __contains__(self, digest):
+        return bool(digest) and os.path.exists(self._blobpath(digest))
+
+    def entries(self):
+        """ [(mtime, size, path)] of the cached blobs """
+        entries = []
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        if self.evictable:
+            with self._lock:
+                self._evict()
+
+    def _evict(self):
+        """ Remove the least recently used blobs down to EVICT_RATIO * max_size """
+        entries = sorted(self.entries())
+        total = sum([size for _, size, _ in entries])
+        if total > self.max_size:
+            for _, size, path in entries:
+                if total <= self.max_size * EVICT_RATIO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError as exc:
+                    if exc.errno != errno.ENOENT:
+                        raise
+                total -= size
+        self.size = total
+
+
+_blob_cache = None
+
+
+def blob_cache():
+    """ Shared BlobCache, disabled with K8SPACKAGE_CACHE=false """
+    global _blob_cache
+    if os.getenv("K8SPACKAGE_CACHE", "true") == "false":
+        return None
+    if _blob_cache is None:
+        _blob_cache = BlobCache()
+    return _blob_cache
@@ -0,0 +1,335 @@
+from __future__ import absolute_import, division, print_function
+
+import base64
+import hashlib
+import os
+import subprocess
+
+import requests
+
+from k8spackage.cache import BlobCache
+from k8spackage.compression import GzipCodec, gzip_member
+from k8spackage.exception import InvalidDigest
+from k8spackage.kubeclient import get_backend
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_CHUNK_DIR = os.path.join(os.path.expanduser("~"), ".k8spackage", "chunks")
+
+# content-defined chunk sizes of the uncompressed tar stream. A compressed chunk, base64
+# encoded in a PackageChunk, has to stay well under the ~1.5MiB etcd object limit.
+MIN_CHUNK_SIZE = 64 * 1024
+AVG_CHUNK_BITS = 18  # ~256KiB
+MAX_CHUNK_SIZE = 768 * 1024
+# bytes hashed at once by the numpy chunker, a boundary is expected every 256KiB. Less
+# than VECTORIZED_MIN_SIZE new bytes (small writes) are hashed in python.
+HASH_BLOCK_SIZE = 64 * 1024
+VECTORIZED_MIN_SIZE = 4096
+_MASK64 = 0xffffffffffffffff
+# 'gear' table of the rolling hash, fixed so that chunk boundaries never change
+GEAR = [int(hashlib.sha256(("gear-%d" % i).encode('ascii')).hexdigest()[0:16], 16)
+        for i in range(256)]
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+
+class Chunker(object):
+    """
+    Content-defined chunking (gear rolling hash): boundaries depend on the content only, an
+    insertion in a file moves the next boundary but leaves the following chunks unchanged.
+    The hash is computed a buffer at a time with numpy when it's installed (k8spackage[chunks]),
+    byte per byte in python otherwise (~4MB/s, see benchmarks/bench_chunks.py), with the
+    same boundaries.
+    """
+
+    def __init__(self, min_size=MIN_CHUNK_SIZE, avg_bits=AVG_CHUNK_BITS, max_size=MAX_CHUNK_SIZE,
+                 vectorized=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        # the mask bits are the hash high bits, the ones that depend on the last 64 bytes
+        self.mask = ((1 << avg_bits) - 1) << (64 - avg_bits)
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        self._buffer = bytearray()
+        self._pos = 0
+        self._hash = 0
+
+    def _boundary(self, final=False):
+        """
+        Size of the next chunk in the buffer, None until there's enough data
+        final: no more data is coming, don't wait for VECTORIZED_MIN_SIZE bytes
+        """
+        end = min(len(self._buffer), self.max_size)
+        pos = max(self._pos, self.min_size)
+        if self.vectorized and end - pos >= VECTORIZED_MIN_SIZE:
+            boundary = self._scan_blocks(pos, end)
+        elif self.vectorized and not final and end < self.max_size:
+            return None  # small write: hashed with the next ones
+        else:
+            boundary = self._scan(pos, end)
+        if boundary is None and end == self.max_size:
+            return end
+        return boundary
+
+    def _scan(self, pos, end):
+        buf, h, mask, gear = self._buffer, self._hash, self.mask, GEAR
+        while pos < end:
+            h = ((h << 1) + gear[buf[pos]]) & _MASK64
+            pos += 1
+            if not h & mask:
+                return pos
+        self._pos, self._hash = pos, h
+        return None
+
+    def _scan_blocks(self, pos, end):
+        mask = numpy.uint64(self.mask)
+        while pos < end:
+            # h[i] = sum(GEAR[byte[i - k]] << k), k < 64: the hash of each position only depends
+            # on the 64 bytes before it, and is summed over windows of 1, 2, 4... 64 bytes
+            start = max(self.min_size, pos - 63)
+            stop = min(end, pos + HASH_BLOCK_SIZE)
+            h = GEAR_ARRAY[numpy.frombuffer(bytes(self._buffer[start:stop]), dtype=numpy.uint8)]
+            width = 1
+            while width < 64:
+                h[width:] += h[:-width] << numpy.uint64(width)
+                width *= 2
+            hits = numpy.flatnonzero((h[pos - start:] & mask) == 0)
+            if len(hits):
+                return pos + int(hits[0]) + 1
+            pos = stop
+            # where the byte per byte scan goes on from
+            self._pos, self._hash = pos, int(h[-1])
+        return None
+
+    def _chunks(self, final=False):
+        while True:
+            size = self._boundary(final)
+            if size is None:
+                break
+            chunk = bytes(self._buffer[0:size])
+            del self._buffer[0:size]
+            self._pos, self._hash = 0, 0
+            yield chunk
+
+    def update(self, data):
+        """ Yields the chunks completed by 'data' """
+        self._buffer.extend(data)
+        for chunk in self._chunks():
+            yield chunk
+
+    def flush(self):
+        """ Yields the chunks left in the buffer, the last one (maybe empty) ends the data """
+        for chunk in self._chunks(final=True):
+            yield chunk
+        chunk = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._pos, self._hash = 0, 0
+        yield chunk
+
+
+class ChunkedGzipWriter(object):
+    """
+    Write-only file object splitting the tar stream in content-defined chunks, each one
+    compressed as a gzip member and saved in 'store' under its sha256 (stored once).
+    The members are also written to 'fileobj': the concatenation is a regular tar.gz.
+    """
+
+    def __init__(self, fileobj, store, level=9, chunker=None):
+        self.fileobj = fileobj
+        self.store = store
+        self.level = level
+        self.chunker = chunker or Chunker()
+        self.chunks = []
+        self._written = 0
+
+    def _add_chunk(self, data):
+        member = gzip_member(data, self.level)
+        digest = hashlib.sha256(member).hexdigest()
+        self.store.put(digest, member)
+        self.chunks.append({'digest': digest, 'size': len(member)})
+        self.fileobj.write(member)
+
+    def write(self, data):
+        for chunk in self.chunker.update(data):
+            self._add_chunk(chunk)
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for chunk in self.chunker.flush():
+            if chunk or not self.chunks:
+                self._add_chunk(chunk)
+
+
+class ChunkedGzipCodec(GzipCodec):
+    """ gzip codec writing through a ChunkedGzipWriter, 'chunks' lists the written chunks """
+    tar_mode = None
+
+    def __init__(self, store, chunker=None):
+        self.store = store
+        self.chunker = chunker
+        self.chunks = []
+
+    def writer(self, fileobj, level=None, threads=1):
+        writer = ChunkedGzipWriter(fileobj, self.store, level if level is not None else 9,
+                                   self.chunker)
+        self.chunks = writer.chunks
+        return writer
+
+
+def _verify_chunk(digest, data):
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise InvalidDigest("chunk %s: invalid digest" % digest, {'expected': digest})
+    return data
+
+
+class _ChunkDir(BlobCache):
+    # chunks are shared by the packages referencing them, they're never evicted
+    evictable = False
+
+
+class LocalChunkStore(object):
+    """ Chunks in a local directory (K8SPACKAGE_CHUNK_DIR) """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("K8SPACKAGE_CHUNK_DIR", DEFAULT_CHUNK_DIR)
+        self._blobs = _ChunkDir(self.path, max_size=0)
+
+    def __contains__(self, digest):
+        return digest in self._blobs
+
+    def get(self, digest):
+        # BlobCache.get verifies the digest and drops corrupted files
+        data = self._blobs.get(digest)
+        if data is None:
+            raise KeyError(digest)
+        return data
+
+    def put(self, digest, data):
+        if digest not in self:
+            self._blobs.put(data, digest)
+
+
+class ClusterChunkStore(object):
+    """ Chunks as 'model' (PackageChunk) resources named after their digest """
+
+    def __init__(self, model, namespace='default', backend=None):
+        self.model = model
+        self.namespace = namespace
+        self.backend = backend or get_backend()
+        self._known = set()
+
+    @staticmethod
+    def chunk_name(digest):
+        return "sha256-%s" % digest
+
+    def _get(self, digest):
+        try:
+            return self.backend.get(self.model, self.chunk_name(digest), self.namespace)
+        except requests.exceptions.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code == 404:
+                return None
+            raise
+        except subprocess.CalledProcessError:
+            return None
+
+    def __contains__(self, digest):
+        if digest not in self._known and self._get(digest) is not None:
+            self._known.add(digest)
+        return digest in self._known
+
+    def get(self, digest):
+        chunk = self._get(digest)
+        if chunk is None:
+            raise KeyError(digest)
+        self._known.add(digest)
+        return _verify_chunk(digest, base64.b64decode(chunk['spec']['blob']))
+
+    def put(self, digest, data):
+        if digest in self:
+            return
+        chunk = self.model(self.chunk_name(digest))
+        chunk.add_field('digest', digest)
+        chunk.add_field('size', len(data))
+        chunk.add_field('blob', base64.b64encode(data).decode('ascii'))
+        self.backend.apply(self.model, chunk.render(), self.namespace)
+        self._known.add(digest)
+
+
+class ChunkReader(object):
+    """
+    Seekable read-only file object reassembling 'chunks' from 'store', one chunk in memory
+    at a time. Each chunk is verified against its digest when it's fetched.
+    """
+
+    def __init__(self, store, chunks):
+        self.store = store
+        self.chunks = chunks
+        self.offsets = []
+        offset = 0
+        for chunk in chunks:
+            self.offsets.append(offset)
+            offset += chunk['size']
+        self.size = offset
+        self.pos = 0
+        self._index = None
+        self._data = b""
+
+    def _load(self, index):
+        if index != self._index:
+            self._data = self.store.get(self.chunks[index]['digest'])
+            self._index = index
+        return self._data
+
+    def _chunk_index(self, pos):
+        # bisect on the chunk offsets
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.offsets[mid] <= pos:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        parts = []
+        while size > 0 and self.pos < self.size:
+            index = self._chunk_index(self.pos)
+            data = self._load(index)
+            start = self.pos - self.offsets[index]
+            part = data[start:start + size]
+            parts.append(part)
+            self.pos += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._data = b""
+        self._index = None
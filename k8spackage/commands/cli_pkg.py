@@ -1,25 +1,70 @@
 from __future__ import absolute_import, division, print_function
 
 import argparse
+import importlib
 import os
 
-from k8spackage.commands.generate import GenerateCmd
-from k8spackage.commands.extract import ExtractCmd
-from k8spackage.commands.helm import HelmCmd
-from k8spackage.commands.version import VersionCmd
-from k8spackage.commands.inspect import InspectCmd
-from k8spackage.commands.get import GetCmd
+# name: (module, class, help message). A command module, and the models/requests/yaml stack
+# behind it, is only imported when the command is the parsed subcommand.
+COMMANDS = [
+    ('helm', 'k8spackage.commands.helm', 'HelmCmd', "Deploy with Helm on Kubernetes"),
+    ('version', 'k8spackage.commands.version', 'VersionCmd', "show version"),
+    ('extract', 'k8spackage.commands.extract', 'ExtractCmd',
+     "Fetch and extract content of a Package"),
+    ('inspect', 'k8spackage.commands.inspect', 'InspectCmd', "Browse package files"),
+    ('generate', 'k8spackage.commands.generate', 'GenerateCmd', "Generate a package resource"),
+    ('get', 'k8spackage.commands.get', 'GetCmd', "Get and list packages"),
+    ('publish', 'k8spackage.commands.publish', 'PublishCmd',
+     "Create or update Packages in the cluster"),
+]
+
+
+class CommandParser(argparse.ArgumentParser):
+    """
+    Parser of a command whose arguments are added by 'lazy_setup(parser)' the first time it
+    parses, i.e. once argparse resolved the subcommand of the parsed arguments
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_setup = kwargs.pop('lazy_setup', None)
+        super(CommandParser, self).__init__(*args, **kwargs)
+
+    def _setup(self):
+        if self.lazy_setup is not None:
+            setup, self.lazy_setup = self.lazy_setup, None
+            setup(self)
+
+    def parse_known_args(self, args=None, namespace=None):
+        self._setup()
+        return super(CommandParser, self).parse_known_args(args, namespace)
+
+    def format_help(self):
+        self._setup()
+        return super(CommandParser, self).format_help()
+
+
+class LazyCommand(object):
+    """ Registers a command in the parser, its module is imported only if it's invoked """
+
+    def __init__(self, name, module, class_name, help_message):
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.help_message = help_message
+
+    def load(self):
+        return getattr(importlib.import_module(self.module), self.class_name)
+
+    def add_parser(self, subparsers, env=None):
+        """ 'subparsers' of a CommandParser: the command is loaded when its parser is used """
+        return subparsers.add_parser(self.name, help=self.help_message,
+                                     lazy_setup=lambda parser: self.load().setup_parser(parser,
+                                                                                        env))
 
 
 def all_commands():
-    return {
-        HelmCmd.name: HelmCmd,
-        VersionCmd.name: VersionCmd,
-        ExtractCmd.name: ExtractCmd,
-        InspectCmd.name: InspectCmd,
-        GenerateCmd.name: GenerateCmd,
-        GetCmd.name: GetCmd,
-    }
+    return dict([(name, LazyCommand(name, module, class_name, help_message))
+                 for name, module, class_name, help_message in COMMANDS])
 
 
 def set_cmd_env(env):
@@ -32,10 +77,10 @@ def set_cmd_env(env):
 def get_parser(commands, parser=None, subparsers=None, env=None):
     set_cmd_env(env)
     if parser is None:
-        parser = argparse.ArgumentParser()
+        parser = CommandParser()
 
     if subparsers is None:
-        subparsers = parser.add_subparsers(help='command help')
+        subparsers = parser.add_subparsers(help='command help', parser_class=CommandParser)
 
     for cls in commands.values():
         cls.add_parser(subparsers, env)
@@ -1,11 +1,16 @@
 from __future__ import absolute_import, division, print_function
 
 import argparse
-import json
 import os
 import subprocess
-import requests
-import yaml
+
+from k8spackage.exception import K8spackageException
+
+
+def _request_exception():
+    # evaluated only when a command fails: requests isn't imported by commands that don't use it
+    import requests
+    return requests.exceptions.RequestException
 
 
 class CommandBase(object):
@@ -28,7 +33,10 @@ class CommandBase(object):
         elif self.output == 'yaml':
             self._render_yaml()
         else:
-            print(self._render_console().decode())
+            console = self._render_console()
+            if isinstance(console, bytes) and not isinstance(console, str):
+                console = console.decode('utf-8')  # python 3
+            print(console)
 
     def render_error(self, payload):
         if self.output == 'json':
@@ -36,8 +44,8 @@ class CommandBase(object):
         elif self.output == 'yaml':
             self._render_yaml(payload)
         else:
-            raise argparse.ArgumentTypeError("\n" + yaml.safe_dump(
-                payload, default_flow_style=False, width=float("inf")))
+            from k8spackage.serialization import dump_yaml
+            raise argparse.ArgumentTypeError("\n" + dump_yaml(payload, width=float("inf")))
 
     @classmethod
     def call(cls, options, unknown=None, render=True):
@@ -51,7 +59,7 @@ class CommandBase(object):
     def exec_cmd(self, render=True):
         try:
             self._call()
-        except requests.exceptions.RequestException as exc:
+        except _request_exception() as exc:
             payload = {"message": str(exc)}
             if exc.response is not None:
                 content = None
@@ -66,6 +74,9 @@ class CommandBase(object):
             payload = {"message": str(exc.output)}
             self.render_error(payload)
             exit(exc.returncode)
+        except K8spackageException as exc:
+            self.render_error(exc.to_dict())
+            exit(2)
 
         if render:
             self.render()
@@ -73,6 +84,12 @@ class CommandBase(object):
     @classmethod
     def add_parser(cls, subparsers, env=None):
         parser = subparsers.add_parser(cls.name, help=cls.help_message)
+        cls.setup_parser(parser, env)
+        return parser
+
+    @classmethod
+    def setup_parser(cls, parser, env=None):
+        """ Add the command arguments to its (sub)parser """
         cls._add_arguments(parser)
         parser.set_defaults(func=cls.call, env=env, which_cmd=cls.name,
                             parse_unknown=cls.parse_unknown)
@@ -80,7 +97,8 @@ class CommandBase(object):
     def _render_json(self, value=None):
         if not value:
             value = self._render_dict()
-        print(json.dumps(value, indent=2, separators=(',', ': ')))
+        from k8spackage.serialization import dump_json
+        print(dump_json(value, indent=2))
 
     def _render_dict(self):
         raise NotImplementedError
@@ -91,7 +109,8 @@ class CommandBase(object):
     def _render_yaml(self, value=None):
         if not value:
             value = self._render_dict()
-        print(yaml.safe_dump(value, default_flow_style=False, width=float("inf")))
+        from k8spackage.serialization import dump_yaml
+        print(dump_yaml(value, width=float("inf")))
 
     def _call(self):
         raise NotImplementedError
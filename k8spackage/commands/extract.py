@@ -1,5 +1,5 @@
 from __future__ import absolute_import, division, print_function
-import yaml
+from k8spackage.serialization import load_file
 from k8spackage.commands.command_base import CommandBase
 from k8spackage.models import PackageCr
 
@@ -23,11 +23,9 @@ class ExtractCmd(CommandBase):
 
     def _call(self):
         if self.from_file:
-            with open(self.from_file, 'r') as fsource:
-                source = yaml.safe_load(fsource)
-            self.package = PackageCr.load(source)
+            self.package = PackageCr.load(load_file(self.from_file))
         elif self.digest:
-            self.package = PackageCr.find({'digest': self.digest[0:10]}, self.namespace)
+            self.package = PackageCr.find_digest(self.digest, self.namespace)
         else:
             self.package = PackageCr.get(self.resource, self.namespace)
 
@@ -1,7 +1,10 @@
 from __future__ import absolute_import, division, print_function
-import yaml
+import os
 from k8spackage.commands.command_base import CommandBase
+from k8spackage.compression import CODECS
+from k8spackage.exception import PackageNotFound
 from k8spackage.models import DescriptorCr, PackageCr
+from k8spackage.serialization import load_file, load_yaml
 from k8spackage.utils import mkdir_p
 
 
@@ -30,7 +33,35 @@ class GenerateCmd(CommandBase):
         cls._add_sub_arguments(package_cmd)
         package_cmd.add_argument("--version", default=None, help="Set/Update the packageVersion")
         package_cmd.add_argument("--tar-dir", default=None, help="top directory in the tarball")
+        package_cmd.add_argument("--reproducible", action="store_true", default=False,
+                                 help="same source-dir content, same tarball digest")
+        package_cmd.add_argument("--compression", default="gzip", choices=sorted(CODECS),
+                                 help="compression of the source-dir tarball")
+        package_cmd.add_argument("--compression-level", default=None, type=int,
+                                 help="compression level, codec default if not set")
+        package_cmd.add_argument("--compression-threads", default=1, type=int,
+                                 help="compress the source-dir tarball on several cores"
+                                 " (gzip and zstd, xz always uses one)")
+        package_cmd.add_argument("--chunked", action="store_true", default=False,
+                                 help="store the source-dir content as deduplicated chunks")
+        package_cmd.add_argument("--chunk-dir", default=None,
+                                 help="with --chunked, local chunk store instead of the cluster")
+        package_cmd.add_argument("--delta-from", default=None,
+                                 help="base Package file or content digest, store only the "
+                                 "source-dir files changed since this package")
+        package_cmd.add_argument("-n", "--namespace", default="default",
+                                 help="namespace of the PackageChunk resources (--chunked) "
+                                 "or of the --delta-from package")
         package_cmd.add_argument("--from-helm-index", default=None, help="Helm index")
+        package_cmd.add_argument("--workers", default=8, type=int,
+                                 help="concurrent downloads for --from-helm-index")
+        package_cmd.add_argument("--rate", default=None, type=float,
+                                 help="max requests per second and per host for --from-helm-index")
+        package_cmd.add_argument("--previous", default=None,
+                                 help="previous --from-helm-index output, "
+                                 "skip the releases already in it")
+        package_cmd.add_argument("--delta", action="store_true", default=False,
+                                 help="with --previous, output only the new or changed releases")
 
         content_group = package_cmd.add_mutually_exclusive_group()
         package_cmd.add_argument("--dest", default=".", help="File destination dir")
@@ -63,12 +94,14 @@ class GenerateCmd(CommandBase):
         version = options.version
 
         if options.from_helm_index:
+            previous = load_file(options.previous) if options.previous else None
             with open(options.from_helm_index, 'r') as ifile:
-                cmd.status = PackageCr.from_helm_index(yaml.load(ifile.read()), options.offline)
+                cmd.status = PackageCr.from_helm_index(load_yaml(ifile), options.offline,
+                                                       options.workers, options.rate, previous,
+                                                       options.delta)
                 return cmd.render()
         if options.from_file:
-            with open(options.from_file, 'r') as ifile:
-                descriptor = yaml.safe_load(ifile.read())
+            descriptor = load_file(options.from_file)
             if options.from_file in ["Chart.yaml", "Chart.yml"]:
                 descriptor = DescriptorCr.from_chart(descriptor).render()
                 name = descriptor['name']
@@ -77,8 +110,17 @@ class GenerateCmd(CommandBase):
         package = PackageCr(name, version, cmd.media_type, descriptor=descriptor)
         if cmd.organization:
             package.add_field('packageOrg', cmd.organization)
-        if options.source_dir:
-            package.add_blob(options.source_dir, options.tar_dir)
+        if options.source_dir and options.delta_from:
+            package.add_delta(cls._delta_base(options.delta_from, options.namespace),
+                              options.source_dir, options.tar_dir, options.compression,
+                              options.compression_level)
+        elif options.source_dir and options.chunked:
+            package.add_chunks(options.source_dir, options.tar_dir, options.compression_level,
+                               package.chunk_store(options.chunk_dir, options.namespace))
+        elif options.source_dir:
+            package.add_blob(options.source_dir, options.tar_dir, options.reproducible,
+                             options.compression, options.compression_level,
+                             options.compression_threads)
         if options.source_url:
             package.add_url(options.source_url, options.offline)
 
@@ -89,13 +131,22 @@ class GenerateCmd(CommandBase):
             cmd.status = package.render()
         cmd.render()
 
+    @staticmethod
+    def _delta_base(delta_from, namespace):
+        if os.path.isfile(delta_from):
+            return PackageCr.load(load_file(delta_from))
+        base = PackageCr.find_digest(delta_from, namespace)
+        if base is None:
+            raise PackageNotFound("base package %s not found" % delta_from,
+                                  {'digest': delta_from})
+        return base
+
     @classmethod
     def _gen_descriptor(cls, options, unknown=None):
         cmd = cls(options)
         if options.from_file:
             if options.from_file in ["Chart.yaml", "Chart.yml"]:
-                with open(options.from_file, 'r') as ifile:
-                    descriptor = DescriptorCr.from_chart(yaml.load(ifile.read()))
+                descriptor = DescriptorCr.from_chart(load_file(options.from_file))
         else:
             descriptor = DescriptorCr(cmd.name, cmd.media_type)
 
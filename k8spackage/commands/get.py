@@ -1,5 +1,4 @@
 from __future__ import absolute_import, division, print_function
-import yaml
 
 from k8spackage.commands.command_base import CommandBase
 from k8spackage.models import PackageCr
@@ -1,5 +1,5 @@
 from __future__ import absolute_import, division, print_function
-import yaml
+from k8spackage.serialization import load_file
 
 from k8spackage.commands.command_base import CommandBase
 from k8spackage.models import PackageCr
@@ -41,15 +41,13 @@ class InspectCmd(CommandBase):
 
     def _call(self):
         if self.from_file:
-            with open(self.from_file, 'r') as fsource:
-                source = yaml.safe_load(fsource)
-            package_cr = PackageCr.load(source)
+            package_cr = PackageCr.load(load_file(self.from_file))
         elif self.digest:
-            package_cr = PackageCr.find({'digest': self.digest[0:10]}, self.namespace)
+            package_cr = PackageCr.find_digest(self.digest, self.namespace)
         else:
             package_cr = PackageCr.get(self.resource, self.namespace)
 
-        self.package = package_cr.k8spackage_package
+        self.package = package_cr.load_content(lazy=True)
         if self.file:
             self.result = self.package.file(self.file)
         elif self.tree:
@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function
+from k8spackage.serialization import iter_resources
+
+from k8spackage.commands.command_base import CommandBase
+from k8spackage.models import PackageCr
+
+
+class PublishCmd(CommandBase):
+    name = 'publish'
+    help_message = "Create or update Packages in the cluster"
+
+    def __init__(self, options):
+        super(PublishCmd, self).__init__(options)
+        self.filename = options.filename
+        self.namespace = options.namespace
+        self.workers = options.workers
+        self.batch_size = options.batch_size
+        self.force = options.force
+        self.validate = options.validate
+        self.status = []
+
+    @classmethod
+    def _add_arguments(cls, parser):
+        cls._add_output_option(parser)
+        parser.add_argument("-f", "--filename", required=True,
+                            help="Package or List of Packages, e.g. a --from-helm-index output")
+        parser.add_argument("-n", "--namespace", default="default", help="kubernetes namespace")
+        parser.add_argument("--workers", default=8, type=int, help="concurrent requests")
+        parser.add_argument("--batch-size", default=100, type=int, help="objects per batch")
+        parser.add_argument("--force", action="store_true", default=False,
+                            help="apply the Packages even if their digest didn't change")
+        parser.add_argument("--no-validate", dest="validate", action="store_false", default=True,
+                            help="don't check the Packages against the CRD schema first")
+
+    def _call(self):
+        with open(self.filename, 'r') as fsource:
+            items = list(iter_resources(fsource))
+        self.status = PackageCr.publish(items, self.namespace, self.workers, self.batch_size,
+                                        self.force, self.validate)
+
+    def _render_dict(self):
+        return {"published": self.status}
+
+    def _render_console(self):
+        lines = []
+        for result in self.status:
+            line = "%s: %s (%ss)" % (result['name'], result['status'], result['seconds'])
+            if 'error' in result:
+                line += " %s" % result['error']
+            lines.append(line)
+        return "\n".join(lines)
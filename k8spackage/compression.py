@@ -0,0 +1,262 @@
+from __future__ import absolute_import, division, print_function
+
+import gzip
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from k8spackage.exception import Unsupported
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_CODEC = "gzip"
+PARALLEL_BLOCK_SIZE = 1024 * 1024
+
+
+def gzip_member(data, level=9):
+    """ 'data' as a complete gzip member, without filename nor timestamp """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    xfl = b"\x02" if level == 9 else (b"\x04" if level == 1 else b"\x00")
+    return b"".join([
+        b"\x1f\x8b\x08\x00\x00\x00\x00\x00", xfl, b"\xff",
+        compressor.compress(data), compressor.flush(),
+        struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    ])
+
+
+class ParallelGzipWriter(object):
+    """
+    Write-only file object compressing 'block_size' blocks on 'threads' threads.
+    Each block is a gzip member of its own: the concatenation is a regular multi-member
+    gzip stream that gzip/tarfile read as usual. zlib releases the GIL while compressing,
+    at most 2 * threads blocks are kept in memory.
+    """
+
+    def __init__(self, fileobj, level=9, threads=4, block_size=PARALLEL_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending = []
+        self._buffer = []
+        self._buffered = 0
+        self._written = 0
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(gzip_member, block, self.level))
+        while len(self._pending) > 2 * self.threads:
+            self.fileobj.write(self._pending.pop(0).result())
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._written += len(data)
+        if self._buffered >= self.block_size:
+            buf = b"".join(self._buffer)
+            offset = 0
+            while len(buf) - offset >= self.block_size:
+                self._submit(buf[offset:offset + self.block_size])
+                offset += self.block_size
+            self._buffer = [buf[offset:]]
+            self._buffered = len(buf) - offset
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._buffered or not self._pending:
+            self._submit(b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        for future in self._pending:
+            self.fileobj.write(future.result())
+        self._pending = []
+        self._executor.shutdown()
+
+
+class GzipStreamReader(object):
+    """
+    Sequential gzip decompression of a non-seekable stream. Unlike tarfile's "r|gz", it reads
+    all the members of multi-member streams (parallel and chunked tarballs). Like the gzip
+    module, it skips the zero padding following a member.
+    """
+
+    def __init__(self, fileobj, block_size=64 * 1024):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._unused = b""
+        self._buffer = b""
+        self._eof = False
+        self._member_end = False
+
+    def _fill(self):
+        data = self._unused or self.fileobj.read(self.block_size)
+        self._unused = b""
+        if not data:
+            self._eof = True
+            return
+        if self._member_end:
+            data = data.lstrip(b"\0")
+            if not data:
+                return  # padding, there may be more of it
+            self._member_end = False
+        self._buffer += self._decompressor.decompress(data)
+        if self._decompressor.unused_data:
+            # end of a member, the next one (or padding) starts in the unused data
+            self._unused = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self._member_end = True
+
+    def read(self, size=-1):
+        while (size is None or size < 0 or len(self._buffer) < size) and not self._eof:
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self._buffer = b""
+
+
+class Codec(object):
+    """
+    Compression of the package tarball.
+    'tar_mode' is the tarfile compression suffix ("gz" in "w:gz") when tarfile supports it.
+    """
+    name = None
+    format = None
+    extension = None
+    magic = None
+    tar_mode = None
+
+    def check(self):
+        return True
+
+    def tar_options(self, level):
+        return {}
+
+    def writer(self, fileobj, level=None, threads=1):
+        """
+        Write-only file object compressing to 'fileobj', close() it to flush the stream
+        threads: compress on several cores when the codec supports it
+        """
+        raise NotImplementedError
+
+    def reader(self, fileobj):
+        """ Read-only file object decompressing 'fileobj' sequentially """
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    format = "tar+gzip"
+    extension = ".tar.gz"
+    magic = b"\x1f\x8b"
+    tar_mode = "gz"
+
+    def tar_options(self, level):
+        return {'compresslevel': level if level is not None else 9}
+
+    def writer(self, fileobj, level=None, threads=1):
+        level = level if level is not None else 9
+        if threads > 1:
+            return ParallelGzipWriter(fileobj, level, threads)
+        # no filename nor timestamp in the header: the output only depends on the input
+        return gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, mtime=0,
+                             compresslevel=level)
+
+    def reader(self, fileobj):
+        return GzipStreamReader(fileobj)
+
+
+class XzCodec(Codec):
+    name = "xz"
+    format = "tar+xz"
+    extension = ".tar.xz"
+    magic = b"\xfd7zXZ\x00"
+    tar_mode = "xz"
+
+    def check(self):
+        if lzma is None:
+            raise Unsupported("xz compression requires the lzma module (backports.lzma)")
+        return True
+
+    def tar_options(self, level):
+        return {'preset': level}
+
+    def writer(self, fileobj, level=None, threads=1):
+        """ 'threads' is ignored: python's lzma has no multi-threaded xz encoder """
+        self.check()
+        return lzma.LZMAFile(fileobj, mode="wb", preset=level)
+
+    def reader(self, fileobj):
+        self.check()
+        return lzma.LZMAFile(fileobj, mode="rb")
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    format = "tar+zstd"
+    extension = ".tar.zst"
+    magic = b"\x28\xb5\x2f\xfd"
+
+    def check(self):
+        if zstandard is None:
+            raise Unsupported("zstd compression requires the 'zstandard' package")
+        return True
+
+    def writer(self, fileobj, level=None, threads=1):
+        self.check()
+        # zstd multi-threading still produces a single standard frame
+        compressor = zstandard.ZstdCompressor(level=level if level is not None else 3,
+                                              threads=threads if threads > 1 else 0)
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def reader(self, fileobj):
+        self.check()
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+CODECS = dict([(codec.name, codec) for codec in [GzipCodec(), XzCodec(), ZstdCodec()]])
+FORMATS = dict([(codec.format, codec) for codec in CODECS.values()])
+
+
+def get_codec(name=None):
+    """ Codec by name ('gzip') or content format ('tar+gzip'), gzip by default """
+    if isinstance(name, Codec):
+        return name
+    if name is None:
+        name = DEFAULT_CODEC
+    codec = CODECS.get(name) or FORMATS.get(name)
+    if codec is None:
+        raise Unsupported("unknown compression '%s', use one of %s" % (name, sorted(CODECS)))
+    return codec
+
+
+def detect_codec(header):
+    """ Codec matching the first bytes of a compressed tarball """
+    for codec in CODECS.values():
+        if header.startswith(codec.magic):
+            return codec
+    raise Unsupported("unknown compression format")
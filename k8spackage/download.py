@@ -0,0 +1,205 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+from k8spackage.exception import InvalidDigest, Unsupported
+
+logger = logging.getLogger('k8s_events')
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+MIN_RANGE_SIZE = 8 * 1024 * 1024
+# interruptions of a transfer before giving up, even if each attempt makes progress
+MAX_RESUMES = 100
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+# interrupted transfers, resumed from where they stopped
+TRANSFER_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                   requests.exceptions.Timeout, urllib3.exceptions.HTTPError)
+
+
+def download_ranges():
+    """ K8SPACKAGE_DOWNLOAD_RANGES concurrent range requests for large objects, 1 by default """
+    return int(os.getenv("K8SPACKAGE_DOWNLOAD_RANGES", 1))
+
+
+class IncrementalDigest(object):
+    """ sha256 and size of a content written in order, reset when the content restarts """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+class Download(object):
+    """ Downloaded content: rewound 'fileobj', its sha256 'digest' and 'size' """
+
+    def __init__(self, fileobj, digest, size, url=None):
+        self.fileobj = fileobj
+        self.digest = digest
+        self.size = size
+        self.url = url
+        self.codec = None
+
+    def close(self):
+        self.fileobj.close()
+
+
+class RangeDownloader(object):
+    """
+    Stream a url to a file in 'chunk_size' blocks, computing its sha256 and size on the way.
+    An interrupted transfer is resumed with a HTTP Range request, up to 'retries' times in a
+    row without progress and 'max_resumes' times in all. Objects larger than 'min_range_size'
+    are fetched with 'ranges' concurrent range requests when the server accepts them.
+    """
+
+    def __init__(self, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE, retries=5,
+                 backoff_factor=0.5, ranges=1, min_range_size=MIN_RANGE_SIZE, timeout=60,
+                 max_resumes=MAX_RESUMES):
+        self.session = session or requests
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.max_resumes = max_resumes
+        self.backoff_factor = backoff_factor
+        self.ranges = ranges
+        self.min_range_size = min_range_size
+        self.timeout = timeout
+
+    def download(self, url, fileobj=None, digest=None):
+        """ Download 'url' to 'fileobj' (a new temporary file by default), verified if 'digest' """
+        if fileobj is None:
+            fileobj = tempfile.TemporaryFile()
+        size = self._ranged_size(url) if self.ranges > 1 else None
+        digester = IncrementalDigest()
+        try:
+            if size is not None:
+                try:
+                    self._download_ranges(url, fileobj, size)
+                except Unsupported as exc:
+                    logger.warning("%s, downloading it in one stream" % exc)
+                    fileobj.seek(0)
+                    fileobj.truncate()
+                    size = None
+            if size is not None:
+                # the ranges complete out of order, hash the file once it's complete
+                fileobj.seek(0)
+                for data in iter(lambda: fileobj.read(self.chunk_size), b""):
+                    digester.update(data)
+            else:
+                self._fetch_range(url, fileobj, threading.Lock(), 0, None, digester)
+        except Exception:
+            fileobj.close()
+            raise
+        fileobj.seek(0)
+        result = Download(fileobj, digester.hexdigest(), digester.size, url)
+        if digest and result.digest != digest:
+            result.close()
+            raise InvalidDigest("%s: content digest %s != %s" % (url, result.digest, digest),
+                                {'expected': digest, 'digest': result.digest, 'url': url})
+        return result
+
+    def _ranged_size(self, url):
+        """ Content size when it's worth and possible to split the download, None otherwise """
+        try:
+            resp = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            resp.raise_for_status()
+            size = int(resp.headers.get('Content-Length', 0))
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        if resp.headers.get('Accept-Ranges') != 'bytes' or size < self.min_range_size:
+            return None
+        return size
+
+    def _download_ranges(self, url, fileobj, size):
+        part = -(-size // self.ranges)  # ceil
+        lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=self.ranges)
+        futures = [executor.submit(self._fetch_range, url, fileobj, lock, start,
+                                   min(start + part, size) - 1)
+                   for start in range(0, size, part)]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+
+    def _fetch_range(self, url, fileobj, lock, start, end=None, digester=None):
+        """
+        Write the bytes start-end (to the end of the content if None) at their offset
+        digester: IncrementalDigest of the content, reset if the server doesn't resume it
+        """
+        offset = start
+        # furthest offset written: a transfer restarted from the beginning isn't progress
+        reached = start
+        failures = 0
+        resumes = 0
+        while True:
+            headers = {}
+            if offset > 0 or end is not None:
+                headers['Range'] = "bytes=%d-%s" % (offset, end if end is not None else "")
+            expected = None
+            try:
+                resp = self.session.get(url, stream=True, headers=headers, timeout=self.timeout)
+                resp.raise_for_status()
+                if headers and resp.status_code != 206:
+                    if end is not None or digester is None:
+                        raise Unsupported("%s: range requests are not supported" % url)
+                    # full content again: start over
+                    logger.warning("%s: resume not supported, restarting" % url)
+                    offset = start
+                    fileobj.seek(0)
+                    fileobj.truncate()
+                    digester.reset()
+                expected = self._expected_end(resp, offset)
+                for data in resp.raw.stream(self.chunk_size, decode_content=False):
+                    with lock:
+                        fileobj.seek(offset)
+                        fileobj.write(data)
+                    if digester is not None:
+                        digester.update(data)
+                    offset += len(data)
+                if expected is None or offset >= expected:
+                    return offset
+                logger.warning("%s: transfer stopped at %d/%d bytes" % (url, offset, expected))
+            except TRANSFER_ERRORS as exc:
+                logger.warning("%s: transfer interrupted at %d bytes: %s" % (url, offset, exc))
+            if offset > reached:
+                reached = offset
+                failures = 0
+            else:
+                failures += 1
+            resumes += 1
+            if failures > self.retries or resumes > self.max_resumes:
+                raise requests.exceptions.ConnectionError("%s: too many failures at %d bytes" %
+                                                          (url, offset))
+            time.sleep(self.backoff_factor * (2 ** failures) if failures else 0)
+
+    @staticmethod
+    def _expected_end(resp, offset):
+        """ Offset following the last byte of the response, None if unknown """
+        match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+        if match:
+            return int(match.group(2)) + 1
+        length = resp.headers.get('Content-Length')
+        if length is not None:
+            return offset + int(length)
+        return None
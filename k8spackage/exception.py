@@ -87,6 +87,21 @@ class PackageVersionNotFound(K8spackageException):
     errorcode = "package-version-not-found"
 
 
+class InvalidDigest(K8spackageException):
+    status_code = 422
+    errorcode = "invalid-digest"
+
+
+class MirrorsUnavailable(K8spackageException):
+    status_code = 502
+    errorcode = "mirrors-unavailable"
+
+
+class InvalidResource(K8spackageException):
+    status_code = 422
+    errorcode = "invalid-resource"
+
+
 def raise_package_not_found(package, release=None, media_type=None):
     raise PackageNotFound("package %s doesn't exist, v: %s, type: %s" % (package, str(release),
                                                                          str(media_type)),
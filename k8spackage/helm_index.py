@@ -0,0 +1,175 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+import tarfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from k8spackage.exception import InvalidDigest, InvalidResource, MirrorsUnavailable, Unsupported
+from k8spackage.records import PackageRecord
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+logger = logging.getLogger('k8s_events')
+
+RETRY_STATUS = [429, 500, 502, 503, 504]
+# failures of a single release: it's missed, the import goes on
+RELEASE_ERRORS = (requests.exceptions.RequestException, urllib3.exceptions.HTTPError,
+                  MirrorsUnavailable, InvalidResource, InvalidDigest, Unsupported,
+                  tarfile.TarError, zlib.error, EOFError, EnvironmentError)
+
+
+def pooled_session(pool_size=10, retries=3, backoff_factor=0.5, rate=None):
+    """
+    requests.Session keeping alive up to 'pool_size' connections per host
+    rate: max requests per second and per host, see RateLimitedSession
+    """
+    session = RateLimitedSession(HostRateLimiter(rate)) if rate else requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostRateLimiter(object):
+    """ Space out the requests sent to a same host to at most 'rate' per second """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    requests.Session spacing out the requests sent to each host: the limit applies to the
+    host actually requested, e.g. the mirror a download fails over to
+    """
+
+    def __init__(self, rate_limiter):
+        super(RateLimitedSession, self).__init__()
+        self.rate_limiter = rate_limiter
+
+    def request(self, method, url, *args, **kwargs):
+        self.rate_limiter.wait(url)
+        return super(RateLimitedSession, self).request(method, url, *args, **kwargs)
+
+
+class HelmIndexImporter(object):
+    """
+    Download and convert the releases of a helm index.yaml concurrently.
+    PackageRecords are returned in the index order whatever the order the downloads complete.
+    """
+
+    def __init__(self, package_class, offline=False, workers=8, rate=None, retries=3,
+                 backoff_factor=0.5, session=None):
+        self.package_class = package_class
+        self.offline = offline
+        self.workers = workers
+        if session is None:
+            session = pooled_session(workers, retries, backoff_factor, rate)
+        self.session = session
+        self.missed = []
+        self.stats = {}
+
+    @staticmethod
+    def releases(index):
+        for name, releases in index['entries'].items():
+            for release in releases:
+                yield name, release
+
+    def _import_release(self, name, release):
+        return self.package_class.record_from_helm_release(name, release, self.offline,
+                                                           self.session)
+
+    @staticmethod
+    def previous_packages(previous):
+        """ {(packageName, packageVersion): PackageRecord} of a previous from_helm_index output """
+        packages = {}
+        if previous:
+            for item in previous.get('items', []):
+                record = PackageRecord.from_resource(item, keep=True)
+                packages[record.key] = record
+        return packages
+
+    @staticmethod
+    def is_imported(previous_record, release):
+        return previous_record is not None and previous_record.digest == release.get('digest')
+
+    def import_index(self, index, previous=None, delta=False):
+        """
+        previous: output of a previous import, releases with the same
+                  (name, version, digest) are kept as is instead of being downloaded again
+        delta: return only the new or changed releases instead of the merged list
+        """
+        start = time.time()
+        known = self.previous_packages(previous)
+        releases = list(self.releases(index))
+        packages = []
+        imported = 0
+        size = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+            for name, release in releases:
+                if self.is_imported(known.get((name, release['version'])), release):
+                    futures.append(None)
+                else:
+                    futures.append(executor.submit(self._import_release, name, release))
+
+            for (name, release), future in zip(releases, futures):
+                previous_record = known.get((name, release['version']))
+                if future is None:
+                    if not delta:
+                        packages.append(previous_record)
+                    continue
+                try:
+                    record = future.result()
+                except RELEASE_ERRORS as e:
+                    logger.error("%s.%s: %s" % (name, release['version'], e))
+                    self.missed.append((name, release['version']))
+                    if previous_record is not None and not delta:
+                        packages.append(previous_record)
+                    continue
+                packages.append(record)
+                imported += 1
+                size += record.size
+
+        elapsed = max(time.time() - start, 1e-6)
+        self.stats = {
+            'packages': imported,
+            'skipped': futures.count(None),
+            'missed': len(self.missed),
+            'bytes': size,
+            'seconds': elapsed,
+            'packages_per_sec': imported / elapsed,
+            'bytes_per_sec': size / elapsed
+        }
+        logger.info("imported %(packages)d packages (%(bytes)d bytes) in %(seconds).2fs: "
+                    "%(packages_per_sec).2f packages/s, %(bytes_per_sec).0f bytes/s, "
+                    "%(skipped)d already imported" % self.stats)
+        if self.missed:
+            logger.warning("missed %d releases: %s" % (len(self.missed), ", ".join(
+                ["%s.%s" % (name, version) for name, version in self.missed])))
+        return packages
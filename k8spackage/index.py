@@ -0,0 +1,184 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+import requests
+
+from k8spackage.exception import InvalidParams, Unsupported
+from k8spackage.informer import WatchExpired
+from k8spackage.kubeclient import get_backend
+from k8spackage.records import PackageRecord
+from k8spackage.serialization import load_json, dump_json
+from k8spackage.utils import mkdir_p
+
+logger = logging.getLogger('k8s_events')
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".k8spackage", "cache", "index")
+DEFAULT_INDEX_TTL = 60
+DEFAULT_INDEX_WATCH_TIMEOUT = 1
+
+
+class PackageIndex(object):
+    """
+    Local index of the Packages metadata of a namespace: name, packageName, version,
+    mediaType and full digest, one PackageRecord per Package. It's persisted on disk with the
+    resourceVersion it's up to date with, and refreshed when older than 'ttl' seconds:
+     - api backend: a watch from that resourceVersion replays the changes since, then
+       ends after 'watch_timeout' seconds, the latency of a refresh
+     - the first time, when the resourceVersion expired (410 Gone) or with kubectl, which
+       can't watch: the Packages metadata are listed in full
+    It serves one-shot commands, a long-running process keeps an Informer instead.
+    """
+
+    def __init__(self, model, namespace='default', path=None, ttl=None, watch_timeout=None):
+        self.model = model
+        self.namespace = namespace
+        if ttl is None:
+            ttl = int(os.getenv("K8SPACKAGE_INDEX_TTL", DEFAULT_INDEX_TTL))
+        self.ttl = ttl
+        if watch_timeout is None:
+            watch_timeout = int(os.getenv("K8SPACKAGE_INDEX_WATCH_TIMEOUT",
+                                          DEFAULT_INDEX_WATCH_TIMEOUT))
+        self.watch_timeout = watch_timeout
+        self.backend = get_backend()
+        if path is None:
+            cluster = hashlib.sha256(self.backend.cluster.encode('utf-8')).hexdigest()[0:16]
+            path = os.path.join(os.getenv("K8SPACKAGE_INDEX_DIR", DEFAULT_INDEX_DIR), cluster,
+                                "%s.%s.json" % (namespace, model.crd_plural))
+        self.path = path
+        self.updated = 0
+        self.resource_version = None
+        self.packages = {}
+        # refreshed by this process: doing it again wouldn't tell anything new
+        self.refreshed = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as indexfile:
+                index = load_json(indexfile.read())
+            self.updated = index['updated']
+            self.resource_version = index.get('resourceVersion')
+            self.packages = dict([(name, PackageRecord.from_entry(name, entry))
+                                  for name, entry in index['packages'].items()])
+        except (ValueError, KeyError) as exc:
+            logger.error("index: ignoring unreadable %s: %s" % (self.path, exc))
+
+    def save(self):
+        mkdir_p(os.path.dirname(self.path))
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".tmp-")
+        with os.fdopen(fd, 'w') as tmpfile:
+            packages = dict([(name, record.to_entry()) for name, record in self.packages.items()])
+            tmpfile.write(dump_json({'updated': self.updated,
+                                     'resourceVersion': self.resource_version,
+                                     'packages': packages}))
+        os.rename(tmppath, self.path)
+
+    @property
+    def stale(self):
+        return time.time() - self.updated > self.ttl
+
+    def _updated(self):
+        self.updated = time.time()
+        self.refreshed = True
+        self.save()
+
+    def refresh(self, force=False):
+        """
+        Bring the index up to date if it's older than 'ttl' (or 'force'): the changes since
+        the stored resourceVersion, a full relist when they can't be watched
+        """
+        if not force and not self.stale:
+            return
+        if self.resource_version:
+            try:
+                return self.watch_changes()
+            except Unsupported:
+                pass
+            except WatchExpired as exc:
+                logger.debug("index: %s, listing again" % exc)
+        self.relist()
+
+    def watch_changes(self):
+        """ Apply the changes since the stored resourceVersion, WatchExpired if it's too old """
+        changed = 0
+        try:
+            for event in self.backend.watch(self.model, self.namespace, self.resource_version,
+                                            timeout_seconds=self.watch_timeout):
+                obj = event['object']
+                if event['type'] == 'ERROR':
+                    if obj.get('code') == 410:
+                        raise WatchExpired(obj.get('message'))
+                    raise requests.exceptions.RequestException(obj.get('message'))
+                name = obj['metadata'].get('name')
+                if event['type'] in ('ADDED', 'MODIFIED'):
+                    self.packages[name] = PackageRecord.from_resource(obj)
+                    changed += 1
+                elif event['type'] == 'DELETED':
+                    self.packages.pop(name, None)
+                    changed += 1
+                self.resource_version = obj['metadata'].get('resourceVersion',
+                                                            self.resource_version)
+        except requests.exceptions.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code == 410:
+                raise WatchExpired(str(exc))
+            raise
+        logger.debug("index: %d packages, %d changes up to %s" %
+                     (len(self.packages), changed, self.resource_version))
+        self._updated()
+
+    def relist(self):
+        """ List all the Packages metadata, keeping the entries of an unchanged resourceVersion """
+        packages = {}
+        changed = 0
+        token = None
+        while True:
+            page = self.backend.list_page(self.model, self.namespace, limit=500, token=token,
+                                          metadata_only=True)
+            for item in page['items']:
+                name = item['metadata']['name']
+                version = item['metadata'].get('resourceVersion')
+                previous = self.packages.get(name)
+                if version and previous and previous.resource_version == version:
+                    packages[name] = previous
+                else:
+                    packages[name] = PackageRecord.from_resource(item)
+                    changed += 1
+            token = page['metadata'].get('continue')
+            if not token:
+                break
+        logger.debug("index: %d packages, %d updated, %d removed" % (
+            len(packages), changed, len(set(self.packages) - set(packages))))
+        self.packages = packages
+        self.resource_version = page['metadata'].get('resourceVersion')
+        self._updated()
+
+    def find_digest(self, digest):
+        """ Name of the package whose full digest starts with 'digest' """
+        self.refresh()
+        names = sorted([name for name, record in self.packages.items()
+                        if record.digest and record.digest.startswith(digest)])
+        if len(set([self.packages[name].digest for name in names])) > 1:
+            raise InvalidParams("digest '%s' is ambiguous: %s" % (digest, ", ".join(names)),
+                                {'digest': digest, 'packages': names})
+        if names:
+            return names[0]
+        return None
+
+    def find(self, package_name=None, version=None, media_type=None):
+        """ Names of the packages matching all the given fields """
+        self.refresh()
+        query = [(attr, value)
+                 for attr, value in [('package_name', package_name), ('version', version),
+                                     ('media_type', media_type)] if value is not None]
+        names = []
+        for name, record in self.packages.items():
+            if all([getattr(record, attr) == value for attr, value in query]):
+                names.append(name)
+        return sorted(names)
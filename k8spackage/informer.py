@@ -0,0 +1,195 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+import subprocess
+import threading
+import time
+
+import requests
+
+from k8spackage.exception import Unsupported
+from k8spackage.kubeclient import get_backend
+
+logger = logging.getLogger('k8s_events')
+
+
+class WatchExpired(Exception):
+    """ The resourceVersion is too old (410 Gone), a new list is required """
+
+
+class Informer(object):
+    """
+    In-memory store of a resource kept up to date by a single list + watch:
+     - the store is filled by a paginated list, then updated from the watch events
+     - bookmarks advance the resourceVersion, a 410 Gone triggers a new list
+     - every 'resync_period' seconds the stored objects are re-delivered to the update handlers
+     - a backend without watch (kubectl) is polled: a full list every 'poll_period' seconds
+    Handlers are called from the informer thread as on_add(obj), on_update(old, new)
+    and on_delete(obj), with 'model' instances.
+    """
+
+    def __init__(self, model, namespace="default", selector=None, resync_period=300,
+                 watch_timeout=300, page_size=500, poll_period=30, backend=None):
+        self.model = model
+        self.namespace = namespace
+        self.selector = selector
+        self.resync_period = resync_period
+        self.watch_timeout = watch_timeout
+        self.page_size = page_size
+        self.poll_period = poll_period
+        self.polling = False
+        self.backend = backend or get_backend()
+        self.resource_version = None
+        self.store = {}
+        self.versions = {}
+        self.handlers = []
+        self.synced = threading.Event()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_handler(self, on_add=None, on_update=None, on_delete=None):
+        self.handlers.append({'add': on_add, 'update': on_update, 'delete': on_delete})
+
+    def _notify(self, event, *args):
+        for handler in self.handlers:
+            if handler[event] is not None:
+                try:
+                    handler[event](*args)
+                except Exception:  # a handler must not stop the informer
+                    logger.exception("informer: %s handler failed" % event)
+
+    def get(self, name):
+        with self._lock:
+            return self.store.get(name)
+
+    def list(self):
+        with self._lock:
+            return [self.store[name] for name in sorted(self.store)]
+
+    def _set(self, item):
+        name = item['metadata']['name']
+        version = item['metadata'].get('resourceVersion')
+        if version is not None and self.versions.get(name) == version:
+            return  # unchanged, e.g. listed again
+        obj = self.model.load(item)
+        with self._lock:
+            old = self.store.get(name)
+            self.store[name] = obj
+            self.versions[name] = version
+        if old is None:
+            self._notify('add', obj)
+        else:
+            self._notify('update', old, obj)
+
+    def _remove(self, name):
+        with self._lock:
+            obj = self.store.pop(name, None)
+            self.versions.pop(name, None)
+        if obj is not None:
+            self._notify('delete', obj)
+
+    def relist(self):
+        items = []
+        token = None
+        while True:
+            page = self.backend.list_page(self.model, self.namespace, self.selector,
+                                          self.page_size, token)
+            items.extend(page['items'])
+            token = page['metadata'].get('continue')
+            if not token:
+                break
+        names = set([item['metadata']['name'] for item in items])
+        with self._lock:
+            removed = [name for name in self.store if name not in names]
+        for name in removed:
+            self._remove(name)
+        for item in items:
+            self._set(item)
+        self.resource_version = page['metadata'].get('resourceVersion')
+        self.synced.set()
+        logger.debug("informer: listed %d %s at %s" % (len(items), self.model.crd_plural,
+                                                       self.resource_version))
+
+    def resync(self):
+        for obj in self.list():
+            self._notify('update', obj, obj)
+
+    def handle_event(self, event):
+        kind = event['type']
+        obj = event['object']
+        if kind == 'ERROR':
+            if obj.get('code') == 410:
+                raise WatchExpired(obj.get('message'))
+            raise requests.exceptions.RequestException(obj.get('message'))
+        self.resource_version = obj['metadata'].get('resourceVersion', self.resource_version)
+        if kind in ('ADDED', 'MODIFIED'):
+            self._set(obj)
+        elif kind == 'DELETED':
+            self._remove(obj['metadata']['name'])
+
+    def watch(self, timeout):
+        try:
+            for event in self.backend.watch(self.model, self.namespace, self.resource_version,
+                                            self.selector, timeout):
+                self.handle_event(event)
+                if self._stop.is_set():
+                    return
+        except requests.exceptions.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code == 410:
+                raise WatchExpired(str(exc))
+            raise
+
+    def poll(self, timeout):
+        """ Stand-in for watch() when the backend can't watch: list everything again """
+        self._stop.wait(timeout)
+        if not self._stop.is_set():
+            self.relist()
+
+    def run(self):
+        backoff = 1
+        expired = 0
+        next_resync = time.time() + self.resync_period
+        while not self._stop.is_set():
+            try:
+                if not self.synced.is_set():
+                    self.relist()
+                if self.resync_period and time.time() >= next_resync:
+                    self.resync()
+                    next_resync = time.time() + self.resync_period
+                timeout = self.poll_period if self.polling else self.watch_timeout
+                if self.resync_period:
+                    timeout = max(1, min(timeout, int(next_resync - time.time())))
+                if self.polling:
+                    self.poll(timeout)
+                else:
+                    self.watch(timeout)
+                backoff = 1
+                expired = 0
+            except Unsupported as exc:
+                logger.warning("informer: %s, listing every %ss instead" % (exc, self.poll_period))
+                self.polling = True
+            except WatchExpired:
+                logger.info("informer: resourceVersion %s expired, listing again" %
+                            self.resource_version)
+                self.synced.clear()
+                # a relist answered by an already expired version again: don't spin on it
+                if expired:
+                    self._stop.wait(min(2 ** (expired - 1), 60))
+                expired += 1
+            except (requests.exceptions.RequestException, subprocess.CalledProcessError) as exc:
+                logger.error("informer: %s, retrying in %ss" % (exc, backoff))
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="informer-%s" % self.namespace)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,338 @@
+from __future__ import absolute_import, division, print_function
+
+import atexit
+import base64
+import logging
+import os
+import tempfile
+
+import k8spackage.kubectl as kubectl
+from k8spackage.exception import Unsupported
+from k8spackage.helm_index import pooled_session
+from k8spackage.serialization import load_yaml, load_json, dump_json
+
+logger = logging.getLogger('k8s_events')
+
+SERVICEACCOUNT_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+FIELD_MANAGER = "k8spackage"
+TABLE_ACCEPT = "application/json;as=Table;v=v1;g=meta.k8s.io,application/json"
+
+
+def _datafile(data):
+    """ Write a base64 '*-data' kubeconfig field to a temporary file, requests needs paths """
+    fd, path = tempfile.mkstemp(prefix="k8spackage-")
+    with os.fdopen(fd, 'wb') as datafile:
+        datafile.write(base64.b64decode(data))
+    atexit.register(os.remove, path)
+    return path
+
+
+class KubeConfig(object):
+    """ API server settings of the current kubeconfig context or of the in-cluster account """
+
+    def __init__(self, server, token=None, verify=True, cert=None, auth=None):
+        self.server = server.rstrip("/")
+        self.token = token
+        self.verify = verify
+        self.cert = cert
+        self.auth = auth
+
+    @classmethod
+    def in_cluster(cls):
+        host = os.environ["KUBERNETES_SERVICE_HOST"]
+        port = os.getenv("KUBERNETES_SERVICE_PORT", "443")
+        with open(os.path.join(SERVICEACCOUNT_DIR, "token")) as tokenfile:
+            token = tokenfile.read().strip()
+        return cls("https://%s:%s" % (host, port), token=token,
+                   verify=os.path.join(SERVICEACCOUNT_DIR, "ca.crt"))
+
+    @classmethod
+    def from_file(cls, path=None, context=None):
+        if path is None:
+            path = os.getenv("KUBECONFIG", "~/.kube/config").split(os.pathsep)[0]
+        path = os.path.expanduser(path)
+        with open(path) as configfile:
+            config = load_yaml(configfile)
+        basedir = os.path.dirname(path)
+
+        def _named(section, name):
+            for item in config.get(section) or []:
+                if item['name'] == name:
+                    return item[section[:-1]]
+            raise ValueError("%s '%s' not found in %s" % (section[:-1], name, path))
+
+        def _path(value):
+            return os.path.join(basedir, os.path.expanduser(value))
+
+        ctx = _named('contexts', context or config['current-context'])
+        cluster = _named('clusters', ctx['cluster'])
+        user = _named('users', ctx['user']) if ctx.get('user') else {}
+        if 'exec' in user or 'auth-provider' in user:
+            raise ValueError("kubeconfig user '%s' uses an auth plugin" % ctx['user'])
+
+        verify = True
+        if cluster.get('insecure-skip-tls-verify'):
+            verify = False
+        elif 'certificate-authority-data' in cluster:
+            verify = _datafile(cluster['certificate-authority-data'])
+        elif 'certificate-authority' in cluster:
+            verify = _path(cluster['certificate-authority'])
+
+        cert = None
+        if 'client-certificate-data' in user:
+            cert = (_datafile(user['client-certificate-data']), _datafile(user['client-key-data']))
+        elif 'client-certificate' in user:
+            cert = (_path(user['client-certificate']), _path(user['client-key']))
+
+        token = user.get('token')
+        if 'tokenFile' in user:
+            with open(_path(user['tokenFile'])) as tokenfile:
+                token = tokenfile.read().strip()
+        auth = None
+        if 'username' in user:
+            auth = (user['username'], user.get('password', ''))
+        return cls(cluster['server'], token=token, verify=verify, cert=cert, auth=auth)
+
+    @classmethod
+    def load(cls):
+        if "KUBERNETES_SERVICE_HOST" in os.environ:
+            return cls.in_cluster()
+        return cls.from_file()
+
+
+class KubeApiBackend(object):
+    """ Talks to the kubernetes API server over a keep-alive session, without forking kubectl """
+    name = "api"
+
+    def __init__(self, config, session=None):
+        self.config = config
+        if session is None:
+            session = pooled_session()
+        session.verify = config.verify
+        session.cert = config.cert
+        session.auth = config.auth
+        session.headers['Accept'] = "application/json"
+        if config.token:
+            session.headers['Authorization'] = "Bearer %s" % config.token
+        self.session = session
+        # plurals whose CRD lacks the additionalPrinterColumns: listed in full, blobs dropped
+        self._without_columns = set()
+
+    @property
+    def cluster(self):
+        return self.config.server
+
+    def url(self, model, namespace, name=None):
+        path = [self.config.server, "apis", model.crd_group, model.crd_version]
+        if namespace:
+            path += ["namespaces", namespace]
+        path.append(model.crd_plural)
+        if name:
+            path.append(name)
+        return "/".join(path)
+
+    def _request(self, method, url, **kwargs):
+        resp = self.session.request(method, url, **kwargs)
+        resp.raise_for_status()
+        return load_json(resp.content)
+
+    def get(self, model, name, namespace="default"):
+        return self._request("GET", self.url(model, namespace, name))
+
+    def delete(self, model, name, namespace="default"):
+        return self._request("DELETE", self.url(model, namespace, name))
+
+    def apply(self, model, obj, namespace="default"):
+        """ Create or update 'obj' with a server-side apply """
+        return self._request("PATCH", self.url(model, namespace, obj['metadata']['name']),
+                             params={'fieldManager': FIELD_MANAGER, 'force': 'true'},
+                             data=dump_json(obj),
+                             headers={'Content-Type': "application/apply-patch+yaml"})
+
+    def list(self, model, namespace="default", selector=None, opts=None):
+        if opts:
+            logger.warning("kubectl options are ignored by the api backend: %s" % " ".join(opts))
+        params = {}
+        if selector:
+            params['labelSelector'] = selector
+        return self._request("GET", self.url(model, namespace), params=params)
+
+    @staticmethod
+    def _has_columns(model, table):
+        names = set([column['name'].lower() for column in table['columnDefinitions']])
+        return all([key in names for key, _ in model.columns])
+
+    def _table_items(self, model, table):
+        """ Rebuild partial resources from the columns of a meta.k8s.io Table """
+        names = [column['name'].lower() for column in table['columnDefinitions']]
+        items = []
+        for row in table['rows']:
+            cells = dict(zip(names, row['cells']))
+            item = {"metadata": {"name": cells.get("name"), "labels": {}, "annotations": {}},
+                    "spec": {}}
+            if row.get('object'):
+                item['metadata'].update(row['object'].get('metadata', {}))
+            for key, path in model.columns:
+                if key != "name" and key in cells:
+                    _set_path(item, path, cells[key])
+            items.append(item)
+        return items
+
+    def list_page(self, model, namespace="default", selector=None, limit=500, token=None,
+                  metadata_only=False):
+        """ One page of the listing, starting at the 'continue' token """
+        params = {'limit': limit}
+        if selector:
+            params['labelSelector'] = selector
+        if token:
+            params['continue'] = token
+        if metadata_only and model.crd_plural not in self._without_columns:
+            page = self._request("GET", self.url(model, namespace),
+                                 params=dict(params, includeObject="Metadata"),
+                                 headers={'Accept': TABLE_ACCEPT})
+            if page.get('kind') != "Table":
+                page['items'] = [_strip_blob(item) for item in page['items']]
+                return page
+            if self._has_columns(model, page):
+                page['items'] = self._table_items(model, page)
+                return page
+            # e.g. a CRD installed before the columns were added: only Name and Age
+            logger.warning("%s: the CRD has no %s printer columns, listing the full objects" %
+                           (model.crd_plural, ", ".join([key for key, _ in model.columns])))
+            self._without_columns.add(model.crd_plural)
+        page = self._request("GET", self.url(model, namespace), params=params)
+        if metadata_only:
+            page['items'] = [_strip_blob(item) for item in page['items']]
+        return page
+
+    def list_pages(self, model, namespace="default", selector=None, limit=500,
+                   metadata_only=False, opts=None):
+        """
+        Yields the items page by page, using the API server 'limit'/'continue' pagination
+        metadata_only: only transfer the printer columns, as a Table, instead of the full objects
+        """
+        if opts:
+            logger.warning("kubectl options are ignored by the api backend: %s" % " ".join(opts))
+        token = None
+        while True:
+            page = self.list_page(model, namespace, selector, limit, token, metadata_only)
+            yield page['items']
+            token = page.get('metadata', {}).get('continue')
+            if not token:
+                break
+
+    def watch(self, model, namespace="default", resource_version=None, selector=None,
+              timeout_seconds=300):
+        """ Yields the watch events ({'type': ..., 'object': ...}) until the server closes it """
+        params = {'watch': 1, 'allowWatchBookmarks': 'true', 'timeoutSeconds': timeout_seconds}
+        if resource_version:
+            params['resourceVersion'] = resource_version
+        if selector:
+            params['labelSelector'] = selector
+        resp = self.session.get(self.url(model, namespace), params=params, stream=True,
+                                timeout=(10, timeout_seconds + 30))
+        resp.raise_for_status()
+        try:
+            for line in resp.iter_lines():
+                if line:
+                    yield load_json(line)
+        finally:
+            resp.close()
+
+
+class KubectlBackend(object):
+    """ Fallback backend, forks kubectl for each call """
+    name = "kubectl"
+
+    @property
+    def cluster(self):
+        return "kubectl:%s" % os.getenv("KUBECONFIG", "")
+
+    def get(self, model, name, namespace="default"):
+        return load_json(kubectl.get(model.crd_plural, name, namespace, ["-o", "json"]))
+
+    def delete(self, model, name, namespace="default"):
+        return kubectl.delete(model.crd_plural, name, namespace)
+
+    def apply(self, model, obj, namespace="default"):
+        return kubectl.apply(dump_json(obj).encode('utf-8'), namespace,
+                             ['--field-manager', FIELD_MANAGER, '--force-conflicts'])
+
+    def list(self, model, namespace="default", selector=None, opts=None):
+        opts = list(opts or [])
+        if selector:
+            opts += ['-l', selector]
+        return load_json(kubectl.list(model.crd_plural, namespace, opts))
+
+    def list_page(self, model, namespace="default", selector=None, limit=500, token=None,
+                  metadata_only=False):
+        """ The whole listing as a single page, kubectl follows the 'continue' tokens itself """
+        items = []
+        for page in self.list_pages(model, namespace, selector, limit, metadata_only):
+            items.extend(page)
+        return {'kind': "List", 'metadata': {}, 'items': items}
+
+    def watch(self, model, namespace="default", resource_version=None, selector=None,
+              timeout_seconds=300):
+        raise Unsupported("watch requires the api backend (K8SPACKAGE_BACKEND=api)")
+
+    def list_pages(self, model, namespace="default", selector=None, limit=500,
+                   metadata_only=False, opts=None):
+        opts = list(opts or []) + ['--chunk-size', str(limit)]
+        if not metadata_only:
+            yield self.list(model, namespace, selector, opts)['items']
+            return
+        # custom-columns keeps the blobs out of the output kubectl sends back, the
+        # resourceVersion lets the PackageIndex keep the unchanged entries
+        columns = list(model.columns) + [('resourceversion', "metadata.resourceVersion")]
+        opts += ['-o', 'custom-columns=%s' % ','.join(
+            ["%s:%s" % (key.upper(), path) for key, path in columns])]
+        if selector:
+            opts += ['-l', selector]
+        items = []
+        for line in kubectl.list(model.crd_plural, namespace, opts).decode().splitlines()[1:]:
+            item = {"metadata": {"labels": {}, "annotations": {}}, "spec": {}}
+            for (_, path), value in zip(columns, line.split()):
+                if value != "<none>":
+                    _set_path(item, path, value)
+            items.append(item)
+        yield items
+
+
+def _set_path(item, path, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        item = item.setdefault(key, {})
+    item[keys[-1]] = value
+
+
+def _strip_blob(item):
+    source = item.get('spec', {}).get('content', {}).get('source', {})
+    source.pop('blob', None)
+    return item
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Backend selected by K8SPACKAGE_BACKEND:
+     - api: talk directly to the API server
+     - kubectl: call the kubectl binary
+     - auto (default): api, falling back to kubectl when the kubeconfig can't be used directly
+    """
+    global _backend
+    if _backend is None:
+        choice = os.getenv("K8SPACKAGE_BACKEND", "auto")
+        if choice == "kubectl":
+            _backend = KubectlBackend()
+        elif choice == "api":
+            _backend = KubeApiBackend(KubeConfig.load())
+        else:
+            try:
+                _backend = KubeApiBackend(KubeConfig.load())
+            except (IOError, OSError, KeyError, ValueError) as exc:
+                logger.debug("api backend unavailable (%s), using kubectl" % exc)
+                _backend = KubectlBackend()
+    return _backend
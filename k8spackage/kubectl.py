@@ -2,9 +2,16 @@ import time
 import subprocess
 
 
-def call(cmd):
+def call(cmd, stdin=None):
     command = ['kubectl'] + cmd
-    return subprocess.check_output(command, stderr=subprocess.STDOUT)
+    if stdin is None:
+        return subprocess.check_output(command, stderr=subprocess.STDOUT)
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    output, _ = proc.communicate(stdin)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, command, output=output)
+    return output
 
 
 def get(kind, name, namespace="default", opts=None):
@@ -21,6 +28,13 @@ def delete(kind, name, namespace="default", opts=None):
     return call(cmd)
 
 
+def apply(body, namespace="default", opts=None):
+    if not opts:
+        opts = []
+    cmd = ['apply', '--server-side', '-f', '-', '-n', namespace] + opts
+    return call(cmd, stdin=body)
+
+
 def list(kind, namespace="default", opts=None):
     if not opts:
         opts = []
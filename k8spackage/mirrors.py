@@ -0,0 +1,162 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+from k8spackage.download import RangeDownloader
+from k8spackage.exception import InvalidDigest, MirrorsUnavailable
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+logger = logging.getLogger('k8s_events')
+
+# latency added to a mirror score on failure, decays as the mirror succeeds again
+FAILURE_PENALTY = 30.0
+
+
+class MirrorScoreboard(object):
+    """
+    Moving average of the response time of each mirror host, failures count as a
+    FAILURE_PENALTY seconds response. Hosts without score keep their position and come first.
+    """
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.scores = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        return urlparse(url).netloc
+
+    def record(self, url, seconds):
+        host = self.host(url)
+        with self._lock:
+            score = self.scores.get(host)
+            if score is None:
+                self.scores[host] = seconds
+            else:
+                self.scores[host] = self.alpha * seconds + (1 - self.alpha) * score
+
+    def failure(self, url):
+        self.record(url, FAILURE_PENALTY)
+
+    def score(self, url):
+        return self.scores.get(self.host(url), 0.0)
+
+    def order(self, urls):
+        """ 'urls' fastest first, sorted() is stable: ties keep the given order """
+        return sorted(urls, key=self.score)
+
+
+_scoreboard = None
+
+
+def mirror_scoreboard():
+    """ Process-wide scoreboard shared by all the downloads """
+    global _scoreboard
+    if _scoreboard is None:
+        _scoreboard = MirrorScoreboard()
+    return _scoreboard
+
+
+def hedge_delay():
+    """ K8SPACKAGE_HEDGE_DELAY seconds, None (no hedged requests) when not set """
+    delay = os.getenv("K8SPACKAGE_HEDGE_DELAY")
+    return float(delay) if delay else None
+
+
+def _close_download(future):
+    if not future.exception():
+        future.result().close()
+
+
+class MirrorFetcher(object):
+    """
+    Download the content from the first mirror that returns it with the expected digest,
+    trying the mirrors fastest first according to 'scoreboard'.
+    hedge_delay: seconds to wait for a mirror before sending the same request to the next one
+                 as well, the first verified response wins (None: one mirror at a time)
+    downloader: RangeDownloader streaming each mirror to a temporary file
+    """
+
+    def __init__(self, urls, digest=None, session=None, scoreboard=None, hedge_delay=None,
+                 timeout=None, downloader=None):
+        self.urls = list(urls)
+        self.digest = digest
+        self.session = session or requests
+        self.scoreboard = scoreboard or mirror_scoreboard()
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.downloader = downloader or RangeDownloader(self.session, timeout=timeout)
+        self.errors = {}
+
+    def open(self, url):
+        """ Streaming response of 'url', its response time is recorded """
+        try:
+            resp = self.session.get(url, stream=True, timeout=self.timeout)
+            resp.raise_for_status()
+        except requests.exceptions.RequestException:
+            self.scoreboard.failure(url)
+            raise
+        self.scoreboard.record(url, resp.elapsed.total_seconds())
+        return resp
+
+    def _fetch(self, url):
+        start = time.time()
+        try:
+            download = self.downloader.download(url, digest=self.digest)
+        except (requests.exceptions.RequestException, InvalidDigest) as exc:
+            self.scoreboard.failure(url)
+            logger.warning("mirror %s failed: %s" % (url, exc))
+            raise
+        self.scoreboard.record(url, time.time() - start)
+        return download
+
+    def _unavailable(self):
+        return MirrorsUnavailable("no mirror returned the content %s" % (self.digest or ""),
+                                  dict([(url, str(exc)) for url, exc in self.errors.items()]))
+
+    def fetch(self):
+        """ Verified Download of the content, the caller closes it """
+        if self.hedge_delay is not None and len(self.urls) > 1:
+            return self._fetch_hedged()
+        for url in self.scoreboard.order(self.urls):
+            try:
+                return self._fetch(url)
+            except (requests.exceptions.RequestException, InvalidDigest) as exc:
+                self.errors[url] = exc
+        raise self._unavailable()
+
+    def _fetch_hedged(self):
+        urls = self.scoreboard.order(self.urls)
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        pending = {}
+        try:
+            while urls or pending:
+                if urls:
+                    url = urls.pop(0)
+                    pending[executor.submit(self._fetch, url)] = url
+                # without anything left to start, wait for the requests in flight
+                done, _ = wait(list(pending), timeout=self.hedge_delay if urls else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        return future.result()
+                    except (requests.exceptions.RequestException, InvalidDigest) as exc:
+                        self.errors[url] = exc
+        finally:
+            # the slower requests complete in the background, their result is dropped
+            for future in pending:
+                future.add_done_callback(_close_download)
+            executor.shutdown(wait=False)
+        raise self._unavailable()
@@ -1,17 +1,24 @@
+import hashlib
+import io
 import os
-import json
-import tempfile
 import logging
+import shutil
+import subprocess
+import tempfile
 import datetime
+from contextlib import closing
 from copy import deepcopy
 
-import requests
-import yaml
-
-from k8spackage.pack import pack_kub, K8spackagePackage
-from k8spackage.utils import package_filename, mkdir_p
-from k8spackage.exception import PackageAlreadyExists
-import k8spackage.kubectl as kubectl
+from k8spackage.pack import (pack_kub, unpack_stream, tar_delta, apply_tar_delta, Base64Reader,
+                             DigestWriter, HashingReader, K8spackagePackage, CHUNK_SIZE)
+from k8spackage.utils import package_filename, mkdir_p, move_tree
+from k8spackage.exception import (PackageAlreadyExists, PackageNotFound, InvalidDigest,
+                                  InvalidResource, MirrorsUnavailable)
+from k8spackage.cache import blob_cache
+from k8spackage.compression import get_codec, detect_codec
+from k8spackage.records import PackageRecord
+from k8spackage.schema import load_schema, PYTHON_TYPES
+from k8spackage.serialization import load_yaml, dump_yaml
 
 CRD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crd")
 logging.basicConfig()
@@ -19,14 +26,52 @@ logger = logging.getLogger('k8s_events')
 logger.setLevel(logging.DEBUG)
 
 
+def get_backend():
+    """ kubeclient.get_backend(): requests and the backends are imported on first use """
+    from k8spackage.kubeclient import get_backend as backend
+    return backend()
+
+
+def _string_value(value):
+    """
+    Scalar as the string a CRD string field expects, e.g. an unquoted 'appVersion: 4.0' loaded
+    as a float by YAML. Other values are returned as is, for the schema to report them.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, PYTHON_TYPES['number']):
+        return str(value)
+    return value
+
+
 def load_spec(crd_file):
     with open(os.path.join(os.path.dirname(__file__), "crd", crd_file)) as f:
-        return yaml.load(f.read())
+        return load_yaml(f)
+
+
+class LazySpec(object):
+    """
+    crd_spec class attribute, a CrdSchema loaded on first access and not on import
+    (from the JSON schema cache once the CRD file has been parsed)
+    """
+
+    def __init__(self, crd_file):
+        self.crd_file = crd_file
+        self._spec = None
+
+    def __get__(self, obj, cls=None):
+        if self._spec is None:
+            self._spec = load_schema(os.path.join(CRD_DIR, self.crd_file))
+        return self._spec
 
 
 class CrdModel(object):
     kind = None
     crd_spec = None
+    # spec fields that must be set to a non-empty value, on top of the CRD schema
+    not_empty = []
 
     def __init__(self, name):
         self.cr_instance = self.generate_cr(self.kind, name)
@@ -70,7 +115,7 @@ class CrdModel(object):
         if not force and os.path.isfile(filepath):
             raise PackageAlreadyExists("release-file already exists")
         with open(filepath, "w") as output:
-            output.write(yaml.safe_dump(self.render()))
+            output.write(dump_yaml(self.render()))
         return filepath
 
     def generate_cr(self, kind, name, spec=None, labels=None, annotations=None):
@@ -93,13 +138,41 @@ class CrdModel(object):
             cr_instance['metadata']['annotations'] = annotations
         return cr_instance
 
+    @classmethod
+    def resource_errors(cls, resource):
+        """ Error messages of a rendered resource (a dict), [] if it's valid """
+        if cls.crd_spec is None:
+            return []
+        spec = resource.get('spec')
+        schema_errors = cls.crd_spec.schema_errors(spec)
+        # a missing field is already reported as such
+        missing = set([error.path for error in schema_errors if error.validator == 'required'])
+        errors = [str(error) for error in schema_errors]
+        for path in cls.not_empty:
+            value = spec
+            for key in path.split("."):
+                value = value.get(key) if isinstance(value, dict) else None
+            if not value and "spec." + path not in missing:
+                errors.append("spec.%s: must not be empty" % path)
+        return errors
+
     def validate(self):
+        errors = self.resource_errors(self.cr_instance)
+        if errors:
+            raise InvalidResource("%s %s: %s" % (self.kind, self.name, "; ".join(errors)),
+                                  {'kind': self.kind, 'name': self.name, 'errors': errors})
         return True
 
 
 class DescriptorCr(CrdModel):
     kind = "Descriptor"
-    crd_spec = load_spec("descriptor.crd.yaml")
+    crd_spec = LazySpec("descriptor.crd.yaml")
+    not_empty = ['mediaType']
+    # helm chart metadata copied to the spec
+    chart_fields = [
+        'sources', 'maintainers', 'appVersion', 'icon', 'keywords', 'description', 'appName',
+        "created"
+    ]
 
     def __init__(self, name, media_type=None):
         super(DescriptorCr, self).__init__(name)
@@ -109,16 +182,29 @@ class DescriptorCr(CrdModel):
     def media_type(self):
         return self.spec['mediaType']
 
+    @classmethod
+    def chart_spec(cls, chart):
+        """ spec fields of the helm chart metadata, scalars converted to the CRD string fields """
+        spec = {}
+        properties = DescriptorCr.crd_spec.properties
+        for key in cls.chart_fields:
+            if not chart or key not in chart:
+                continue
+            value = deepcopy(chart[key])
+            prop = properties.get(key, {})
+            if prop.get('type') == 'string':
+                value = _string_value(value)
+            elif (prop.get('type') == 'array' and prop.get('items', {}).get('type') == 'string'
+                  and isinstance(value, list)):
+                value = [_string_value(item) for item in value]
+            spec[key] = value
+        return spec
+
     @classmethod
     def from_chart(cls, chart):
         descriptor = cls(chart['name'], 'helm')
-
-        for key in [
-                'sources', 'maintainers', 'appVersion', 'icon', 'keywords', 'description',
-                'appName', "created"
-        ]:
-            if key in chart:
-                descriptor.add_field(key, chart[key])
+        for key, value in cls.chart_spec(chart).items():
+            descriptor.add_field(key, value)
         return descriptor
 
     @media_type.setter
@@ -128,21 +214,9 @@ class DescriptorCr(CrdModel):
     def _filename(self):
         return "descriptor.yaml"
 
-    def validate(self):
-        if not self.spec.get('mediaType', None):
-            raise ValueError('Missing spec.mediaType')
-        return True
-
     def transform(self):
         self.cr_instance['metadata']['labels']['mediaType'] = self.media_type
-        for k, v in self.crd_spec['spec']['validation']['openAPIV3Schema']['properties'].items():
-            if k not in self.cr_instance['spec']:
-                val = ''
-                if v['type'] == 'array':
-                    val = []
-                elif v['type'] == 'object':
-                    val = {}
-                self.cr_instance['spec'][k] = val  # "# %s # %s" % (val, v.get('description', ''))
+        self.cr_instance['spec'].update(self.crd_spec.missing_fields(self.cr_instance['spec']))
 
 
 class PackageCr(DescriptorCr):
@@ -157,12 +231,19 @@ class PackageCr(DescriptorCr):
         ("mediatype", "spec.mediaType"),
         ("digest", "spec.content.digest"),
     ]
-    crd_spec = load_spec("package.crd.yaml")
+    crd_spec = LazySpec("package.crd.yaml")
+    not_empty = [
+        'packageVersion', 'mediaType', 'content', 'content.size', 'content.digest',
+        'content.source'
+    ]
 
     def __init__(self, name=None, version=None, media_type=None, descriptor=None):
         super(PackageCr, self).__init__(name, media_type)
+        self.namespace = None
+        self.delta_base = None
         if descriptor:
             self.descriptor = deepcopy(descriptor)
+            self.namespace = self.descriptor['metadata'].get('namespace')
             self.spec.update(self.descriptor['spec'])
             self.cr_instance['metadata']['labels'].update(self.descriptor['metadata']['labels'])
             self.cr_instance['metadata']['annotations'].update(
@@ -195,27 +276,67 @@ class PackageCr(DescriptorCr):
         self.cr_instance['metadata']['labels']['mediaType'] = self.media_type
 
     @classmethod
-    def from_helm_index(cls, index, offline=False):
-        packages = []
-        missed = []
-        for name, releases in index['entries'].items():
-            for release in releases:
-                descriptor = DescriptorCr.from_chart(release).render()
-                version = release['version']
-                package = cls(name, version, 'helm', descriptor=descriptor)
-                urls = release['urls']
-                try:
-                    logger.info("- %s.%s" % (name, version))
-                    package.add_url(urls[0], offline)
-                    packages.append(package.render())
-                    if package.content['digest'] != release['digest']:
-                        logger.error("warning: %s.%s" % (name, version))
-                        logger.error("%s != %s" % (package.content['digest'], release['digest']))
-                except requests.exceptions.RequestException as e:
-                    missed.append((name, version))
+    def from_helm_release(cls, name, release, offline=False, session=None):
+        """ Package of a helm release, built from its record, see record_from_helm_release """
+        return cls.load(cls.render_record(cls.record_from_helm_release(name, release, offline,
+                                                                       session)))
+
+    @classmethod
+    def record_from_helm_release(cls, name, release, offline=False, session=None):
+        """
+        PackageRecord of a helm release, checked against the CRD schema. The tarball is
+        verified against the index digest: MirrorsUnavailable when no mirror matches it.
+        """
+        version = release['version']
+        logger.info("- %s.%s" % (name, version))
+        content = cls.fetch_content(release['urls'], offline, session, release.get('digest'))
+        record = PackageRecord(name, version, 'helm', content['digest'], content['size'],
+                               content['format'], content['source'],
+                               str(datetime.datetime.utcnow()), chart=release)
+        resource = cls.render_record(record)
+        errors = cls.resource_errors(resource)
+        if errors:
+            raise InvalidResource("%s %s: %s" % (cls.kind, record.name, "; ".join(errors)),
+                                  {'kind': cls.kind, 'name': record.name, 'errors': errors})
+        return record
+
+    @classmethod
+    def render_record(cls, record):
+        """ Resource of a PackageRecord, the same render() builds for the full Package """
+        if record.resource is not None:
+            return record.resource
+        spec = DescriptorCr.chart_spec(record.chart)
+        spec['mediaType'] = record.media_type
+        spec.update(DescriptorCr.crd_spec.missing_fields(spec))
+        spec.update({
+            'packageName': record.package_name,
+            'packageVersion': record.version,
+            'created': record.created,
+            'content': record.content
+        })
+        labels = {'mediaType': record.media_type, 'packageName': record.package_name}
+        if record.digest:
+            labels['digest'] = record.digest[0:10]
+        return {
+            "apiVersion": "manifest.k8s.io/v1alpha1",
+            "kind": cls.kind,
+            "metadata": {
+                "name": record.name,
+                "annotations": {},
+                "labels": labels
+            },
+            "spec": spec
+        }
+
+    @classmethod
+    def from_helm_index(cls, index, offline=False, workers=8, rate=None, previous=None,
+                        delta=False):
+        from k8spackage.helm_index import HelmIndexImporter
+        importer = HelmIndexImporter(cls, offline=offline, workers=workers, rate=rate)
+        records = importer.import_index(index, previous, delta)
         list_packages = {
             "apiVersion": "v1",
-            "items": packages,
+            "items": [cls.render_record(record) for record in records],
             "kind": "List",
             "metadata": {
                 "resourceVersion": "",
@@ -237,129 +358,486 @@ class PackageCr(DescriptorCr):
     def package_name(self):
         return self.spec['packageName']
 
-    def validate(self):
-        if self.name != "%s.%s" % (self.package_name, self.version):
-            raise ValueError("name must be packageName.packageVersion")
-        if not self.version:
-            raise ValueError("Missing spec.packageVersion")
-        if not self.spec.get('mediaType', None):
-            raise ValueError('Missing spec.mediaType')
-        if not self.spec.get('content', None):
-            raise ValueError('Missing spec.content')
-        if not self.spec['content'].get('size', None):
-            raise ValueError('Missing spec.content.size')
-        if not self.spec['content'].get('digest', None):
-            raise ValueError('Missing spec.content.digest')
-        if not self.spec['content'].get('source', None):
-            raise ValueError('Missing spec.content.source')
-
-        return True
+    @classmethod
+    def resource_errors(cls, resource):
+        errors = super(PackageCr, cls).resource_errors(resource)
+        spec = resource.get('spec') or {}
+        name = resource.get('metadata', {}).get('name')
+        if name != "%s.%s" % (spec.get('packageName'), spec.get('packageVersion')):
+            errors.append("metadata.name: must be packageName.packageVersion, got %s" % name)
+        return errors
 
     def _filename(self):
         return package_filename(self.package_name, self.version, self.media_type)
 
-    def prepare_content(self, path=".", prefix=None):
-        filename = self._filename()
-        kubepath = os.path.join(tempfile.gettempdir(), filename + ".tar.gz")
-        pack_kub(kubepath, srcpath=path, prefix=prefix)
-        with open(kubepath, 'rb') as kubefile:
-            k8spackage_package = K8spackagePackage(kubefile.read(), b64_encoded=False)
-        os.remove(kubepath)
-        return k8spackage_package
-
-    def add_blob(self, srcpath=".", prefix=None):
-        k8spackage_package = self.prepare_content(srcpath, prefix)
-        self._add_source(k8spackage_package, {'blob': k8spackage_package.b64blob})
+    def prepare_content(self, path=".", prefix=None, reproducible=False, codec=None, level=None,
+                        threads=1):
+        writer = DigestWriter(codec=codec)
+        pack_kub(self._filename() + writer.codec.extension, srcpath=path, prefix=prefix,
+                 fileobj=writer, reproducible=reproducible, codec=writer.codec, level=level,
+                 threads=threads)
+        return writer
+
+    def add_blob(self, srcpath=".", prefix=None, reproducible=False, codec=None, level=None,
+                 threads=1):
+        content = self.prepare_content(srcpath, prefix, reproducible, codec, level, threads)
+        self._add_source(content, {'blob': content.b64blob.decode('ascii')})
+
+    def chunk_store(self, path=None, namespace=None):
+        """
+        Store of the content chunks: the local directory 'path' (or K8SPACKAGE_CHUNK_DIR),
+        otherwise the PackageChunk resources of the package namespace
+        """
+        from k8spackage.chunks import ClusterChunkStore, LocalChunkStore
+        path = path or os.getenv("K8SPACKAGE_CHUNK_DIR")
+        if path:
+            return LocalChunkStore(path)
+        return ClusterChunkStore(PackageChunkCr, namespace or self.namespace or 'default')
+
+    def add_chunks(self, srcpath=".", prefix=None, level=None, store=None):
+        """
+        Split the content in chunks saved once in 'store', the package only lists their digests.
+        The tarball is always reproducible so that unchanged files give unchanged chunks.
+        """
+        from k8spackage.chunks import ChunkedGzipCodec
+        codec = ChunkedGzipCodec(store if store is not None else self.chunk_store())
+        writer = DigestWriter(encode=False)
+        pack_kub(self._filename() + writer.codec.extension, srcpath=srcpath, prefix=prefix,
+                 fileobj=writer, reproducible=True, codec=codec, level=level)
+        self._add_source(writer, {'chunks': codec.chunks})
+
+    def add_delta(self, base, srcpath=".", prefix=None, codec=None, level=None):
+        """
+        Store only the files added or changed since the 'base' PackageCr, and the removed ones.
+        The tarball is always reproducible: it's rebuilt from the base content and the delta.
+        """
+        codec = get_codec(codec)
+        tarball = io.BytesIO()
+        pack_kub(self._filename() + codec.extension, srcpath=srcpath, prefix=prefix,
+                 fileobj=tarball, reproducible=True, codec=codec, level=level)
+        k8spackage_package = K8spackagePackage(tarball.getvalue(), b64_encoded=False, lazy=True,
+                                               codec=codec)
+        writer = DigestWriter()
+        removed = tar_delta(base.load_content(lazy=True).tar, k8spackage_package.tar, writer,
+                            codec, level)
+        delta = {
+            'base': base.content['digest'],
+            'blob': writer.b64blob.decode('ascii'),
+            'removed': removed
+        }
+        if level is not None:
+            delta['level'] = level
+        self._add_source(k8spackage_package, {'delta': delta})
+        self.delta_base = base
+        self._k8spackage_package = None
+        # fails now rather than when the package is read
+        self._rebuild_delta()
 
-    def _add_source(self, k8spackage_package, source):
-        self.add_field('content', {
+    @staticmethod
+    def _content(k8spackage_package, source):
+        return {
             'source': source,
             'size': k8spackage_package.size,
-            'digest': k8spackage_package.digest
-        })
+            'digest': k8spackage_package.digest,
+            'format': k8spackage_package.codec.format
+        }
 
-    def add_url(self, url, offline=False):
-        resp = requests.get(url, stream=True)
-        resp.raise_for_status()
-        k8spackage_package = K8spackagePackage(resp.raw.data, b64_encoded=False)
-        if offline:
-            self._add_source(k8spackage_package, {'blob': k8spackage_package.b64blob})
-        else:
-            self._add_source(k8spackage_package, {'urls': [url]})
+    def _add_source(self, k8spackage_package, source):
+        self.add_field('content', self._content(k8spackage_package, source))
+
+    @staticmethod
+    def _download(urls, digest=None, session=None):
+        """
+        Download of the tarball from the local blob cache or from the fastest working mirror,
+        streamed to a temporary file. The caller closes it.
+        """
+        from k8spackage.download import Download, RangeDownloader, download_ranges
+        from k8spackage.mirrors import MirrorFetcher, hedge_delay
+        cache = blob_cache()
+        blob = cache.get(digest) if cache is not None else None
+        if blob is not None:
+            return Download(io.BytesIO(blob), digest, len(blob))
+        fetcher = MirrorFetcher(urls, digest, session, hedge_delay=hedge_delay(),
+                                downloader=RangeDownloader(session, ranges=download_ranges()))
+        download = fetcher.fetch()
+        if cache is not None:
+            cache.put_file(download.fileobj, download.digest)
+            download.fileobj.seek(0)
+        return download
+
+    @classmethod
+    def fetch_content(cls, url, offline=False, session=None, digest=None):
+        """
+        spec.content of a tarball url, or list of mirrors, verified against 'digest' when
+        it's set. offline: embed the tarball as a blob
+        """
+        urls = list(url) if isinstance(url, (list, tuple)) else [url]
+        download = cls._download(urls, digest, session)
+        try:
+            download.codec = detect_codec(download.fileobj.read(8))
+            download.fileobj.seek(0)
+            if offline:
+                writer = DigestWriter(codec=download.codec)
+                shutil.copyfileobj(download.fileobj, writer, CHUNK_SIZE)
+                return cls._content(writer, {'blob': writer.b64blob.decode('ascii')})
+            return cls._content(download, {'urls': urls})
+        finally:
+            download.close()
+
+    def add_url(self, url, offline=False, session=None, digest=None):
+        """ url: download url or list of mirrors, verified against 'digest' when it's set """
+        self.add_field('content', self.fetch_content(url, offline, session, digest))
 
     @property
     def content(self):
         return self.spec.get('content', None)
 
+    @property
+    def content_codec(self):
+        """ Codec of the recorded content format, None to detect it from the tarball """
+        content_format = (self.content or {}).get('format')
+        return get_codec(content_format) if content_format else None
+
     @property
     def content_source(self):
         return self.spec.get('content', {}).get('source', {})
 
     @property
     def k8spackage_package(self):
+        return self.load_content()
+
+    def load_content(self, lazy=False):
+        """ lazy: index the archive members and decompress files only when they're read """
         if self._k8spackage_package is None:
             if 'blob' in self.content_source:
                 self._k8spackage_package = K8spackagePackage(self.content_source['blob'],
-                                                             b64_encoded=True)
+                                                             b64_encoded=True, lazy=lazy,
+                                                             codec=self.content_codec)
+            elif 'delta' in self.content_source:
+                self._k8spackage_package = K8spackagePackage(self._rebuild_delta(),
+                                                             b64_encoded=False, lazy=lazy,
+                                                             codec=self.content_codec)
+            elif 'chunks' in self.content_source:
+                self._k8spackage_package = K8spackagePackage(lazy=lazy, codec=self.content_codec,
+                                                             opener=self._open_chunks)
             elif 'urls' in self.content_source:
-                resp = requests.get(self.content_source['urls'][0], stream=True)
-                resp.raise_for_status()
-                self._k8spackage_package = K8spackagePackage(resp.content, b64_encoded=False)
+                download = self._download(self.content_source['urls'], self.content.get('digest'))
+                with closing(download):
+                    blob = download.fileobj.read()
+                self._k8spackage_package = K8spackagePackage(blob, b64_encoded=False, lazy=lazy,
+                                                             codec=self.content_codec)
             else:
                 raise ValueError("missing content")
         return self._k8spackage_package
 
+    def _rebuild_delta(self):
+        """ Full tarball of a delta package, from its base package (found by digest) """
+        delta = self.content_source['delta']
+        base = self.delta_base
+        if base is None:
+            base = self.find_digest(delta['base'], self.namespace or 'default')
+            if base is None:
+                raise PackageNotFound("%s: base package %s not found" % (self.name, delta['base']),
+                                      {'digest': delta['base']})
+            self.delta_base = base
+        codec = self.content_codec or get_codec()
+        delta_package = K8spackagePackage(delta['blob'], b64_encoded=True, lazy=True, codec=codec)
+        tarball = io.BytesIO()
+        apply_tar_delta(base.load_content(lazy=True).tar, delta_package.tar,
+                        delta.get('removed', []), tarball, codec, delta.get('level'))
+        blob = tarball.getvalue()
+        digest = hashlib.sha256(blob).hexdigest()
+        if digest != self.content['digest']:
+            raise InvalidDigest("%s: rebuilt content digest %s != %s" %
+                                (self.name, digest, self.content['digest']),
+                                {'expected': self.content['digest'], 'digest': digest})
+        return blob
+
+    def _open_chunks(self):
+        from k8spackage.chunks import ChunkReader
+        return ChunkReader(self.chunk_store(), self.content_source['chunks'])
+
+    def _open_content(self, url=None):
+        """
+        (stream of the raw tarball, cached): 'url', else the blob cache or the fastest mirror
+        """
+        if 'blob' in self.content_source:
+            return Base64Reader(self.content_source['blob']), True
+        if 'chunks' in self.content_source:
+            return self._open_chunks(), True
+        if 'delta' in self.content_source:
+            return io.BytesIO(self._rebuild_delta()), True
+        from k8spackage.mirrors import MirrorFetcher, mirror_scoreboard
+        if url is None:
+            cache = blob_cache()
+            if cache is not None:
+                blobfile = cache.open(self.content.get('digest'))
+                if blobfile is not None:
+                    return blobfile, True
+            url = mirror_scoreboard().order(self.content_source['urls'])[0]
+        return MirrorFetcher(self.content_source['urls']).open(url).raw, False
+
+    def _extract_urls(self, dest=".", tarball=True):
+        """
+        Stream from the blob cache, else the fastest mirror, the next ones on failure,
+        interrupted transfer or invalid digest. A corrupted cache entry is dropped, it's not the mirrors' fault.
+        """
+        import requests
+        from k8spackage.download import TRANSFER_ERRORS
+        from k8spackage.mirrors import mirror_scoreboard
+        cache = blob_cache()
+        digest = self.content.get('digest')
+        if cache is not None and digest in cache:
+            try:
+                return self._extract_stream(dest, tarball)
+            except InvalidDigest:
+                cache.invalidate(digest)
+        scoreboard = mirror_scoreboard()
+        errors = {}
+        for url in scoreboard.order(self.content_source['urls']):
+            try:
+                return self._extract_stream(dest, tarball, url)
+            except requests.exceptions.RequestException as exc:
+                # failed to open: already recorded by MirrorFetcher.open
+                errors[url] = str(exc)
+            except TRANSFER_ERRORS + (InvalidDigest, ) as exc:
+                # stream interrupted (urllib3 errors from resp.raw) or corrupted
+                scoreboard.failure(url)
+                errors[url] = str(exc)
+            logger.warning("mirror %s failed: %s" % (url, errors[url]))
+        raise MirrorsUnavailable("%s: no mirror returned the content" % self.name, errors)
+
+    def _extract_stream(self, dest=".", tarball=True, url=None):
+        """
+        Stream the content to 'dest' and verify its digest on the fly. It's written to a
+        temporary directory in 'dest', moved in place once the digest matched.
+        """
+        mkdir_p(dest)
+        staging = tempfile.mkdtemp(dir=dest, prefix=".tmp-")
+        if tarball:
+            filename = self._filename() + (self.content_codec or get_codec()).extension
+            dest = os.path.join(dest, filename)
+        digest = self.content.get('digest')
+        cache, tmppath = None, None
+        verified = False
+        try:
+            stream, cached = self._open_content(url)
+            cache = blob_cache() if not cached else None
+            tmpfile, tmppath = cache.tmpfile() if cache is not None else (None, None)
+            reader = HashingReader(stream, tee=tmpfile)
+            try:
+                if tarball:
+                    with open(os.path.join(staging, filename), "wb") as destfile:
+                        shutil.copyfileobj(reader, destfile, CHUNK_SIZE)
+                else:
+                    try:
+                        unpack_stream(reader, staging, self.content_codec)
+                    except Exception:
+                        # corrupted content doesn't decompress: the digest tells it apart
+                        reader.drain()
+                        if not digest or reader.digest == digest:
+                            raise
+                    else:
+                        reader.drain()
+            finally:
+                reader.close()
+                if tmpfile is not None:
+                    tmpfile.close()
+
+            if digest and reader.digest != digest:
+                raise InvalidDigest("%s: content digest %s != %s" %
+                                    (self.name, reader.digest, digest),
+                                    {'expected': digest, 'digest': reader.digest})
+            if tarball:
+                os.rename(os.path.join(staging, filename), dest)
+            else:
+                move_tree(staging, dest)
+            verified = True
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            if tmppath and not verified:
+                cache.discard(tmppath)
+        if tmppath:
+            cache.commit(tmppath, reader.digest)
+        return dest
+
     def extract(self, dest=".", tarball=True):
+        if self._k8spackage_package is None and 'urls' in self.content_source:
+            return self._extract_urls(dest, tarball)
+        if self._k8spackage_package is None and self.content_source:
+            return self._extract_stream(dest, tarball)
         k8spackage_package = self.k8spackage_package
         if not tarball:
             k8spackage_package.extract(dest)
         else:
             mkdir_p(dest)
-            dest = os.path.join(dest, self._filename() + ".tar.gz")
+            dest = os.path.join(dest, self._filename() + k8spackage_package.codec.extension)
             k8spackage_package.pack(dest)
         return dest
 
     @classmethod
     def get(cls, name, namespace='default'):
-        return cls.load(json.loads(kubectl.get(cls.crd_plural, name, namespace, ["-o", "json"])))
+        return cls.load(get_backend().get(cls, name, namespace))
 
     @classmethod
     def delete(cls, name, namespace='default'):
-        return kubectl.delete(cls.crd_plural, name, namespace)
+        return get_backend().delete(cls, name, namespace)
 
     @classmethod
-    def list(cls, name=None, namespace='default', output='text', filters=None, opts=None):
-        if not opts:
-            opts = []
-        if not filters:
-            filters = {}
+    def format_columns(cls, items):
+        """ Table of the 'columns' fields, like kubectl's custom-columns output """
+
+        def _field(item, path):
+            if isinstance(item, PackageRecord):
+                value = item.field(path)
+                return "<none>" if value is None else str(value)
+            for key in path.split("."):
+                if not isinstance(item, dict) or key not in item:
+                    return "<none>"
+                item = item[key]
+            return str(item)
+
+        rows = [[k.upper() for k, _ in cls.columns]]
+        for item in items:
+            rows.append([_field(item, path) for _, path in cls.columns])
+        widths = [max([len(row[i]) for row in rows]) for i in range(len(cls.columns))]
+        lines = []
+        for row in rows:
+            cells = [cell.ljust(width) for cell, width in zip(row, widths)]
+            lines.append("   ".join(cells).rstrip())
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def _selector(cls, filters):
         labels = []
-        for k, v in filters.items():
+        for k, v in (filters or {}).items():
             labels.append("%s=%s" % (k, v))
+        return ','.join(labels)
 
-        opts += ['-l', ','.join(labels)]
-        if name:
-            opts.append(name)
+    @classmethod
+    def _iter_items(cls, namespace='default', filters=None, limit=500, metadata_only=False,
+                    opts=None):
+        pages = get_backend().list_pages(cls, namespace, cls._selector(filters), limit,
+                                         metadata_only=metadata_only, opts=opts)
+        for page in pages:
+            for item in page:
+                yield item
 
-        if output == 'text':
-            opts = opts + [
-                '-o',
-                'custom-columns=%s' % ','.join(["%s:%s" % (k.upper(), v) for k, v in cls.columns])
-            ]
-        else:
-            opts = opts + ['-o', output]
-        res = kubectl.list(cls.crd_plural, namespace, opts)
-        if output == "yaml":
-            return yaml.load(res)
-        elif output == "json":
-            return json.loads(res)
+    @classmethod
+    def iter_list(cls, namespace='default', filters=None, limit=500, metadata_only=False,
+                  opts=None):
+        """
+        Generator of PackageCr, fetched 'limit' items at a time
+        metadata_only: leave spec.content.source out of the transfer, only the 'columns' are set
+        """
+        for item in cls._iter_items(namespace, filters, limit, metadata_only, opts):
+            yield cls.load(item)
+
+    @classmethod
+    def iter_records(cls, namespace='default', filters=None, limit=500, opts=None):
+        """ Generator of PackageRecord, from a metadata-only listing """
+        for item in cls._iter_items(namespace, filters, limit, metadata_only=True, opts=opts):
+            yield PackageRecord.from_resource(item)
+
+    @classmethod
+    def list(cls, name=None, namespace='default', output='text', filters=None, opts=None):
+        backend = get_backend()
+        if name:
+            res = backend.get(cls, name, namespace)
+            items = [res]
+        elif output in ["yaml", "json"]:
+            res = backend.list(cls, namespace, cls._selector(filters), opts)
         else:
+            items = cls.iter_records(namespace, filters, opts=opts)
+        if output in ["yaml", "json"]:
             return res
+        else:
+            return cls.format_columns(items)
+
+    @classmethod
+    def informer(cls, namespace='default', filters=None, **kwargs):
+        """ Informer keeping a watch-driven cache of the namespace Packages, see Informer """
+        from k8spackage.informer import Informer
+        return Informer(cls, namespace, cls._selector(filters), **kwargs)
+
+    @classmethod
+    def publish(cls, items, namespace='default', workers=8, batch_size=100, force=False,
+                validate=True):
+        """
+        Create or update the Packages of 'items', skipping the ones already published
+        validate: check all the items first, nothing is applied if one of them is invalid
+        """
+        if validate:
+            validate_resources(items)
+        from k8spackage.publish import Publisher
+        publisher = Publisher(cls, namespace, workers=workers, batch_size=batch_size, force=force)
+        return publisher.publish(items)
 
     @classmethod
     def find(cls, filters, namespace="default"):
-        results = cls.list(filters=filters, output='json', namespace=namespace)
-        if not results['items']:
+        return next(cls.iter_list(namespace, filters, limit=1), None)
+
+    @classmethod
+    def find_digest(cls, digest, namespace="default"):
+        """ Resolve a full or partial content digest with the local PackageIndex """
+        import requests
+        from k8spackage.index import PackageIndex
+        index = PackageIndex(cls, namespace)
+        name = index.find_digest(digest)
+        if name is not None:
+            try:
+                package = cls.get(name, namespace)
+                if package.content['digest'].startswith(digest):
+                    return package
+            except (requests.exceptions.HTTPError, subprocess.CalledProcessError):
+                pass
+        if index.refreshed:
+            return None  # the index was just refreshed, it's not outdated
+        # unknown or outdated entry: refresh the index once
+        index.refresh(force=True)
+        name = index.find_digest(digest)
+        if name is None:
             return None
+        return cls.get(name, namespace)
+
+
+class PackageChunkCr(CrdModel):
+    kind = "PackageChunk"
+    crd_plural = 'packagechunks'
+    crd_group = 'manifest.k8s.io'
+    crd_version = 'v1alpha1'
+    crd_spec = LazySpec("packagechunk.crd.yaml")
+
+    def _filename(self):
+        return self.name
+
+
+def validate_resources(resources):
+    """
+    Validate a List, or a list of resources, against the CRD schemas. Every error of every
+    item is collected before raising InvalidResource. Kinds other than the k8spackage ones
+    are not checked.
+    """
+    if isinstance(resources, dict):
+        if resources.get('kind', "").endswith("List"):
+            resources = resources.get('items', [])
         else:
-            return cls.load(results['items'][0])
+            resources = [resources]
+    models = dict([(model.kind, model) for model in [DescriptorCr, PackageCr, PackageChunkCr]])
+    errors = []
+    invalid = 0
+    for i, resource in enumerate(resources):
+        model = models.get(resource.get('kind'))
+        if model is None:
+            continue
+        name = resource.get('metadata', {}).get('name')
+        resource_errors = model.resource_errors(resource)
+        if resource_errors:
+            invalid += 1
+            errors.extend(["items[%d] %s %s: %s" % (i, model.kind, name, error)
+                           for error in resource_errors])
+    if errors:
+        raise InvalidResource("%d invalid resources out of %d:\n%s" %
+                              (invalid, len(resources), "\n".join(errors)),
+                              {'invalid': invalid, 'errors': errors})
+    return True
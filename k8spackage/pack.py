@@ -2,84 +2,518 @@ from __future__ import absolute_import, division, print_function
 
 import base64
 import hashlib
+from collections import OrderedDict
+from contextlib import closing
 import io
 import os
+import shutil
 import tarfile
+import tempfile
 
-import pathspec
+from k8spackage.compression import get_codec, detect_codec
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+IGNORE_FILES = ['.helmignore', '.k8spackageignore', '.kpmignore', '.packageignore']
+DEFAULT_IGNORE_PATTERNS = ['.git/']
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 32 * 1024 * 1024
 
 
 def ignore(pattern, path):
+    import pathspec
     spec = pathspec.PathSpec.from_lines('gitwildmatch', pattern.splitlines())
     return spec.match_file(path)
 
 
-def all_files(srcpath="."):
-    files = []
+class IgnoreMatcher(object):
+    """ Ignore rules of a source tree, compiled once and reused for every path """
+
+    def __init__(self, patterns=None):
+        import pathspec  # only packing needs it, not reading packages
+        self.patterns = list(DEFAULT_IGNORE_PATTERNS)
+        if patterns:
+            self.patterns.extend(patterns)
+        self.spec = pathspec.PathSpec.from_lines('gitwildmatch', self.patterns)
 
-    ignore_patterns = ['.git/']  # defaults
-    for filename in ['.helmignore', '.k8spackageignore', '.kpmignore', '.packageignore']:
-        filename = os.path.join(srcpath, filename)
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                ignore_patterns.append(f.read())
+    @classmethod
+    def from_srcpath(cls, srcpath="."):
+        patterns = []
+        for filename in IGNORE_FILES:
+            filename = os.path.join(srcpath, filename)
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    patterns = f.read().splitlines()
                 break  # allow only one file
-    ignore_patterns_str = '\n'.join(ignore_patterns)
-    for root, _, filenames in os.walk(srcpath):
+        return cls(patterns)
+
+    def match(self, path):
+        return self.spec.match_file(path)
+
+    def match_dir(self, path):
+        # a trailing slash lets directory-only patterns ('node_modules/') match
+        return self.spec.match_file(path.rstrip("/") + "/")
+
+
+def _relpath(root, filename):
+    return os.path.join(root, filename).replace("./", "")
+
+
+def all_files(srcpath=".", matcher=None):
+    files = []
+    if matcher is None:
+        matcher = IgnoreMatcher.from_srcpath(srcpath)
+
+    for root, dirnames, filenames in os.walk(srcpath):
+        # prune ignored directories in place so os.walk never descends into them
+        dirnames[:] = [d for d in dirnames if not matcher.match_dir(_relpath(root, d))]
         for filename in filenames:
-            path = os.path.join(root, filename)
-            path = path.replace("./", "")
-            if not ignore_patterns_str or not ignore(ignore_patterns_str, path):
+            path = _relpath(root, filename)
+            if not matcher.match(path):
                 files.append(path)
 
     return files
 
 
-def pack_kub(kub, prefix=None, srcpath="."):
-    tar = tarfile.open(kub, "w:gz")
+class DigestWriter(object):
+    """ Write-only file object computing the sha256, size and base64 encoding in one pass """
+
+    def __init__(self, encode=True, codec=None):
+        """
+        encode: keep the base64 encoding, digest and size only when False
+        codec: Codec of the tarball written, gzip by default
+        """
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.encode = encode
+        self.codec = get_codec(codec)
+        self._b64chunks = []
+        self._pending = b""
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        if not self.encode:
+            return len(data)
+        # base64 works on 3-bytes groups, keep the remainder for the next write
+        buf = self._pending + data
+        cut = len(buf) - len(buf) % 3
+        self._b64chunks.append(base64.b64encode(buf[:cut]))
+        self._pending = buf[cut:]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def digest(self):
+        return self.sha256.hexdigest()
+
+    @property
+    def b64blob(self):
+        if self._pending:
+            self._b64chunks.append(base64.b64encode(self._pending))
+            self._pending = b""
+        return b"".join(self._b64chunks)
+
+
+class HashingReader(object):
+    """ Read-only file object computing the sha256 and size of what is read through it """
+
+    def __init__(self, fileobj, tee=None):
+        self.fileobj = fileobj
+        self.tee = tee
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.fileobj.read()
+        else:
+            data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        return data
+
+    def drain(self):
+        """ Read what's left, e.g. the tar padding, to complete the digest """
+        while self.read(CHUNK_SIZE):
+            pass
+
+    def close(self):
+        self.fileobj.close()
+
+    @property
+    def digest(self):
+        return self.sha256.hexdigest()
+
+
+def reproducible_tarinfo(tarinfo):
+    """ tar.add filter dropping the metadata which changes from one checkout/build to another """
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    tarinfo.mtime = int(os.getenv("SOURCE_DATE_EPOCH", 0))
+    if tarinfo.isdir() or tarinfo.mode & 0o111:
+        tarinfo.mode = 0o755
+    else:
+        tarinfo.mode = 0o644
+    return tarinfo
+
+
+def pack_kub(kub, prefix=None, srcpath=".", fileobj=None, reproducible=False, codec=None,
+             level=None, threads=1):
+    """
+    Create the compressed tarball 'kub', or stream it to 'fileobj' when it's set
+    reproducible: sorted entries, normalized metadata and a fixed compression header,
+                  the same tree always gives the same bytes
+    codec: 'gzip' (default), 'zstd' or 'xz', compressed at 'level'
+    threads: compress on several cores (gzip and zstd), the output is still a standard stream
+    """
+    codec = get_codec(codec)
+    compressed = None
+    if reproducible or threads > 1 or codec.tar_mode is None:
+        output = fileobj if fileobj is not None else open(kub, "wb")
+        compressed = codec.writer(output, level, threads)
+        tar_format = tarfile.GNU_FORMAT if reproducible else tarfile.DEFAULT_FORMAT
+        tar = tarfile.open(mode="w", fileobj=compressed, format=tar_format)
+    else:
+        tar = tarfile.open(kub, "w:%s" % codec.tar_mode, fileobj=fileobj,
+                           **codec.tar_options(level))
 
     os.stat(srcpath)
     files = all_files(srcpath)
+    if reproducible:
+        files.sort()
     for filepath in files:
         arcname = None
         if prefix:
             arcname = os.path.join(prefix, filepath)
-        tar.add(filepath, arcname=arcname)
+        tar.add(filepath, arcname=arcname, filter=reproducible_tarinfo if reproducible else None)
 
     tar.close()
+    if compressed is not None:
+        compressed.close()
+        if fileobj is None:
+            output.close()
+
+
+def open_tar(fileobj, codec=None, stream=False):
+    """
+    Open a compressed tarball for reading, the codec is detected when not given
+    stream: sequential reads only, e.g. from a HTTP response
+    """
+    if codec is None:
+        header = fileobj.read(8)
+        codec = detect_codec(header)
+        fileobj = PrefixedReader(header, fileobj)
+    codec = get_codec(codec)
+    if stream:
+        return tarfile.open(fileobj=codec.reader(fileobj), mode="r|")
+    if codec.tar_mode is not None:
+        return tarfile.open(fileobj=fileobj, mode="r:%s" % codec.tar_mode)
+    # random access on a decompressor without seek support: spool it, in memory if small
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    shutil.copyfileobj(codec.reader(fileobj), spool, CHUNK_SIZE)
+    spool.seek(0)
+    return tarfile.open(fileobj=spool, mode="r:")
 
 
-def unpack_kub(kub, dest="."):
-    tar = tarfile.open(kub, "r:gz")
+def unpack_kub(kub, dest=".", codec=None):
+    with open(kub, "rb") as kubfile:
+        tar = open_tar(kubfile, codec, stream=True)
+        tar.extractall(dest)
+        tar.close()
+
+
+def unpack_stream(fileobj, dest=".", codec=None):
+    """ Extract a tarball read sequentially from 'fileobj', without seeking or buffering it """
+    tar = open_tar(fileobj, codec, stream=True)
     tar.extractall(dest)
     tar.close()
 
 
+def _member_data(tar, member):
+    if not member.isfile():
+        return None
+    return tar.extractfile(member).read()
+
+
+def _same_member(tar, member, base_tar, base_member):
+    if member.tobuf(tarfile.GNU_FORMAT) != base_member.tobuf(tarfile.GNU_FORMAT):
+        return False
+    return _member_data(tar, member) == _member_data(base_tar, base_member)
+
+
+def tar_delta(base_tar, tar, fileobj, codec=None, level=None):
+    """
+    Write to 'fileobj' a tarball of the 'tar' members missing from or different in 'base_tar'.
+    Returns the names of the 'base_tar' members 'tar' doesn't have.
+    """
+    base_members = dict([(member.name, member) for member in base_tar.getmembers()])
+    names = set()
+    compressed = get_codec(codec).writer(fileobj, level)
+    delta = tarfile.open(mode="w", fileobj=compressed, format=tarfile.GNU_FORMAT)
+    for member in tar.getmembers():
+        names.add(member.name)
+        base_member = base_members.get(member.name)
+        if base_member is None or not _same_member(tar, member, base_tar, base_member):
+            data = _member_data(tar, member)
+            delta.addfile(member, io.BytesIO(data) if data is not None else None)
+    delta.close()
+    compressed.close()
+    return sorted([name for name in base_members if name not in names])
+
+
+def apply_tar_delta(base_tar, delta_tar, removed, fileobj, codec=None, level=None):
+    """
+    Write to 'fileobj' the reproducible tarball made of the 'base_tar' members, minus the
+    'removed' ones, replaced or completed by the 'delta_tar' members, sorted by name.
+    """
+    removed = set(removed)
+    sources = dict([(member.name, (base_tar, member)) for member in base_tar.getmembers()
+                    if member.name not in removed])
+    sources.update([(member.name, (delta_tar, member)) for member in delta_tar.getmembers()])
+    compressed = get_codec(codec).writer(fileobj, level)
+    tar = tarfile.open(mode="w", fileobj=compressed, format=tarfile.GNU_FORMAT)
+    for name in sorted(sources):
+        source, member = sources[name]
+        data = _member_data(source, member)
+        tar.addfile(member, io.BytesIO(data) if data is not None else None)
+    tar.close()
+    compressed.close()
+
+
+class PrefixedReader(object):
+    """ Puts back the bytes already read from the head of a non-seekable file object """
+
+    def __init__(self, prefix, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileobj.read(size)
+        if size is None or size < 0:
+            data = self.prefix + self.fileobj.read()
+        elif size <= len(self.prefix):
+            data = self.prefix[:size]
+        else:
+            data = self.prefix + self.fileobj.read(size - len(self.prefix))
+        self.prefix = self.prefix[len(data):]
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+class ArchiveIndex(Mapping):
+    """
+    Read-only {filename: content} view of an opened tarball.
+    Only the member index (name, offset, size) is built on load; file bodies are
+    decompressed on first access and the most recently read ones are kept in a LRU.
+    """
+
+    def __init__(self, tar, cache_size=32):
+        self.tar = tar
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.members = OrderedDict()
+        for member in tar.getmembers():
+            if member.isfile() or member.issym() or member.islnk():
+                self.members[member.name] = member
+
+    def entry(self, filename):
+        member = self.members[filename]
+        return (member.name, member.offset_data, member.size)
+
+    def __getitem__(self, filename):
+        if filename in self._cache:
+            content = self._cache.pop(filename)
+        else:
+            content = self.tar.extractfile(self.members[filename]).read()
+        self._cache[filename] = content
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return content
+
+    def __contains__(self, filename):
+        return filename in self.members
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+
+class Base64Reader(object):
+    """
+    Seekable read-only file object decoding a base64 string 'chunk_size' characters at a time,
+    the decoded content is never held in memory as a whole
+    """
+
+    def __init__(self, b64data, chunk_size=CHUNK_SIZE):
+        if not isinstance(b64data, bytes):
+            b64data = b64data.encode('ascii')
+        self.b64data = b64data
+        self.chunk_size = chunk_size - chunk_size % 4
+        self._size = None
+        self.rewind()
+
+    def rewind(self):
+        self._offset = 0
+        self._pending = b""
+        self._buffer = b""
+        self.pos = 0
+
+    def _fill(self):
+        """ Decode the next chunk into the buffer, returns False once everything is decoded """
+        if self._offset >= len(self.b64data):
+            if self._pending:
+                self._buffer += base64.b64decode(self._pending + b"=" * (-len(self._pending) % 4))
+                self._pending = b""
+                return True
+            return False
+        chunk = self.b64data[self._offset:self._offset + self.chunk_size]
+        self._offset += len(chunk)
+        chunk = self._pending + b"".join(chunk.split())
+        cut = len(chunk) - len(chunk) % 4
+        self._buffer += base64.b64decode(chunk[:cut])
+        self._pending = chunk[cut:]
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            size = len(self._buffer)
+        while len(self._buffer) < size and self._fill():
+            pass
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.pos += len(data)
+        return data
+
+    @property
+    def size(self):
+        if self._size is None:
+            length = len(self.b64data)
+            for char in [b" ", b"\n", b"\r", b"\t"]:
+                length -= self.b64data.count(char)
+            tail = b"".join(self.b64data[-8:].split())
+            self._size = length * 3 // 4 - (len(tail) - len(tail.rstrip(b"=")))
+        return self._size
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < self.pos:
+            self.rewind()
+        while self.pos < offset:
+            if not self.read(min(CHUNK_SIZE, offset - self.pos)):
+                break
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+
 class K8spackagePackage(object):
-    def __init__(self, blob=None, b64_encoded=True):
+    def __init__(self, blob=None, b64_encoded=True, lazy=False, codec=None, opener=None):
+        """
+        codec: compression of the tarball, detected from its header when not set
+        opener: callable returning a new seekable file object on the tarball, used instead of
+                'blob' when the content is assembled from elsewhere (e.g. chunks)
+        """
+        self.lazy = lazy
+        self.codec = get_codec(codec) if codec is not None else None
         self.files = {}
         self.tar = None
-        self.blob = None
         self.io_file = None
+        self._blob = None
+        self._b64blob = None
         self._digest = None
         self._size = None
-        self.b64blob = None
-        if blob is not None:
+        self._opener = None
+        if opener is not None:
+            self.load_opener(opener)
+        elif blob is not None:
             self.load(blob, b64_encoded)
 
+    @property
+    def blob(self):
+        if self._blob is None and self._b64blob is not None:
+            self._blob = base64.b64decode(self._b64blob)
+        elif self._blob is None and self._opener is not None:
+            with closing(self._opener()) as fileobj:
+                self._blob = fileobj.read()
+        return self._blob
+
+    @property
+    def b64blob(self):
+        if self._b64blob is None and self.blob is not None:
+            self._b64blob = base64.b64encode(self._blob)
+        return self._b64blob
+
+    def _open(self):
+        """ New file object on the raw tarball, independent of the one used by 'tar' """
+        if self._blob is not None:
+            return io.BytesIO(self._blob)
+        if self._opener is not None:
+            return self._opener()
+        return Base64Reader(self._b64blob)
+
     def _load_blob(self, blob, b64_encoded):
+        # only one form is kept, the other is computed on demand
         if b64_encoded:
-            self.b64blob = blob
-            self.blob = base64.b64decode(blob)
+            # encoded once, the readers of _open() share the bytes instead of copying them
+            self._b64blob = blob.encode('ascii') if not isinstance(blob, bytes) else blob
+            self._blob = None
         else:
-            self.b64blob = base64.b64encode(blob)
-            self.blob = blob
+            self._b64blob = None
+            self._blob = blob
 
     def load(self, blob, b64_encoded=True):
-        self._digest = None
+        self._opener = None
         self._load_blob(blob, b64_encoded)
-        self.io_file = io.BytesIO(self.blob)
-        self.tar = tarfile.open(fileobj=self.io_file, mode='r:gz')
+        self._load()
+
+    def load_opener(self, opener):
+        self._blob = None
+        self._b64blob = None
+        self._opener = opener
+        self._load()
+
+    def _load(self):
+        self._digest = None
+        self._size = None
+        if self.io_file is not None:
+            self.io_file.close()  # of the previous content
+        self.io_file = self._open()
+        if self.codec is None:
+            self.codec = detect_codec(self.io_file.read(8))
+            self.io_file.seek(0)
+        self.tar = open_tar(self.io_file, self.codec)
+        if self.lazy:
+            self.files = ArchiveIndex(self.tar)
+            return
         for member in self.tar.getmembers():
             tfile = self.tar.extractfile(member)
             if tfile is not None:
@@ -89,8 +523,8 @@ class K8spackagePackage(object):
         self.tar.extractall(dest)
 
     def pack(self, dest):
-        with open(dest, "wb") as destfile:
-            destfile.write(self.blob)
+        with closing(self._open()) as source, open(dest, "wb") as destfile:
+            shutil.copyfileobj(source, destfile, CHUNK_SIZE)
 
     def tree(self, directory=None):
         files = list(self.files.keys())
@@ -116,12 +550,20 @@ class K8spackagePackage(object):
     @property
     def size(self):
         if self._size is None:
-            self.io_file.seek(0, os.SEEK_END)
-            self._size = self.io_file.tell()
+            if self._blob is not None:
+                self._size = len(self._blob)
+            elif self._opener is not None:
+                with closing(self._opener()) as fileobj:
+                    fileobj.seek(0, 2)
+                    self._size = fileobj.tell()
+            else:
+                self._size = Base64Reader(self._b64blob).size
         return self._size
 
     @property
     def digest(self):
         if self._digest is None:
-            self._digest = hashlib.sha256(self.blob).hexdigest()
+            with closing(HashingReader(self._open())) as reader:
+                reader.drain()
+            self._digest = reader.digest
         return self._digest
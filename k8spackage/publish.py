@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function
+
+import logging
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from k8spackage.kubeclient import get_backend
+
+logger = logging.getLogger('k8s_events')
+
+
+class Publisher(object):
+    """
+    Create or update resources with server-side apply, 'workers' at a time and
+    'batch_size' objects per batch. Objects whose content digest already matches
+    the cluster are skipped.
+    """
+
+    def __init__(self, model, namespace="default", workers=8, batch_size=100, force=False,
+                 backend=None):
+        self.model = model
+        self.namespace = namespace
+        self.workers = workers
+        self.batch_size = batch_size
+        self.force = force
+        self.backend = backend or get_backend()
+
+    def cluster_digests(self):
+        """ {name: digest} of the resources already in the namespace, without their content """
+        digests = {}
+        for page in self.backend.list_pages(self.model, self.namespace, metadata_only=True):
+            for item in page:
+                digests[item['metadata']['name']] = _digest(item)
+        return digests
+
+    def _apply(self, item):
+        start = time.time()
+        result = {'name': item['metadata']['name'], 'status': 'applied'}
+        try:
+            self.backend.apply(self.model, item, self.namespace)
+        except (requests.exceptions.RequestException, subprocess.CalledProcessError) as exc:
+            result['status'] = 'failed'
+            result['error'] = str(getattr(exc, 'output', None) or exc)
+        result['seconds'] = round(time.time() - start, 3)
+        return result
+
+    def publish(self, items):
+        """ [{'name', 'status': created|updated|skipped|failed, 'seconds'}], in 'items' order """
+        start = time.time()
+        existing = self.cluster_digests()
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i in range(0, len(items), self.batch_size):
+                batch = items[i:i + self.batch_size]
+                futures = []
+                for item in batch:
+                    name = item['metadata']['name']
+                    if not self.force and name in existing and existing[name] == _digest(item):
+                        futures.append(None)
+                    else:
+                        futures.append(executor.submit(self._apply, item))
+                for item, future in zip(batch, futures):
+                    name = item['metadata']['name']
+                    if future is None:
+                        results.append({'name': name, 'status': 'skipped', 'seconds': 0})
+                        continue
+                    result = future.result()
+                    if result['status'] == 'applied':
+                        result['status'] = 'updated' if name in existing else 'created'
+                    results.append(result)
+                logger.info("publish: %d/%d" % (len(results), len(items)))
+
+        elapsed = time.time() - start
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        logger.info("publish: %d objects in %.2fs %s" % (len(results), elapsed, counts))
+        return results
+
+
+def _digest(item):
+    return item.get('spec', {}).get('content', {}).get('digest')
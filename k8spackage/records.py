@@ -0,0 +1,106 @@
+from __future__ import absolute_import, division, print_function
+
+try:
+    from sys import intern
+except ImportError:
+    pass  # builtin on python 2
+
+
+def intern_str(value):
+    """ Shared copy of a string repeated across records: media types, package names, formats """
+    try:
+        return intern(value)
+    except TypeError:  # None, or unicode on python 2
+        return value
+
+
+class PackageRecord(object):
+    """
+    Compact metadata of a Package for bulk operations (index import, listing, diffing):
+    no per-object dict, the common strings are interned. The full resource is built
+    only when it's rendered, see PackageCr.render_record.
+
+    chart: helm index entry of the release, the descriptor fields are read from it
+    resource: the resource the record was read from, rendered as is
+    """
+    __slots__ = ('name', 'package_name', 'version', 'media_type', 'digest', 'size', 'format',
+                 'source', 'created', 'chart', 'resource', 'resource_version')
+
+    # dotted resource path of the fields, for the listing columns
+    fields = {
+        'metadata.name': 'name',
+        'metadata.resourceVersion': 'resource_version',
+        'spec.packageName': 'package_name',
+        'spec.packageVersion': 'version',
+        'spec.mediaType': 'media_type',
+        'spec.created': 'created',
+        'spec.content.digest': 'digest',
+        'spec.content.size': 'size',
+        'spec.content.format': 'format',
+    }
+
+    def __init__(self, package_name, version, media_type, digest=None, size=None,
+                 content_format=None, source=None, created=None, chart=None, resource=None,
+                 resource_version=None, name=None):
+        self.package_name = intern_str(package_name)
+        self.version = version
+        self.media_type = intern_str(media_type)
+        self.name = name or "%s.%s" % (package_name, version)
+        self.digest = digest
+        self.size = size
+        self.format = intern_str(content_format)
+        self.source = source
+        self.created = created
+        self.chart = chart
+        self.resource = resource
+        self.resource_version = resource_version
+
+    @classmethod
+    def from_resource(cls, resource, keep=False):
+        """ keep: reference 'resource' to render it as is, e.g. a previous import output """
+        spec = resource.get('spec', {})
+        content = spec.get('content') or {}
+        metadata = resource.get('metadata', {})
+        return cls(spec.get('packageName'), spec.get('packageVersion'), spec.get('mediaType'),
+                   content.get('digest'), content.get('size'), content.get('format'),
+                   content.get('source'), spec.get('created'),
+                   resource=resource if keep else None,
+                   resource_version=metadata.get('resourceVersion'), name=metadata.get('name'))
+
+    @classmethod
+    def from_entry(cls, name, entry):
+        """ Record of a PackageIndex entry """
+        return cls(entry.get('packageName'), entry.get('packageVersion'), entry.get('mediaType'),
+                   entry.get('digest'), resource_version=entry.get('resourceVersion'), name=name)
+
+    def to_entry(self):
+        return {
+            'packageName': self.package_name,
+            'packageVersion': self.version,
+            'mediaType': self.media_type,
+            'digest': self.digest,
+            'resourceVersion': self.resource_version
+        }
+
+    @property
+    def key(self):
+        return (self.package_name, self.version)
+
+    @property
+    def content(self):
+        if self.digest is None:
+            return None
+        content = {'digest': self.digest, 'size': self.size, 'source': self.source}
+        if self.format is not None:
+            content['format'] = self.format
+        return content
+
+    def field(self, path):
+        """ Value of the dotted resource path 'path', None if it's not recorded """
+        attr = self.fields.get(path)
+        if attr is None:
+            return None
+        return getattr(self, attr)
+
+    def __repr__(self):
+        return "<PackageRecord %s %s %s>" % (self.name, self.media_type, self.digest)
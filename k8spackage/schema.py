@@ -0,0 +1,330 @@
+from __future__ import absolute_import, division, print_function
+
+import errno
+import hashlib
+import logging
+import operator
+import os
+import re
+import tempfile
+
+from k8spackage.exception import InvalidResource
+from k8spackage.serialization import load_json, dump_json, load_yaml
+from k8spackage.utils import mkdir_p
+
+logger = logging.getLogger('k8s_events')
+
+DEFAULT_SCHEMA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".k8spackage", "cache",
+                                        "schemas")
+# value of a missing spec field, by openAPIV3Schema type
+TYPE_DEFAULTS = {'array': [], 'object': {}}
+
+try:
+    STRING_TYPES = (str, unicode)  # noqa: F821
+    INTEGER_TYPES = (int, long)  # noqa: F821
+except NameError:
+    STRING_TYPES = (str, )
+    INTEGER_TYPES = (int, )
+
+# python types of the openAPIV3Schema types, bool is excluded from integer and number
+PYTHON_TYPES = {
+    'string': STRING_TYPES,
+    'integer': INTEGER_TYPES,
+    'number': INTEGER_TYPES + (float, ),
+    'boolean': (bool, ),
+    'array': (list, tuple),
+    'object': (dict, ),
+}
+
+
+class SchemaError(object):
+    """ Violation found by a compiled validator: where, which keyword ('validator'), what """
+    __slots__ = ('path', 'validator', 'message')
+
+    def __init__(self, path, validator, message):
+        self.path = path
+        self.validator = validator
+        self.message = message
+
+    def __str__(self):
+        return "%s: %s" % (self.path, self.message)
+
+    def __repr__(self):
+        return "SchemaError(%r, %r, %r)" % (self.path, self.validator, self.message)
+
+
+def _type_name(value):
+    for name in ['boolean', 'integer', 'number', 'string', 'array', 'object']:
+        if isinstance(value, PYTHON_TYPES[name]):
+            return name
+    return "null" if value is None else type(value).__name__
+
+
+def _compile_type(type_name, nullable):
+    types = PYTHON_TYPES[type_name]
+    numeric = type_name in ('integer', 'number')
+
+    def check_type(value, path, errors):
+        if isinstance(value, types) and not (numeric and isinstance(value, bool)):
+            return True
+        if value is None and nullable:
+            return False  # valid, but nothing else to check
+        errors.append(SchemaError(path, 'type', "must be of type %s, got %s" %
+                                  (type_name, _type_name(value))))
+        return False
+
+    return check_type
+
+
+def _compile_properties(properties, required, additional):
+    children = [(name, "." + name, compile_validator(prop))
+                for name, prop in properties.items()]
+    if isinstance(additional, dict):
+        additional = compile_validator(additional)
+    known = set(properties)
+
+    def check_properties(value, path, errors):
+        for name in required:
+            if name not in value:
+                errors.append(SchemaError("%s.%s" % (path, name), 'required',
+                                          "required field is missing"))
+        for name, suffix, validator in children:
+            if name in value:
+                validator(value[name], path + suffix, errors)
+        if additional is False:
+            for name in value:
+                if name not in known:
+                    errors.append(SchemaError("%s.%s" % (path, name), 'additionalProperties',
+                                              "unknown field"))
+        elif additional is not True:
+            for name in value:
+                if name not in known:
+                    additional(value[name], "%s.%s" % (path, name), errors)
+
+    return check_properties
+
+
+def _compile_items(items):
+    validator = compile_validator(items)
+
+    def check_items(value, path, errors):
+        for i, item in enumerate(value):
+            validator(item, "%s[%d]" % (path, i), errors)
+
+    return check_items
+
+
+def _compile_bounds(schema):
+    """
+    (keyword, check, message) of enum, pattern, minimum/maximum, min/maxLength, min/maxItems
+    and min/maxProperties
+    """
+    checks = []
+    if 'enum' in schema:
+        enum = schema['enum']
+        checks.append(('enum', lambda value: value in enum, "must be one of %s" % enum))
+    if 'pattern' in schema:
+        regex = re.compile(schema['pattern'])
+        checks.append(('pattern', lambda value: regex.search(value) is not None,
+                       "must match the pattern %s" % schema['pattern']))
+    for key, compare in [('minLength', operator.ge), ('maxLength', operator.le),
+                         ('minItems', operator.ge), ('maxItems', operator.le),
+                         ('minProperties', operator.ge), ('maxProperties', operator.le)]:
+        if key in schema:
+            checks.append((key, lambda value, bound=schema[key], compare=compare:
+                           compare(len(value), bound), "%s is %s" % (key, schema[key])))
+    if 'minimum' in schema:
+        bound = schema['minimum']
+        if schema.get('exclusiveMinimum'):
+            checks.append(('minimum', lambda value: value > bound,
+                           "must be greater than %s" % bound))
+        else:
+            checks.append(('minimum', lambda value: value >= bound,
+                           "must be at least %s" % bound))
+    if 'maximum' in schema:
+        bound = schema['maximum']
+        if schema.get('exclusiveMaximum'):
+            checks.append(('maximum', lambda value: value < bound,
+                           "must be less than %s" % bound))
+        else:
+            checks.append(('maximum', lambda value: value <= bound,
+                           "must be at most %s" % bound))
+    return checks
+
+
+def _compile_combinators(schema):
+    checks = []
+    for key in ['allOf', 'anyOf', 'oneOf']:
+        if key in schema:
+            checks.append((key, [compile_validator(subschema) for subschema in schema[key]]))
+    if 'not' in schema:
+        checks.append(('not', [compile_validator(schema['not'])]))
+
+    def check_combinators(value, path, errors):
+        for key, validators in checks:
+            results = []
+            for validator in validators:
+                suberrors = []
+                validator(value, path, suberrors)
+                results.append(suberrors)
+            matches = len([suberrors for suberrors in results if not suberrors])
+            if key == 'allOf':
+                for suberrors in results:
+                    errors.extend(suberrors)
+            elif key == 'anyOf' and not matches:
+                errors.append(SchemaError(path, key, "must match at least one of the anyOf "
+                                          "schemas: %s" % "; ".join([str(r[0]) for r in results])))
+            elif key == 'oneOf' and matches != 1:
+                errors.append(SchemaError(path, key, "must match exactly one of the oneOf "
+                                          "schemas, matches %d" % matches))
+            elif key == 'not' and matches:
+                errors.append(SchemaError(path, key, "must not match the 'not' schema"))
+
+    return check_combinators
+
+
+def compile_validator(schema):
+    """
+    Compile an openAPIV3Schema into a function validator(value, path, errors), appending a
+    SchemaError per violation to 'errors'. The keywords are resolved once, here, validating
+    an object only runs the checks its schema has.
+    """
+    type_check = None
+    if 'type' in schema:
+        type_check = _compile_type(schema['type'], schema.get('nullable', False))
+    checks = []
+    bounds = _compile_bounds(schema)
+    if bounds:
+
+        def check_bounds(value, path, errors):
+            for keyword, check, message in bounds:
+                try:
+                    valid = check(value)
+                except TypeError:  # no type, or a nullable null
+                    continue
+                if not valid:
+                    errors.append(SchemaError(path, keyword, message))
+
+        checks.append(check_bounds)
+    if 'properties' in schema or 'required' in schema or 'additionalProperties' in schema:
+        check_properties = _compile_properties(schema.get('properties', {}),
+                                               schema.get('required', []),
+                                               schema.get('additionalProperties', True))
+        checks.append(lambda value, path, errors: isinstance(value, dict) and
+                      check_properties(value, path, errors))
+    if 'items' in schema:
+        check_items = _compile_items(schema['items'])
+        checks.append(lambda value, path, errors: isinstance(value, (list, tuple)) and
+                      check_items(value, path, errors))
+    if any([key in schema for key in ['allOf', 'anyOf', 'oneOf', 'not']]):
+        checks.append(_compile_combinators(schema))
+
+    if type_check is None:
+
+        def validator(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+    else:
+
+        def validator(value, path, errors):
+            if type_check(value, path, errors):
+                for check in checks:
+                    check(value, path, errors)
+
+    return validator
+
+
+class CrdSchema(dict):
+    """
+    CRD document (a dict), compiled once: the spec properties, required fields and the
+    value of each missing field are computed on load rather than on every render.
+    """
+
+    def __init__(self, crd):
+        super(CrdSchema, self).__init__(crd)
+        self.schema = self['spec']['validation']['openAPIV3Schema']
+        self.properties = self.schema.get('properties', {})
+        self.required = list(self.schema.get('required', []))
+        self.defaults = dict([(name, TYPE_DEFAULTS.get(prop.get('type'), ''))
+                              for name, prop in self.properties.items()])
+
+        self._validator = None
+
+    @property
+    def validator(self):
+        """ validator compiled from the openAPIV3Schema, on first use """
+        if self._validator is None:
+            self._validator = compile_validator(self.schema)
+        return self._validator
+
+    def schema_errors(self, spec, path="spec"):
+        """ SchemaErrors of 'spec', [] if it's valid """
+        errors = []
+        self.validator(spec, path, errors)
+        return errors
+
+    def errors(self, spec, path="spec"):
+        """ Error messages of 'spec', [] if it's valid """
+        return [str(error) for error in self.schema_errors(spec, path)]
+
+    def validate(self, spec, path="spec"):
+        errors = self.errors(spec, path)
+        if errors:
+            raise InvalidResource("%s: %s" % (path, "; ".join(errors)), {'errors': errors})
+        return True
+
+    def missing_fields(self, spec):
+        """ {field: fresh empty value} for the properties 'spec' doesn't set """
+        return dict([(name, type(value)()) for name, value in self.defaults.items()
+                     if name not in spec])
+
+
+def _cache_path(crd_path):
+    # the key changes with the file: no stale schema after an upgrade or an edit
+    stat = os.stat(crd_path)
+    key = hashlib.sha256(("%s:%s:%s" % (os.path.abspath(crd_path), stat.st_mtime,
+                                        stat.st_size)).encode('utf-8')).hexdigest()[0:16]
+    cache_dir = os.getenv("K8SPACKAGE_SCHEMA_CACHE_DIR", DEFAULT_SCHEMA_CACHE_DIR)
+    return os.path.join(cache_dir, "%s.%s.json" % (os.path.basename(crd_path), key))
+
+
+def _read_cache(path):
+    try:
+        with open(path, 'rb') as cachefile:
+            return load_json(cachefile.read())
+    except IOError as exc:
+        if exc.errno != errno.ENOENT:
+            logger.warning("schema cache: can't read %s: %s" % (path, exc))
+    except ValueError as exc:
+        logger.warning("schema cache: ignoring corrupted %s: %s" % (path, exc))
+    return None
+
+
+def _write_cache(path, crd):
+    try:
+        mkdir_p(os.path.dirname(path))
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, 'w') as tmpfile:
+            tmpfile.write(dump_json(crd))
+        os.rename(tmppath, path)
+    except (IOError, OSError) as exc:
+        # read-only home, etc: the schema is parsed again next time
+        logger.debug("schema cache: can't write %s: %s" % (path, exc))
+
+
+def load_schema(crd_path):
+    """
+    CrdSchema of the CRD file 'crd_path'. The parsed document is cached as JSON, a lot faster
+    to load than the YAML, disabled with K8SPACKAGE_CACHE=false.
+    """
+    use_cache = os.getenv("K8SPACKAGE_CACHE", "true") != "false"
+    crd = None
+    if use_cache:
+        cache_path = _cache_path(crd_path)
+        crd = _read_cache(cache_path)
+    if crd is None:
+        with open(crd_path) as crdfile:
+            crd = load_yaml(crdfile)
+        if use_cache:
+            _write_cache(cache_path, crd)
+    return CrdSchema(crd)
@@ -0,0 +1,97 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_WIDTH = 2 ** 31 - 1
+_yaml = None
+
+
+def yaml_module():
+    """
+    (yaml, SafeLoader, SafeDumper), imported on first use: the JSON-only paths don't pay for
+    it. The LibYAML C loader/dumper are 5-10x faster than the pure python ones.
+    """
+    global _yaml
+    if _yaml is None:
+        import yaml
+        try:
+            from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+        except ImportError:
+            from yaml import SafeLoader, SafeDumper
+        _yaml = (yaml, SafeLoader, SafeDumper)
+    return _yaml
+
+
+def libyaml():
+    """ PyYAML is built against LibYAML """
+    yaml, loader, _ = yaml_module()
+    return loader is not yaml.SafeLoader
+
+
+def load_yaml(stream):
+    """ Single YAML (or JSON) document from a string or a file object, safe types only """
+    yaml, loader, _ = yaml_module()
+    return yaml.load(stream, Loader=loader)
+
+
+def iter_yaml(stream):
+    """ Documents of a multi-document YAML stream ('---' separated), parsed one at a time """
+    yaml, loader, _ = yaml_module()
+    for document in yaml.load_all(stream, Loader=loader):
+        if document is not None:
+            yield document
+
+
+def iter_resources(stream):
+    """ Resources of a multi-document YAML stream, the items of 'List' documents flattened """
+    for document in iter_yaml(stream):
+        if document.get('kind', "").endswith("List"):
+            for item in document.get('items', []):
+                yield item
+        else:
+            yield document
+
+
+def dump_yaml(value, stream=None, **kwargs):
+    kwargs.setdefault('default_flow_style', False)
+    if kwargs.get('width') == float("inf"):
+        kwargs['width'] = MAX_WIDTH  # the C emitter only takes an int
+    yaml, _, dumper = yaml_module()
+    return yaml.dump(value, stream, Dumper=dumper, **kwargs)
+
+
+def load_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def dump_json(value, indent=None):
+    """ JSON text, with orjson when it's installed (indent: only 2 is supported by orjson) """
+    if orjson is not None and indent in (None, 2):
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+        except TypeError:
+            pass  # e.g. non-string keys, let json handle or report it
+    if indent:
+        return json.dumps(value, indent=indent, separators=(',', ': '))
+    return json.dumps(value, separators=(',', ':'))
+
+
+def load_file(path):
+    """ YAML or JSON file, JSON is parsed with the JSON decoder """
+    with open(path, 'rb') as sourcefile:
+        data = sourcefile.read()
+    if path.endswith(".json") or data.lstrip()[0:1] in (b"{", b"["):
+        try:
+            return load_json(data)
+        except ValueError:
+            pass  # YAML flow style
+    return load_yaml(data)
@@ -5,6 +5,12 @@ import errno
 import os
 import os.path
 import itertools
+import shutil
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
 
 
 def package_filename(name, version, media_type):
@@ -30,6 +36,21 @@ def mkdir_p(path):
             raise
 
 
+def move_tree(src, dest):
+    """ Move the content of the directory 'src' into 'dest', replacing the existing files """
+    mkdir_p(dest)
+    for name in os.listdir(src):
+        source = os.path.join(src, name)
+        target = os.path.join(dest, name)
+        if os.path.isdir(source) and os.path.isdir(target) and not os.path.islink(target):
+            move_tree(source, target)
+            os.rmdir(source)
+            continue
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        os.rename(source, target)
+
+
 class Singleton(type):
     _instances = {}
 
@@ -41,7 +62,7 @@ class Singleton(type):
 
 def convert_utf8(data):
     try:
-        if isinstance(data, basestring):
+        if isinstance(data, string_types):
             return str(data)
         elif isinstance(data, collections.Mapping):
             return dict(map(convert_utf8, data.items()))
@@ -48,6 +48,11 @@ setup(
     include_package_data=True,
     scripts=['bin/k8s-package'],
     install_requires=requirements,
+    extras_require={
+        'zstd': ['zstandard'],
+        'json': ['orjson'],
+        'chunks': ['numpy'],
+    },
     license="Apache License version 2",
     zip_safe=False,
     keywords=['k8spackage'],
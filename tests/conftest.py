@@ -0,0 +1,93 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import threading
+
+import pytest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server answering from 'routes': {(method, path): handler}, the handler gets the
+    request and returns (status, headers, body), the body being bytes or JSON-able.
+    A list of responses is consumed one per request. Requests are recorded in 'requests'.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.routes = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def route(self, method, path, response):
+        self.routes[(method, path)] = response
+
+    def respond(self, request):
+        self.requests.append(request)
+        response = self.routes.get((request.command, request.path.split("?")[0]))
+        if response is None:
+            return 404, {}, {'kind': "Status", 'code': 404}
+        if isinstance(response, list):
+            response = response.pop(0) if len(response) > 1 else response[0]
+        if callable(response):
+            return response(request)
+        return response
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b""
+        status, headers, body = self.server.respond(self)
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers = dict(headers, **{'Content-Type': "application/json"})
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if 'Content-Length' not in headers:  # a larger one simulates a truncated response
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_servers():
+    """ Factory of started StubServers, stub_servers() -> a new server on its own port """
+    servers = []
+
+    def start():
+        server = StubServer()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def stub_server(stub_servers):
+    return stub_servers()
@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from k8spackage.cache import BlobCache
+
+
+def _blob(i, size=100):
+    return (("%d-" % i) * size).encode('utf-8')[0:size]
+
+
+def test_running_size_scans_once(tmpdir, monkeypatch):
+    cache = BlobCache(str(tmpdir), max_size=10000)
+    scans = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries", lambda: scans.append(1) or entries())
+    for i in range(20):
+        cache.put(_blob(i))
+    assert cache.size == 2000
+    assert len(scans) == 1  # under budget: the total is kept without scanning
+    cache.put(_blob(0))  # already cached, replaced
+    assert cache.size == 2000
+    cache.invalidate(hashlib.sha256(_blob(0)).hexdigest())
+    assert cache.size == 1900
+
+
+def test_evict_least_recently_used(tmpdir):
+    cache = BlobCache(str(tmpdir), max_size=1000)
+    digests = []
+    for i in range(10):
+        digests.append(cache.put(_blob(i)))
+        path = cache._blobpath(digests[-1])
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    cache.get(digests[0])  # most recently used now
+    cache.put(_blob(10))
+    # down to 90% of max_size, the oldest blobs first
+    assert cache.size == 900
+    assert digests[0] in cache
+    assert [digest in cache for digest in digests[1:3]] == [False, False]
+    assert sum([entry[1] for entry in cache.entries()]) == 900
+
+
+def test_concurrent_puts(tmpdir):
+    cache = BlobCache(str(tmpdir), max_size=5000)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(cache.put, [_blob(i) for i in range(200)]))
+    assert cache.size == sum([entry[1] for entry in cache.entries()])
+    assert cache.size <= 5000
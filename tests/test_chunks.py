@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function
+
+import gzip
+import io
+import random
+
+import pytest
+
+from k8spackage.chunks import Chunker, ChunkedGzipWriter, ChunkReader, LocalChunkStore
+
+
+def _data(size=400 * 1024):
+    rand = random.Random(42)
+    return bytes(bytearray([rand.randint(0, 255) for _ in range(size)]))
+
+
+def _chunks(chunker, data, write_size):
+    chunks = []
+    for offset in range(0, len(data), write_size):
+        chunks.extend(chunker.update(data[offset:offset + write_size]))
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+@pytest.mark.parametrize("write_size", [1, 511, 10240, 1 << 20])
+def test_vectorized_boundaries(write_size):
+    pytest.importorskip("numpy")
+    data = _data()
+    options = {'min_size': 1024, 'avg_bits': 12, 'max_size': 16 * 1024}
+    expected = _chunks(Chunker(vectorized=False, **options), data, 4096)
+    assert len(expected) > 10
+    assert b"".join(expected) == data
+    assert _chunks(Chunker(vectorized=True, **options), data, write_size) == expected
+
+
+def test_chunked_gzip_roundtrip(tmpdir):
+    data = _data()
+    store = LocalChunkStore(str(tmpdir))
+    output = io.BytesIO()
+    writer = ChunkedGzipWriter(output, store, chunker=Chunker(1024, 12, 16 * 1024))
+    writer.write(data)
+    writer.close()
+    assert len(writer.chunks) > 10
+    reader = ChunkReader(store, writer.chunks)
+    assert reader.read() == output.getvalue()
+    reader.seek(0)
+    assert gzip.GzipFile(fileobj=reader).read() == data
@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import subprocess
+import sys
+
+from k8spackage.commands.cli_pkg import all_commands, get_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys
+sys.argv = ['k8s-package', 'version', '--output', 'json']
+from k8spackage.commands.cli_pkg import cli
+cli()
+heavy = ['k8spackage.models', 'requests', 'yaml']
+sys.stderr.write(",".join([module for module in heavy if module in sys.modules]))
+"""
+
+
+def test_parse_args_not_from_argv(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["k8s-package", "get"])
+    args = get_parser(all_commands()).parse_args(["version"])
+    assert args.which_cmd == "version"
+    assert args.func is not None
+    args = get_parser(all_commands()).parse_args(["publish", "-f", "packages.yaml",
+                                                  "--workers", "2"])
+    assert (args.which_cmd, args.filename, args.workers) == ("publish", "packages.yaml", 2)
+
+
+def test_parse_nested_helm_command(monkeypatch):
+    # restored after the test, the helm parser sets it
+    monkeypatch.setenv("K8SPACKAGE_DEFAULT_MEDIA_TYPE", "-")
+    args = get_parser(all_commands()).parse_args(["helm", "get", "redis", "-n", "charts"])
+    assert (args.which_cmd, args.resource, args.namespace) == ("get", "redis", "charts")
+    assert args.media_type == "helm"
+
+
+def test_version_json_imports(tmpdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, HOME=str(tmpdir))
+    proc = subprocess.Popen([sys.executable, "-c", PROBE], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    assert proc.returncode == 0
+    assert json.loads(out.decode('utf-8'))['client-version']
+    assert err.decode('utf-8') == ""
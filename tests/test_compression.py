@@ -0,0 +1,152 @@
+from __future__ import absolute_import, division, print_function
+
+import gzip
+import hashlib
+import io
+import os
+
+import pytest
+
+from k8spackage.compression import GzipStreamReader, ParallelGzipWriter, get_codec, gzip_member
+from k8spackage.models import PackageCr
+
+CODECS = ["gzip", "xz", "zstd"]
+FILES = {"Chart.yaml": "name: redis\n", "templates/svc.yaml": "kind: Service\n" * 100}
+
+
+def _skip_unavailable(name):
+    if name == "zstd":
+        pytest.importorskip("zstandard")
+    if name == "xz":
+        pytest.importorskip("lzma")
+
+
+def _tree(path):
+    for name, content in FILES.items():
+        filepath = os.path.join(path, name)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, "w") as f:
+            f.write(content)
+
+
+def _read_tree(path):
+    files = {}
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            with open(os.path.join(root, filename)) as f:
+                files[os.path.relpath(os.path.join(root, filename), path)] = f.read()
+    return files
+
+
+def _package(tmpdir, monkeypatch, codec, threads=1):
+    monkeypatch.chdir(str(tmpdir.mkdir("src")))
+    _tree(".")
+    package = PackageCr("redis", "1.0.0", "helm")
+    package.add_blob(".", reproducible=True, codec=codec, threads=threads)
+    return package
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_roundtrip(tmpdir, monkeypatch, name):
+    _skip_unavailable(name)
+    codec = get_codec(name)
+    package = _package(tmpdir, monkeypatch, name)
+    assert package.content['format'] == codec.format
+    loaded = PackageCr.load(package.render())
+    assert loaded.content_codec is codec
+    assert loaded.load_content().blob.startswith(codec.magic)
+    dest = str(tmpdir.join("dest"))
+    loaded.extract(dest, tarball=False)
+    assert _read_tree(dest) == FILES
+    tarball = PackageCr.load(package.render()).extract(str(tmpdir.join("tarball")))
+    assert tarball.endswith(codec.extension)
+    with open(tarball, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == package.content['digest']
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_detect_without_format(tmpdir, monkeypatch, name):
+    # Packages written before content.format was recorded: the codec is detected
+    _skip_unavailable(name)
+    resource = _package(tmpdir, monkeypatch, name).render()
+    del resource['spec']['content']['format']
+    package = PackageCr.load(resource)
+    assert package.content_codec is None
+    assert package.load_content(lazy=True).codec is get_codec(name)
+    dest = str(tmpdir.join("dest"))
+    PackageCr.load(resource).extract(dest, tarball=False)
+    assert _read_tree(dest) == FILES
+
+
+def test_zstd_threads(tmpdir, monkeypatch):
+    _skip_unavailable("zstd")
+    package = _package(tmpdir, monkeypatch, "zstd", threads=2)
+    dest = str(tmpdir.join("dest"))
+    PackageCr.load(package.render()).extract(dest, tarball=False)
+    assert _read_tree(dest) == FILES
+
+
+def _gzip_bytes(data):
+    output = io.BytesIO()
+    writer = get_codec("gzip").writer(output)
+    writer.write(data)
+    writer.close()
+    return output.getvalue()
+
+
+class _Trickle(io.BytesIO):
+    """ at most 'size' bytes per read, the members and the padding span reads """
+
+    def __init__(self, data, size):
+        io.BytesIO.__init__(self, data)
+        self.size = size
+
+    def read(self, size=-1):
+        return io.BytesIO.read(self, self.size)
+
+
+@pytest.mark.parametrize("block_size", [3, 7, 64 * 1024])
+def test_gzip_reader_members_and_padding(block_size):
+    data = b"".join([_gzip_bytes(b"first member\n"), gzip_member(b"second member\n" * 50),
+                     b"\0" * 1000])
+    assert gzip.GzipFile(fileobj=io.BytesIO(data)).read() == (
+        b"first member\n" + b"second member\n" * 50)
+    reader = GzipStreamReader(_Trickle(data, block_size), block_size)
+    assert reader.read() == b"first member\n" + b"second member\n" * 50
+
+
+def test_gzip_reader_data_after_padding():
+    data = _gzip_bytes(b"first\n") + b"\0" * 10 + _gzip_bytes(b"second\n")
+    assert GzipStreamReader(io.BytesIO(data)).read() == b"first\nsecond\n"
+
+
+def test_parallel_gzip_writer():
+    data = os.urandom(1000) * 500
+    output = io.BytesIO()
+    writer = ParallelGzipWriter(output, level=6, threads=3, block_size=64 * 1024)
+    for i in range(0, len(data), 10000):
+        writer.write(data[i:i + 10000])
+    assert writer.tell() == len(data)
+    writer.close()
+    # one member per block, in order
+    assert output.getvalue().count(b"\x1f\x8b\x08\x00\x00\x00\x00\x00") >= 8
+    assert gzip.GzipFile(fileobj=io.BytesIO(output.getvalue())).read() == data
+    assert GzipStreamReader(io.BytesIO(output.getvalue())).read() == data
+
+
+def test_parallel_gzip_package(tmpdir, monkeypatch):
+    # a multi-member tarball reads as a single one, streamed or not
+    monkeypatch.chdir(str(tmpdir.mkdir("src")))
+    _tree(".")
+    files = dict(FILES, **{"data.txt": "".join(["%d\n" % i for i in range(500000)])})
+    with open("data.txt", "w") as f:
+        f.write(files["data.txt"])
+    package = PackageCr("redis", "1.0.0", "helm")
+    package.add_blob(".", reproducible=True, threads=2)
+    loaded = PackageCr.load(package.render())
+    assert loaded.load_content().blob.count(b"\x1f\x8b\x08\x00\x00\x00\x00\x00") > 1
+    assert sorted(loaded.load_content().tar.getnames()) == sorted(files)
+    dest = str(tmpdir.join("dest"))
+    PackageCr.load(package.render()).extract(dest, tarball=False)
+    assert _read_tree(dest) == files
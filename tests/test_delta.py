@@ -0,0 +1,138 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from k8spackage.exception import InvalidDigest, PackageNotFound
+from k8spackage.models import PackageCr
+from k8spackage.pack import K8spackagePackage, pack_kub
+
+BASE_FILES = {
+    "Chart.yaml": "name: redis\nversion: 1.0.0\n",
+    "values.yaml": "replicas: 1\n",
+    "templates/deployment.yaml": "kind: Deployment\n",
+    "templates/old.yaml": "kind: Service\n",
+}
+
+
+def _tree(path, files):
+    for name, content in files.items():
+        filepath = os.path.join(path, name)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, "w") as f:
+            f.write(content)
+
+
+def _files(package):
+    tar = package.load_content(lazy=True).tar
+    return dict([(member.name, tar.extractfile(member).read().decode('utf-8'))
+                 for member in tar.getmembers() if member.isfile()])
+
+
+def _delta_members(package):
+    delta = K8spackagePackage(package.content_source['delta']['blob'], b64_encoded=True,
+                              lazy=True, codec=package.content_codec)
+    return sorted([member.name for member in delta.tar.getmembers() if member.isfile()])
+
+
+def _packages(tmpdir, monkeypatch, reproducible=True):
+    """ base 1.0.0 and its delta 1.0.1: values.yaml changed, old.yaml removed, ingress added """
+    monkeypatch.chdir(str(tmpdir.mkdir("base")))
+    _tree(".", BASE_FILES)
+    base = PackageCr("redis", "1.0.0", "helm")
+    base.add_blob(".", reproducible=reproducible)
+    files = dict(BASE_FILES)
+    del files["templates/old.yaml"]
+    files["values.yaml"] = "replicas: 3\n"
+    files["templates/ingress.yaml"] = "kind: Ingress\n"
+    monkeypatch.chdir(str(tmpdir.mkdir("new")))
+    _tree(".", files)
+    package = PackageCr("redis", "1.0.1", "helm")
+    package.add_delta(base, ".")
+    return base, package, files
+
+
+def test_delta(tmpdir, monkeypatch):
+    base, package, files = _packages(tmpdir, monkeypatch)
+    delta = package.content_source['delta']
+    assert delta['base'] == base.content['digest']
+    assert delta['removed'] == ["templates/old.yaml"]
+    assert _delta_members(package) == ["templates/ingress.yaml", "values.yaml"]
+    assert _files(package) == files
+    # the same bytes as the full reproducible package of the tree
+    full = io.BytesIO()
+    pack_kub("redis.tgz", srcpath=".", fileobj=full, reproducible=True)
+    assert package.content['digest'] == hashlib.sha256(full.getvalue()).hexdigest()
+
+
+def test_delta_non_reproducible_base(tmpdir, monkeypatch):
+    # the base members metadata differ: every file goes in the delta, it still rebuilds
+    base, package, files = _packages(tmpdir, monkeypatch, reproducible=False)
+    assert package.content_source['delta']['removed'] == ["templates/old.yaml"]
+    assert _delta_members(package) == sorted(files)
+    assert _files(package) == files
+
+
+def test_delta_base_found_by_digest(tmpdir, monkeypatch):
+    base, package, files = _packages(tmpdir, monkeypatch)
+    lookups = []
+
+    def find_digest(digest, namespace="default"):
+        lookups.append((digest, namespace))
+        return base
+
+    monkeypatch.setattr(PackageCr, "find_digest", staticmethod(find_digest))
+    loaded = PackageCr.load(package.render())
+    assert _files(loaded) == files
+    assert lookups == [(base.content['digest'], "default")]
+
+
+def test_delta_missing_base(tmpdir, monkeypatch):
+    base, package, files = _packages(tmpdir, monkeypatch)
+    monkeypatch.setattr(PackageCr, "find_digest", staticmethod(lambda digest, namespace: None))
+    loaded = PackageCr.load(package.render())
+    with pytest.raises(PackageNotFound):
+        loaded.load_content()
+
+
+def test_delta_digest_mismatch(tmpdir, monkeypatch):
+    base, package, files = _packages(tmpdir, monkeypatch)
+    # another base content: the rebuilt tarball isn't the recorded one
+    monkeypatch.chdir(str(tmpdir.mkdir("other")))
+    _tree(".", dict(BASE_FILES, **{"Chart.yaml": "name: other\n"}))
+    other = PackageCr("redis", "0.9.0", "helm")
+    other.add_blob(".", reproducible=True)
+    loaded = PackageCr.load(package.render())
+    loaded.delta_base = other
+    with pytest.raises(InvalidDigest):
+        loaded.load_content()
+    with pytest.raises(InvalidDigest):
+        loaded.extract(str(tmpdir.join("dest")), tarball=False)
+    assert not os.listdir(str(tmpdir.join("dest")))
+
+
+def test_delta_symlinks(tmpdir, monkeypatch):
+    # links are compared on their target, they carry no data
+    monkeypatch.chdir(str(tmpdir.mkdir("base")))
+    _tree(".", BASE_FILES)
+    os.symlink("values.yaml", "current.yaml")
+    os.symlink("Chart.yaml", "chart.yaml")
+    base = PackageCr("redis", "1.0.0", "helm")
+    base.add_blob(".", reproducible=True)
+    monkeypatch.chdir(str(tmpdir.mkdir("new")))
+    _tree(".", BASE_FILES)
+    os.symlink("templates/deployment.yaml", "current.yaml")
+    os.symlink("Chart.yaml", "chart.yaml")
+    package = PackageCr("redis", "1.0.1", "helm")
+    package.add_delta(base, ".")
+    delta = K8spackagePackage(package.content_source['delta']['blob'], b64_encoded=True,
+                              lazy=True, codec=package.content_codec)
+    assert [member.name for member in delta.tar.getmembers()] == ["current.yaml"]
+    tar = package.load_content(lazy=True).tar
+    links = dict([(member.name, member.linkname) for member in tar.getmembers()
+                  if member.issym()])
+    assert links == {"current.yaml": "templates/deployment.yaml", "chart.yaml": "Chart.yaml"}
@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import re
+
+import pytest
+import requests
+
+from k8spackage.download import RangeDownloader
+
+CONTENT = bytes(bytearray(range(100)))
+
+
+def _offset(request):
+    match = re.match(r"bytes=(\d+)-", request.headers.get('Range') or "")
+    return int(match.group(1)) if match else 0
+
+
+def _trickle(request):
+    """ 10 bytes at most per response """
+    offset = _offset(request)
+    end = min(offset + 10, len(CONTENT))
+    return 206, {'Content-Range': "bytes %d-%d/%d" % (offset, len(CONTENT) - 1,
+                                                      len(CONTENT))}, CONTENT[offset:end]
+
+
+def test_resume(stub_server):
+    stub_server.route("GET", "/chart.tgz", _trickle)
+    downloader = RangeDownloader(requests.Session(), backoff_factor=0)
+    download = downloader.download(stub_server.url + "/chart.tgz",
+                                   digest=hashlib.sha256(CONTENT).hexdigest())
+    assert download.fileobj.read() == CONTENT
+    assert len(stub_server.requests) == 10
+
+
+def test_resume_total_cap(stub_server):
+    stub_server.route("GET", "/chart.tgz", _trickle)
+    downloader = RangeDownloader(requests.Session(), backoff_factor=0, max_resumes=5)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        downloader.download(stub_server.url + "/chart.tgz")
+    assert len(stub_server.requests) == 6
+
+
+def test_restart_without_progress(stub_server):
+    # Range is ignored and each response is cut after 10 bytes: every resume starts over
+    stub_server.route("GET", "/chart.tgz", (200, {'Content-Range': "bytes 0-99/100"},
+                                            CONTENT[0:10]))
+    downloader = RangeDownloader(requests.Session(), retries=2, backoff_factor=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        downloader.download(stub_server.url + "/chart.tgz")
+    assert len(stub_server.requests) == 4
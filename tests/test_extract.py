@@ -0,0 +1,82 @@
+from __future__ import absolute_import, division, print_function
+
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+
+import pytest
+
+import k8spackage.cache
+import k8spackage.mirrors
+from k8spackage.cache import blob_cache
+from k8spackage.exception import MirrorsUnavailable
+from k8spackage.mirrors import mirror_scoreboard
+from k8spackage.models import PackageCr
+
+
+def _tarball():
+    content = io.BytesIO()
+    with gzip.GzipFile(fileobj=content, mode="wb") as gz:
+        with tarfile.open(fileobj=gz, mode="w") as tar:
+            data = b"name: redis\n"
+            info = tarfile.TarInfo("redis/Chart.yaml")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return content.getvalue()
+
+
+@pytest.fixture
+def package(stub_server, tmpdir, monkeypatch):
+    monkeypatch.setenv("K8SPACKAGE_CACHE_DIR", str(tmpdir.join("cache")))
+    monkeypatch.setattr(k8spackage.cache, "_blob_cache", None)
+    monkeypatch.setattr(k8spackage.mirrors, "_scoreboard", None)
+    blob = _tarball()
+    stub_server.route("GET", "/redis-1.0.0.tgz", (200, {}, blob))
+    package = PackageCr.load({
+        'metadata': {'name': "redis.1.0.0", 'labels': {}, 'annotations': {}},
+        'spec': {'packageName': "redis", 'packageVersion': "1.0.0", 'mediaType': "helm",
+                 'content': {'digest': hashlib.sha256(blob).hexdigest(), 'size': len(blob),
+                             'format': "tar+gzip",
+                             'source': {'urls': [stub_server.url + "/redis-1.0.0.tgz"]}}}
+    })
+    return package
+
+
+def test_extract_corrupted_cache(package, stub_server, tmpdir):
+    digest = package.content['digest']
+    blob_cache().put(b"corrupted", digest)
+    dest = tmpdir.join("dest")
+    package.extract(str(dest), tarball=False)
+    assert dest.join("redis", "Chart.yaml").read() == "name: redis\n"
+    # the entry is replaced by the mirror content, the mirror isn't blamed
+    assert hashlib.sha256(blob_cache().get(digest)).hexdigest() == digest
+    assert mirror_scoreboard().score(stub_server.url) < 30
+    assert os.listdir(str(dest)) == ["redis"]
+
+
+def test_extract_invalid_digest_leaves_nothing(package, tmpdir):
+    package.content['digest'] = "0" * 64
+    dest = tmpdir.join("dest")
+    for tarball in (False, True):
+        with pytest.raises(MirrorsUnavailable):
+            package.extract(str(dest), tarball=tarball)
+        assert os.listdir(str(dest)) == []
+    assert "0" * 64 not in blob_cache()
+
+
+def test_extract_truncated_mirror_fails_over(package, stub_servers, tmpdir):
+    blob = _tarball()
+    truncated = stub_servers()
+    truncated.route("GET", "/redis-1.0.0.tgz",
+                    (200, {'Content-Length': str(len(blob))}, blob[0:len(blob) // 2]))
+    good = package.content_source['urls'][0]
+    package.content_source['urls'] = [truncated.url + "/redis-1.0.0.tgz", good]
+    for tarball in (True, False):
+        dest = tmpdir.join("dest-%s" % tarball)
+        package.extract(str(dest), tarball=tarball)
+        blob_cache().invalidate(package.content['digest'])
+    assert dest.join("redis", "Chart.yaml").read() == "name: redis\n"
+    assert len(truncated.requests) == 1  # penalised: the good mirror comes first afterwards
+    assert mirror_scoreboard().score(truncated.url) > mirror_scoreboard().score(good)
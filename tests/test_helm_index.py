@@ -0,0 +1,180 @@
+from __future__ import absolute_import, division, print_function
+
+import gzip
+import hashlib
+import io
+import tarfile
+import time
+
+import pytest
+import requests
+
+import k8spackage.mirrors
+from k8spackage.exception import InvalidResource, MirrorsUnavailable
+from k8spackage.helm_index import (HelmIndexImporter, HostRateLimiter, RateLimitedSession,
+                                   pooled_session)
+from k8spackage.models import PackageCr
+from k8spackage.records import PackageRecord
+
+DIGEST = "a" * 64
+
+
+def test_pooled_session_adapter():
+    session = pooled_session(pool_size=4, retries=2, backoff_factor=0)
+    adapter = session.get_adapter("https://charts.example.com/")
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 2
+    assert 503 in adapter.max_retries.status_forcelist
+    assert not isinstance(session, RateLimitedSession)
+
+
+def test_pooled_session_retries(stub_server):
+    stub_server.route("GET", "/chart.tgz", [(503, {}, b""), (502, {}, b""), (200, {}, b"data")])
+    session = pooled_session(retries=3, backoff_factor=0)
+    resp = session.get(stub_server.url + "/chart.tgz")
+    assert resp.status_code == 200
+    assert resp.content == b"data"
+    assert len(stub_server.requests) == 3
+
+
+def test_pooled_session_gives_up(stub_server):
+    stub_server.route("GET", "/chart.tgz", [(503, {}, b"")])
+    session = pooled_session(retries=1, backoff_factor=0)
+    with pytest.raises(requests.exceptions.RetryError):
+        session.get(stub_server.url + "/chart.tgz")
+    assert len(stub_server.requests) == 2
+
+
+def test_rate_limiter_per_host():
+    limiter = HostRateLimiter(rate=20)
+    start = time.time()
+    limiter.wait("https://a.example.com/1.tgz")
+    limiter.wait("https://b.example.com/1.tgz")
+    assert time.time() - start < 0.04
+    limiter.wait("https://a.example.com/2.tgz")
+    assert time.time() - start >= 0.045
+
+
+def test_rate_limited_session_uses_requested_host(stub_server):
+    waited = []
+
+    class Limiter(object):
+
+        def wait(self, url):
+            waited.append(url)
+
+    stub_server.route("GET", "/mirror.tgz", (200, {}, b"data"))
+    session = RateLimitedSession(Limiter())
+    session.get(stub_server.url + "/mirror.tgz")
+    assert waited == [stub_server.url + "/mirror.tgz"]
+
+
+class FakePackage(object):
+    kind = "Package"
+    imported = []
+
+    @classmethod
+    def record_from_helm_release(cls, name, release, offline=False, session=None):
+        cls.imported.append((name, release['version']))
+        if release.get('invalid'):
+            raise InvalidResource("invalid")
+        return PackageRecord(name, release['version'], 'helm', release['digest'], 10, "tar+gzip",
+                             {'urls': release['urls']}, "now", chart=release)
+
+
+def _index(versions):
+    return {
+        'entries': {
+            'redis': [{
+                'name': "redis",
+                'version': version,
+                'digest': DIGEST,
+                'urls': ["https://charts.example.com/redis-%s.tgz" % version]
+            } for version in versions]
+        }
+    }
+
+
+def test_import_index_order_and_missed():
+    FakePackage.imported = []
+    index = _index(["1.0.%d" % i for i in range(10)])
+    index['entries']['redis'][3]['invalid'] = True
+    importer = HelmIndexImporter(FakePackage, workers=4)
+    records = importer.import_index(index)
+    assert [record.version for record in records] == [
+        "1.0.%d" % i for i in range(10) if i != 3]
+    assert importer.missed == [("redis", "1.0.3")]
+    assert importer.stats['packages'] == 9
+
+
+def test_import_index_previous():
+    FakePackage.imported = []
+    previous = {
+        'items': [{
+            'metadata': {'name': "redis.1.0.0"},
+            'spec': {
+                'packageName': "redis",
+                'packageVersion': "1.0.0",
+                'mediaType': "helm",
+                'content': {'digest': DIGEST}
+            }
+        }]
+    }
+    importer = HelmIndexImporter(FakePackage)
+    records = importer.import_index(_index(["1.0.0", "1.0.1"]), previous)
+    assert FakePackage.imported == [("redis", "1.0.1")]
+    assert records[0].resource is previous['items'][0]
+    delta = HelmIndexImporter(FakePackage).import_index(_index(["1.0.0", "1.0.1"]), previous,
+                                                        delta=True)
+    assert [record.version for record in delta] == ["1.0.1"]
+
+
+def test_release_digest_mismatch(stub_server, monkeypatch):
+    monkeypatch.setenv("K8SPACKAGE_CACHE", "false")
+    monkeypatch.setattr(k8spackage.mirrors, "_scoreboard", None)
+    blob = b"\x1f\x8b\x08\x00 not really a chart"
+    stub_server.route("GET", "/redis-1.0.0.tgz", (200, {}, blob))
+    release = {'name': "redis", 'version': "1.0.0",
+               'urls': [stub_server.url + "/redis-1.0.0.tgz"]}
+    record = PackageCr.record_from_helm_release(
+        "redis", dict(release, digest=hashlib.sha256(blob).hexdigest()))
+    assert record.digest == hashlib.sha256(blob).hexdigest()
+    package = PackageCr.from_helm_release(
+        "redis", dict(release, digest=hashlib.sha256(blob).hexdigest()))
+    assert package.render()['metadata']['name'] == "redis.1.0.0"
+    assert package.content == record.content
+    with pytest.raises(MirrorsUnavailable):
+        PackageCr.record_from_helm_release("redis", dict(release, digest=DIGEST))
+
+
+def _chart(name, version):
+    content = io.BytesIO()
+    with gzip.GzipFile(fileobj=content, mode="wb") as gz:
+        with tarfile.open(fileobj=gz, mode="w") as tar:
+            data = ("name: %s\nversion: %s\n" % (name, version)).encode('utf-8')
+            info = tarfile.TarInfo("%s/Chart.yaml" % name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return content.getvalue()
+
+
+def test_import_index_bad_release(stub_server, monkeypatch):
+    # an HTML page served instead of a chart is a missed release, the import goes on
+    monkeypatch.setenv("K8SPACKAGE_CACHE", "false")
+    monkeypatch.setattr(k8spackage.mirrors, "_scoreboard", None)
+    blobs = {"1.0.0": _chart("redis", "1.0.0"), "1.0.1": b"<html>Not a chart</html>",
+             "1.0.2": _chart("redis", "1.0.2")}
+    index = {'entries': {'redis': []}}
+    for version, blob in sorted(blobs.items()):
+        path = "/redis-%s.tgz" % version
+        stub_server.route("GET", path, (200, {'Content-Type': "text/html"}, blob))
+        index['entries']['redis'].append({
+            'name': "redis",
+            'version': version,
+            'digest': hashlib.sha256(blob).hexdigest(),
+            'urls': [stub_server.url + path]
+        })
+    importer = HelmIndexImporter(PackageCr, workers=2)
+    records = importer.import_index(index)
+    assert [record.version for record in records] == ["1.0.0", "1.0.2"]
+    assert importer.missed == [("redis", "1.0.1")]
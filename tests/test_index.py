@@ -0,0 +1,121 @@
+from __future__ import absolute_import, division, print_function
+
+import k8spackage.index
+from k8spackage.exception import Unsupported
+from k8spackage.index import PackageIndex
+from k8spackage.models import PackageCr
+
+
+class FakeBackend(object):
+    cluster = "https://k8s.example.com"
+
+    def __init__(self, can_watch=True):
+        self.items = []
+        self.resource_version = "10"
+        self.events = []
+        self.can_watch = can_watch
+        self.lists = 0
+        self.watches = []
+
+    def list_page(self, model, namespace="default", selector=None, limit=500, token=None,
+                  metadata_only=False):
+        self.lists += 1
+        metadata = {'resourceVersion': self.resource_version} if self.can_watch else {}
+        return {'kind': "List", 'metadata': metadata, 'items': list(self.items)}
+
+    def watch(self, model, namespace="default", resource_version=None, selector=None,
+              timeout_seconds=300):
+        if not self.can_watch:
+            raise Unsupported("watch requires the api backend")
+        self.watches.append(resource_version)
+        return iter(self.events)
+
+
+def _item(version, resource_version):
+    return {
+        'metadata': {'name': "redis.%s" % version, 'resourceVersion': resource_version},
+        'spec': {'packageName': "redis", 'packageVersion': version, 'mediaType': "helm",
+                 'content': {'digest': "%s%s" % (version[-1], "d" * 63)}}
+    }
+
+
+def _index(tmpdir, ttl=3600):
+    return PackageIndex(PackageCr, path=str(tmpdir.join("index.json")), ttl=ttl)
+
+
+def test_relist_ttl(tmpdir, monkeypatch):
+    backend = FakeBackend()
+    backend.items = [_item("1.0.0", "1"), _item("1.0.1", "2")]
+    monkeypatch.setattr(k8spackage.index, "get_backend", lambda: backend)
+    index = _index(tmpdir)
+    assert index.find(version="1.0.1") == ["redis.1.0.1"]
+    assert index.find_digest("1d") == "redis.1.0.1"
+    assert backend.lists == 1  # fresh: no refresh until the ttl expires
+
+    kept = index.packages["redis.1.0.0"]
+    backend.items = [_item("1.0.0", "1"), _item("1.0.2", "3")]
+    index.relist()
+    assert sorted(index.packages) == ["redis.1.0.0", "redis.1.0.2"]
+    assert index.packages["redis.1.0.0"] is kept
+
+    reloaded = _index(tmpdir)
+    assert reloaded.find(package_name="redis") == ["redis.1.0.0", "redis.1.0.2"]
+    assert reloaded.resource_version == "10"
+    assert backend.lists == 2
+
+
+def test_refresh_from_resource_version(tmpdir, monkeypatch):
+    backend = FakeBackend()
+    backend.items = [_item("1.0.0", "1"), _item("1.0.1", "2")]
+    monkeypatch.setattr(k8spackage.index, "get_backend", lambda: backend)
+    _index(tmpdir).refresh()
+    backend.events = [
+        {'type': "ADDED", 'object': _item("1.0.2", "11")},
+        {'type': "DELETED", 'object': _item("1.0.0", "12")},
+        {'type': "BOOKMARK", 'object': {'metadata': {'resourceVersion': "13"}}},
+    ]
+    index = _index(tmpdir, ttl=0)
+    assert index.find_digest("2d") == "redis.1.0.2"
+    assert sorted(index.packages) == ["redis.1.0.1", "redis.1.0.2"]
+    assert backend.watches == ["10"]
+    assert backend.lists == 1  # only the first time
+    assert _index(tmpdir).resource_version == "13"
+
+
+def test_refresh_expired(tmpdir, monkeypatch):
+    backend = FakeBackend()
+    backend.items = [_item("1.0.0", "1")]
+    monkeypatch.setattr(k8spackage.index, "get_backend", lambda: backend)
+    index = _index(tmpdir)
+    index.relist()
+    backend.events = [{'type': "ERROR", 'object': {'code': 410, 'message': "too old"}}]
+    backend.items = [_item("1.0.1", "2")]
+    backend.resource_version = "20"
+    index.refresh(force=True)
+    assert sorted(index.packages) == ["redis.1.0.1"]
+    assert index.resource_version == "20"
+    assert backend.lists == 2
+
+
+def test_refresh_without_watch(tmpdir, monkeypatch):
+    backend = FakeBackend(can_watch=False)
+    backend.items = [_item("1.0.0", "1")]
+    monkeypatch.setattr(k8spackage.index, "get_backend", lambda: backend)
+    index = _index(tmpdir)
+    index.relist()
+    index.resource_version = "10"
+    index.refresh(force=True)
+    assert backend.lists == 2
+
+
+def test_find_digest_lists_once(tmpdir, monkeypatch):
+    backend = FakeBackend()
+    backend.items = [_item("1.0.0", "1")]
+    monkeypatch.setattr(k8spackage.index, "get_backend", lambda: backend)
+    monkeypatch.setenv("K8SPACKAGE_INDEX_DIR", str(tmpdir))
+    monkeypatch.setenv("K8SPACKAGE_INDEX_TTL", "0")
+    # stale index, unknown digest: listed by the lookup, not a second time
+    assert PackageCr.find_digest("f") is None
+    assert backend.lists == 1
+    assert PackageCr.find_digest("f") is None
+    assert backend.lists == 1 and backend.watches == ["10"]
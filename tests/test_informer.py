@@ -0,0 +1,87 @@
+from __future__ import absolute_import, division, print_function
+
+import requests
+
+from k8spackage.exception import Unsupported
+from k8spackage.informer import Informer
+from k8spackage.models import PackageCr
+
+
+def _package(version, resource_version):
+    return {
+        'apiVersion': "manifest.k8s.io/v1alpha1",
+        'kind': "Package",
+        'metadata': {'name': "redis.%s" % version, 'resourceVersion': resource_version,
+                     'labels': {}, 'annotations': {}},
+        'spec': {'packageName': "redis", 'packageVersion': version, 'mediaType': "helm",
+                 'content': {'digest': "d" * 64}}
+    }
+
+
+class FakeBackend(object):
+    """ Answers the lists with 'items', the watch with the next entry of 'watches' """
+
+    def __init__(self, items, watches=None):
+        self.items = items
+        self.watches = list(watches or [])
+        self.lists = 0
+
+    def list_page(self, model, namespace="default", selector=None, limit=500, token=None):
+        self.lists += 1
+        return {'kind': "List", 'metadata': {'resourceVersion': "10"}, 'items': list(self.items)}
+
+    def watch(self, model, namespace="default", resource_version=None, selector=None,
+              timeout_seconds=300):
+        raise self.watches.pop(0) if self.watches else Unsupported("no watch")
+
+
+class Informer410(Informer):
+    """ Stops after 'lists' relists, records the delays instead of sleeping """
+
+    def __init__(self, *args, **kwargs):
+        self.max_lists = kwargs.pop('lists')
+        super(Informer410, self).__init__(*args, **kwargs)
+        self.delays = []
+        self._stop.wait = self.delays.append
+
+    def relist(self):
+        super(Informer410, self).relist()
+        if self.backend.lists >= self.max_lists:
+            self._stop.set()
+
+
+def _gone():
+    response = requests.Response()
+    response.status_code = 410
+    return requests.exceptions.HTTPError("410 Gone", response=response)
+
+
+def test_poll_without_watch():
+    backend = FakeBackend([_package("1.0.0", "1")])
+    informer = Informer(PackageCr, poll_period=0.01, resync_period=0, backend=backend)
+    events = []
+    informer.add_handler(on_add=lambda obj: events.append(('add', obj.version)),
+                         on_update=lambda old, new: events.append(('update', new.version)),
+                         on_delete=lambda obj: events.append(('delete', obj.version)))
+    informer.start()
+    try:
+        assert informer.synced.wait(5)
+        backend.items = [_package("1.0.0", "1"), _package("1.0.1", "2")]
+        lists = backend.lists
+        while backend.lists < lists + 2:
+            informer._stop.wait(0.01)
+    finally:
+        informer.stop(5)
+    assert informer.polling
+    assert sorted(informer.store) == ["redis.1.0.0", "redis.1.0.1"]
+    # unchanged objects are not re-delivered by each poll
+    assert events == [('add', "1.0.0"), ('add', "1.0.1")]
+
+
+def test_repeated_410_backoff():
+    backend = FakeBackend([_package("1.0.0", "1")], [_gone() for _ in range(10)])
+    informer = Informer410(PackageCr, resync_period=0, backend=backend, lists=6)
+    informer.run()
+    assert backend.lists == 6
+    assert informer.delays == [1, 2, 4, 8, 16]
+    assert not informer.polling
@@ -0,0 +1,207 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+
+import pytest
+import requests
+
+try:
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from urlparse import parse_qs, urlparse
+
+import k8spackage.kubectl
+import k8spackage.models
+from k8spackage.commands.command_base import CommandBase
+from k8spackage.kubeclient import KubeApiBackend, KubeConfig, KubectlBackend, TABLE_ACCEPT
+from k8spackage.models import PackageCr
+
+PACKAGES = "/apis/manifest.k8s.io/v1alpha1/namespaces/default/packages"
+
+
+def _package(version, blob="aGVsbG8="):
+    return {
+        'apiVersion': "manifest.k8s.io/v1alpha1",
+        'kind': "Package",
+        'metadata': {'name': "redis.%s" % version, 'resourceVersion': version[-1]},
+        'spec': {
+            'packageName': "redis",
+            'packageVersion': version,
+            'mediaType': "helm",
+            'content': {'digest': "d" * 64, 'size': 5, 'source': {'blob': blob}}
+        }
+    }
+
+
+def _query(request):
+    return dict([(key, values[0])
+                 for key, values in parse_qs(urlparse(request.path).query).items()])
+
+
+@pytest.fixture
+def backend(stub_server):
+    return KubeApiBackend(KubeConfig(stub_server.url, token="secret"), session=requests.Session())
+
+
+def test_get(stub_server, backend):
+    stub_server.route("GET", PACKAGES + "/redis.1.0.0", (200, {}, _package("1.0.0")))
+    item = backend.get(PackageCr, "redis.1.0.0")
+    assert item['spec']['packageVersion'] == "1.0.0"
+    assert stub_server.requests[0].headers['Authorization'] == "Bearer secret"
+
+
+def test_get_not_found(stub_server, backend):
+    with pytest.raises(requests.exceptions.HTTPError):
+        backend.get(PackageCr, "redis.9.9.9")
+
+
+def test_list_pages(stub_server, backend):
+
+    def pages(request):
+        query = _query(request)
+        assert query['limit'] == "2"
+        if query.get('continue') == "page-2":
+            return 200, {}, {'kind': "PackageList", 'metadata': {}, 'items': [_package("1.0.2")]}
+        return 200, {}, {
+            'kind': "PackageList",
+            'metadata': {'continue': "page-2"},
+            'items': [_package("1.0.0"), _package("1.0.1")]
+        }
+
+    stub_server.route("GET", PACKAGES, pages)
+    pages = list(backend.list_pages(PackageCr, limit=2))
+    assert [[item['metadata']['name'] for item in page] for page in pages] == [
+        ["redis.1.0.0", "redis.1.0.1"], ["redis.1.0.2"]]
+    assert len(stub_server.requests) == 2
+    assert pages[0][0]['spec']['content']['source']['blob'] == "aGVsbG8="
+
+
+def test_list_pages_metadata_only_table(stub_server, backend):
+
+    def table(request):
+        assert request.headers['Accept'] == TABLE_ACCEPT
+        assert _query(request)['includeObject'] == "Metadata"
+        return 200, {}, {
+            'kind': "Table",
+            'apiVersion': "meta.k8s.io/v1",
+            'metadata': {},
+            'columnDefinitions': [{'name': name} for name in
+                                  ["Name", "App", "Version", "MediaType", "Digest", "Age"]],
+            'rows': [{
+                'cells': ["redis.1.0.0", "redis", "1.0.0", "helm", "d" * 64, "1d"],
+                'object': {'metadata': {'name': "redis.1.0.0", 'resourceVersion': "42"}}
+            }]
+        }
+
+    stub_server.route("GET", PACKAGES, table)
+    items = [item for page in backend.list_pages(PackageCr, metadata_only=True) for item in page]
+    assert items == [{
+        'metadata': {'name': "redis.1.0.0", 'resourceVersion': "42", 'labels': {},
+                     'annotations': {}},
+        'spec': {'packageName': "redis", 'packageVersion': "1.0.0", 'mediaType': "helm",
+                 'content': {'digest': "d" * 64}}
+    }]
+
+
+def test_list_pages_metadata_only_without_table(stub_server, backend):
+    # API servers not supporting Tables answer with the full list: the blobs are dropped
+    stub_server.route("GET", PACKAGES, (200, {}, {'kind': "PackageList", 'metadata': {},
+                                                  'items': [_package("1.0.0")]}))
+    items = list(backend.list_pages(PackageCr, metadata_only=True))[0]
+    assert items[0]['spec']['content']['source'] == {}
+
+
+def test_apply(stub_server, backend):
+    stub_server.route("PATCH", PACKAGES + "/redis.1.0.0",
+                      lambda request: (200, {}, json.loads(request.body.decode('utf-8'))))
+    item = backend.apply(PackageCr, _package("1.0.0"))
+    request = stub_server.requests[0]
+    assert request.headers['Content-Type'] == "application/apply-patch+yaml"
+    assert _query(request) == {'fieldManager': "k8spackage", 'force': "true"}
+    assert item['metadata']['name'] == "redis.1.0.0"
+
+
+def test_list_text_render(stub_server, backend, monkeypatch, capsys):
+    stub_server.route("GET", PACKAGES, (200, {}, {'kind': "PackageList", 'metadata': {},
+                                                  'items': [_package("1.0.0")]}))
+    monkeypatch.setattr(k8spackage.models, "get_backend", lambda: backend)
+
+    class ListCmd(CommandBase):
+
+        def _render_console(self):
+            return PackageCr.list()
+
+    ListCmd(argparse.Namespace(output="text")).render()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["NAME", "APP", "VERSION", "MEDIATYPE", "DIGEST"]
+    assert lines[1].split() == ["redis.1.0.0", "redis", "1.0.0", "helm", "d" * 64]
+
+
+def test_kubeconfig_from_file(tmpdir):
+    kubeconfig = tmpdir.join("config")
+    kubeconfig.write("\n".join([
+        "current-context: test",
+        "contexts: [{name: test, context: {cluster: c, user: u}}]",
+        "clusters: [{name: c, cluster: {server: 'https://k8s.example.com:6443/',"
+        " insecure-skip-tls-verify: true}}]",
+        "users: [{name: u, user: {token: abc}}]",
+    ]))
+    config = KubeConfig.from_file(str(kubeconfig))
+    assert config.server == "https://k8s.example.com:6443"
+    assert config.token == "abc"
+    assert config.verify is False
+
+
+def test_kubectl_list_pages_metadata_only(monkeypatch):
+    calls = []
+
+    def kubectl_list(kind, namespace="default", opts=None):
+        calls.append((kind, namespace, opts))
+        return "\n".join([
+            "NAME          APP     VERSION   MEDIATYPE   DIGEST   RESOURCEVERSION",
+            "redis.1.0.0   redis   1.0.0     helm        %s   42" % ("d" * 64),
+            "redis.1.0.1   redis   1.0.1     helm        <none>   43",
+        ]).encode('utf-8')
+
+    monkeypatch.setattr(k8spackage.kubectl, "list", kubectl_list)
+    items = list(KubectlBackend().list_pages(PackageCr, selector="app=redis", limit=100,
+                                             metadata_only=True))[0]
+    opts = calls[0][2]
+    assert opts[opts.index('-o') + 1] == (
+        "custom-columns=NAME:metadata.name,APP:spec.packageName,VERSION:spec.packageVersion,"
+        "MEDIATYPE:spec.mediaType,DIGEST:spec.content.digest,"
+        "RESOURCEVERSION:metadata.resourceVersion")
+    assert opts[opts.index('-l') + 1] == "app=redis"
+    assert opts[opts.index('--chunk-size') + 1] == "100"
+    assert items[0]['metadata']['resourceVersion'] == "42"
+    assert items[0]['spec']['content']['digest'] == "d" * 64
+    assert items[1]['metadata']['name'] == "redis.1.0.1"
+    assert 'content' not in items[1]['spec']
+
+
+def test_list_pages_metadata_only_without_columns(stub_server, backend):
+    # CRD without the additionalPrinterColumns: the Table can't give the digests
+
+    def listing(request):
+        if request.headers['Accept'] == TABLE_ACCEPT:
+            return 200, {}, {
+                'kind': "Table",
+                'apiVersion': "meta.k8s.io/v1",
+                'metadata': {},
+                'columnDefinitions': [{'name': "Name"}, {'name': "Age"}],
+                'rows': [{'cells': ["redis.1.0.0", "1d"],
+                          'object': {'metadata': {'name': "redis.1.0.0"}}}]
+            }
+        return 200, {}, {'kind': "PackageList", 'metadata': {}, 'items': [_package("1.0.0")]}
+
+    stub_server.route("GET", PACKAGES, listing)
+    for _ in range(2):
+        items = [item for page in backend.list_pages(PackageCr, metadata_only=True)
+                 for item in page]
+        assert items[0]['spec']['content']['digest'] == "d" * 64
+        assert items[0]['spec']['content']['source'] == {}
+    # the Table is asked for once
+    assert [request.headers['Accept'] for request in stub_server.requests] == [
+        TABLE_ACCEPT, "application/json", "application/json"]
+    assert 'includeObject' not in _query(stub_server.requests[1])
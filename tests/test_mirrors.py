@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import time
+
+import pytest
+import requests
+
+from k8spackage.download import RangeDownloader
+from k8spackage.exception import MirrorsUnavailable
+from k8spackage.mirrors import MirrorFetcher, MirrorScoreboard
+
+CONTENT = b"chart content " * 100
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+PATH = "/redis-1.0.0.tgz"
+
+
+def _slow(seconds):
+
+    def respond(request):
+        time.sleep(seconds)
+        return 200, {}, CONTENT
+
+    return respond
+
+
+def _mirror(stub_servers, response):
+    server = stub_servers()
+    server.route("GET", PATH, response)
+    return server
+
+
+def _fetcher(urls, scoreboard, hedge_delay=None):
+    session = requests.Session()
+    return MirrorFetcher([url + PATH for url in urls], DIGEST, session=session,
+                         scoreboard=scoreboard, hedge_delay=hedge_delay,
+                         downloader=RangeDownloader(session, retries=1, backoff_factor=0))
+
+
+def test_fastest_mirror_first(stub_servers):
+    slow = _mirror(stub_servers, _slow(0.2))
+    fast = _mirror(stub_servers, (200, {}, CONTENT))
+    scoreboard = MirrorScoreboard()
+    # without scores, the given order
+    assert _fetcher([slow.url, fast.url], scoreboard).fetch().url == slow.url + PATH
+    _fetcher([fast.url], scoreboard).fetch()
+    assert scoreboard.order([slow.url, fast.url]) == [fast.url, slow.url]
+    download = _fetcher([slow.url, fast.url], scoreboard).fetch()
+    assert download.url == fast.url + PATH
+    assert download.fileobj.read() == CONTENT
+    assert len(slow.requests) == 1
+
+
+def test_failing_mirror(stub_servers):
+    failing = _mirror(stub_servers, (503, {}, b""))
+    good = _mirror(stub_servers, (200, {}, CONTENT))
+    scoreboard = MirrorScoreboard()
+    fetcher = _fetcher([failing.url, good.url], scoreboard)
+    assert fetcher.fetch().url == good.url + PATH
+    assert list(fetcher.errors) == [failing.url + PATH]
+    assert scoreboard.order([failing.url, good.url]) == [good.url, failing.url]
+
+
+def test_truncated_and_corrupted_mirrors(stub_servers):
+    truncated = _mirror(stub_servers, (200, {'Content-Length': str(len(CONTENT))},
+                                       CONTENT[0:100]))
+    corrupted = _mirror(stub_servers, (200, {}, CONTENT[::-1]))
+    good = _mirror(stub_servers, (200, {}, CONTENT))
+    scoreboard = MirrorScoreboard()
+    fetcher = _fetcher([truncated.url, corrupted.url, good.url], scoreboard)
+    assert fetcher.fetch().fileobj.read() == CONTENT
+    assert sorted(fetcher.errors) == sorted([truncated.url + PATH, corrupted.url + PATH])
+    assert scoreboard.order([truncated.url, corrupted.url, good.url])[0] == good.url
+
+
+def test_all_mirrors_fail(stub_servers):
+    failing = _mirror(stub_servers, (404, {}, b""))
+    corrupted = _mirror(stub_servers, (200, {}, b"corrupted"))
+    with pytest.raises(MirrorsUnavailable) as exc:
+        _fetcher([failing.url, corrupted.url], MirrorScoreboard()).fetch()
+    assert sorted(exc.value.payload) == sorted([failing.url + PATH, corrupted.url + PATH])
+
+
+def test_hedged_request_wins(stub_servers):
+    slow = _mirror(stub_servers, _slow(0.6))
+    fast = _mirror(stub_servers, (200, {}, CONTENT))
+    start = time.time()
+    download = _fetcher([slow.url, fast.url], MirrorScoreboard(), hedge_delay=0.05).fetch()
+    assert time.time() - start < 0.4
+    assert download.url == fast.url + PATH
+    assert download.fileobj.read() == CONTENT
+    assert len(slow.requests) == 1
+
+
+def test_hedged_request_failure(stub_servers):
+    # the first mirror fails before the hedge delay: the next one is tried right away
+    failing = _mirror(stub_servers, (500, {}, b""))
+    good = _mirror(stub_servers, (200, {}, CONTENT))
+    start = time.time()
+    download = _fetcher([failing.url, good.url], MirrorScoreboard(), hedge_delay=5).fetch()
+    assert time.time() - start < 1
+    assert download.url == good.url + PATH
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division, print_function
+
+import base64
+import gzip
+import hashlib
+import io
+import os
+import struct
+import tarfile
+
+from k8spackage.pack import IgnoreMatcher, K8spackagePackage, all_files, ignore, pack_kub
+
+
+def _tarball():
+    content = io.BytesIO()
+    with gzip.GzipFile(fileobj=content, mode="wb") as gz:
+        with tarfile.open(fileobj=gz, mode="w") as tar:
+            data = b"name: redis\n"
+            info = tarfile.TarInfo("Chart.yaml")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return content.getvalue()
+
+
+def test_opener_files_are_closed(tmpdir):
+    blob = _tarball()
+    opened = []
+
+    def opener():
+        opened.append(io.BytesIO(blob))
+        return opened[-1]
+
+    package = K8spackagePackage(opener=opener)
+    assert package.manifest == b"name: redis\n"
+    assert package.size == len(blob)
+    assert package.digest == hashlib.sha256(blob).hexdigest()
+    package.pack(str(tmpdir.join("redis.tgz")))
+    assert tmpdir.join("redis.tgz").read_binary() == blob
+    assert package.blob == blob
+    # only the file object of 'tar' stays open
+    assert [fileobj.closed for fileobj in opened] == [False] + [True] * 4
+
+
+def _pack(reproducible=True):
+    output = io.BytesIO()
+    pack_kub("redis.tar.gz", srcpath=".", fileobj=output, reproducible=reproducible)
+    return output.getvalue()
+
+
+def _chart_file(path, content="x\n"):
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _chart(path, mtime):
+    for name, content in [("Chart.yaml", "name: redis\n"), ("templates/svc.yaml", "kind: x\n")]:
+        filepath = os.path.join(path, name)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath, "w") as f:
+            f.write(content)
+        os.utime(filepath, (mtime, mtime))
+
+
+def test_reproducible_pack(tmpdir, monkeypatch):
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    monkeypatch.chdir(str(tmpdir))
+    _chart(".", 1000000000)
+    first = _pack()
+    os.chmod("Chart.yaml", 0o600)
+    _chart(".", 1500000000)
+    assert _pack() == first
+    assert hashlib.sha256(_pack()).hexdigest() == hashlib.sha256(first).hexdigest()
+    # the plain mode keeps the metadata
+    assert _pack(reproducible=False) != first
+    with tarfile.open(fileobj=io.BytesIO(first), mode="r:gz") as tar:
+        members = tar.getmembers()
+    assert [member.name for member in members] == ["Chart.yaml", "templates/svc.yaml"]
+    assert set([(m.mtime, m.uid, m.gid, m.uname, m.mode) for m in members]) == set(
+        [(0, 0, 0, "", 0o644)])
+
+
+def test_reproducible_gzip_header(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    _chart(".", 1000000000)
+    pack_kub("redis.tar.gz", srcpath="templates", reproducible=True)
+    for blob in [_pack(), tmpdir.join("redis.tar.gz").read_binary()]:
+        magic, method, flags, mtime = struct.unpack("<2sBBI", blob[0:8])
+        assert (magic, method) == (b"\x1f\x8b", 8)
+        assert flags == 0  # no file name
+        assert mtime == 0
+
+
+def test_source_date_epoch(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    _chart(".", 1000000000)
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1600000000")
+    blob = _pack()
+    with tarfile.open(fileobj=io.BytesIO(blob), mode="r:gz") as tar:
+        assert set([member.mtime for member in tar.getmembers()]) == set([1600000000])
+    _chart(".", 1200000000)
+    assert _pack() == blob
+    monkeypatch.delenv("SOURCE_DATE_EPOCH")
+    assert _pack() != blob
+
+
+def test_b64_blob_encoded_once():
+    b64blob = base64.b64encode(_tarball()).decode('ascii')
+    package = K8spackagePackage(b64blob, lazy=True)
+    readers = [package._open() for _ in range(3)]
+    assert all([reader.b64data is package._b64blob for reader in readers])
+    assert package.size == len(_tarball())
+    assert package.digest == hashlib.sha256(_tarball()).hexdigest()
+    assert package.files["Chart.yaml"] == b"name: redis\n"
+
+
+def test_ignore_matcher_prunes_directories(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    for path in ["Chart.yaml", "node_modules/lib/index.js", "node_modules/README",
+                 "src/node_modules/x.js", "src/app.js", "build.log", ".git/HEAD"]:
+        _chart_file(path)
+    with open(".helmignore", "w") as f:
+        f.write("node_modules/\n*.log\n")
+    walked = []
+    walk = os.walk
+
+    def recording_walk(top, *args, **kwargs):
+        for root, dirnames, filenames in walk(top, *args, **kwargs):
+            walked.append(root)
+            yield root, dirnames, filenames
+
+    monkeypatch.setattr(os, "walk", recording_walk)
+    assert sorted(all_files(".")) == [".helmignore", "Chart.yaml", "src/app.js"]
+    # never descended into the ignored directories
+    assert not [root for root in walked if "node_modules" in root or ".git" in root]
+
+
+def test_ignore_matcher_same_as_ignore():
+    patterns = ["*.log", "/Chart.lock", "tmp/*", "!keep.log", "docs/**/*.md", "secret?.yaml"]
+    matcher = IgnoreMatcher(patterns)
+    for path in ["a.log", "keep.log", "Chart.lock", "sub/Chart.lock", "tmp/x", "tmp/a/b",
+                 "docs/a/b/c.md", "docs/c.txt", "secret1.yaml", "secret10.yaml", "values.yaml"]:
+        assert bool(matcher.match(path)) == bool(ignore("\n".join(patterns), path)), path
+    # the default patterns apply on top of the given ones
+    assert matcher.match(".git/config")
+    assert matcher.match_dir(".git")
+    assert not matcher.match_dir("templates")
+
+
+def test_all_files_same_as_per_file_ignore(tmpdir, monkeypatch):
+    # plain file patterns: the same files as matching every path against the whole ignore file
+    monkeypatch.chdir(str(tmpdir))
+    for path in ["Chart.yaml", "values.yaml", "a.log", "keep.log", "tmp/x", "sub/tmp/y",
+                 "docs/a/b.md", "docs/c.txt", "templates/svc.yaml", "templates/test.bak"]:
+        _chart_file(path)
+    patterns = "*.log\n!keep.log\n/tmp/*\ndocs/**/*.md\n*.bak\n"
+    with open(".helmignore", "w") as f:
+        f.write(patterns)
+    expected = []
+    for root, _, filenames in os.walk("."):
+        for filename in filenames:
+            path = os.path.join(root, filename).replace("./", "")
+            if not ignore(".git/\n" + patterns, path):
+                expected.append(path)
+    assert sorted(all_files(".")) == sorted(expected)
+    assert "keep.log" in expected and "sub/tmp/y" in expected
@@ -0,0 +1,20 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+
+from k8spackage.commands.publish import PublishCmd
+from k8spackage.models import PackageCr
+
+
+def test_publish_text_render(tmpdir, monkeypatch, capsys):
+    source = tmpdir.join("packages.json")
+    source.write('{"kind": "List", "items": []}')
+    monkeypatch.setattr(PackageCr, "publish", classmethod(lambda cls, *args: [
+        {'name': "redis.1.0.0", 'status': "created", 'seconds': 0.1},
+        {'name': "redis.1.0.1", 'status': "failed", 'seconds': 0.2, 'error': "409 Conflict"},
+    ]))
+    parser = argparse.ArgumentParser()
+    PublishCmd._add_arguments(parser)
+    PublishCmd.call(parser.parse_args(["-f", str(source), "--output", "text"]))
+    assert capsys.readouterr().out.splitlines() == [
+        "redis.1.0.0: created (0.1s)", "redis.1.0.1: failed (0.2s) 409 Conflict"]
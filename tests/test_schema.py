@@ -0,0 +1,49 @@
+from __future__ import absolute_import, division, print_function
+
+from k8spackage.models import DescriptorCr, PackageCr
+from k8spackage.records import PackageRecord
+from k8spackage.schema import compile_validator
+
+
+def _resource(**spec):
+    return {'metadata': {'name': "redis.1.0.0"}, 'spec': spec}
+
+
+def test_schema_errors_path_and_validator():
+    validator = compile_validator({
+        'type': "object",
+        'required': ["name"],
+        'properties': {'size': {'type': "integer", 'minimum': 0}},
+        'additionalProperties': False
+    })
+    errors = []
+    validator({'size': -1, 'extra': 1}, "spec", errors)
+    assert sorted([(error.path, error.validator) for error in errors]) == [
+        ("spec.extra", 'additionalProperties'), ("spec.name", 'required'),
+        ("spec.size", 'minimum')]
+    assert "spec.name: required field is missing" in [str(error) for error in errors]
+
+
+def test_resource_errors_not_empty():
+    errors = PackageCr.resource_errors(_resource(packageName="redis", packageVersion="1.0.0"))
+    # missing: reported once, by the schema
+    assert "spec.mediaType: required field is missing" in errors
+    assert "spec.mediaType: must not be empty" not in errors
+    errors = PackageCr.resource_errors(_resource(packageName="redis", packageVersion="1.0.0",
+                                                 mediaType=""))
+    assert "spec.mediaType: must not be empty" in errors
+    assert "spec.mediaType: required field is missing" not in errors
+
+
+def test_chart_scalars_rendered_as_strings():
+    # unquoted values of a helm index.yaml, loaded as numbers and booleans
+    record = PackageRecord("redis", "1.0.0", 'helm', "d" * 64, 5, "tar+gzip",
+                           {'urls': ["https://charts.example.com/redis-1.0.0.tgz"]}, "now",
+                           chart={'appVersion': 4.0, 'keywords': ["redis", 6, True],
+                                  'description': "Redis"})
+    resource = PackageCr.render_record(record)
+    assert resource['spec']['appVersion'] == "4.0"
+    assert resource['spec']['keywords'] == ["redis", "6", "true"]
+    assert PackageCr.resource_errors(resource) == []
+    descriptor = DescriptorCr.from_chart({'name': "redis", 'appVersion': 7})
+    assert descriptor.render()['spec']['appVersion'] == "7"